@@ -5,8 +5,10 @@ setup(
     version="3.0.1",
     packages=[
         "sumstats.api_v3",
+        "sumstats.api_v3.cli",
         "sumstats.api_v3.core",
         "sumstats.api_v3.db",
+        "sumstats.api_v3.db.repositories",
         "sumstats.api_v3.models",
         "sumstats.api_v3.routes",
         "sumstats.api_v2.cli",
@@ -17,7 +19,10 @@ setup(
         "sumstats.dependencies",
     ],
     entry_points={
-        "console_scripts": ["tsv2hdf = sumstats.api_v2.cli.main:main"]
+        "console_scripts": [
+            "tsv2hdf = sumstats.api_v2.cli.main:main",
+            "eqtl-mongo = sumstats.api_v3.cli.main:main",
+        ]
     },
     url="https://github.com/EBISPOT/SumStats",
     license="",
@@ -0,0 +1,312 @@
+"""
+Conversion of many TSV datasets to HDF5 on a local process pool
+"""
+
+import os
+import json
+import gzip
+import time
+import shutil
+import multiprocessing
+from collections import deque
+from concurrent.futures import (ProcessPoolExecutor,
+                                FIRST_COMPLETED,
+                                wait)
+from concurrent.futures.process import BrokenProcessPool
+
+from sumstats.api_v2.cli.ingest import qtl_sumstats_tsv_to_hdf5, CHUNKSIZE
+from sumstats.api_v2.utils.helpers import get_hdf5_path, disk_bytes
+
+
+DONE_EXT = ".done"
+TSV_SUFFIXES = (".tsv", ".tsv.gz")
+# process memory before any data is read, in MB
+BASE_JOB_MB = 200
+# memory held per MB of TSV text read into a chunk, in MB
+MB_PER_TSV_MB = 10
+# share of the available memory used when no limit is given
+MEMORY_FRACTION = 0.8
+SAMPLE_LINES = 1000
+
+
+def dataset_id(tsv_path: str) -> str:
+    """
+    The file name up to the first dot, as the Nextflow workflow
+    names its datasets.
+    """
+    return os.path.basename(tsv_path).split(".")[0]
+
+
+def jobs_from_dir(tsv_dir: str) -> list:
+    return [(os.path.join(tsv_dir, f), dataset_id(f))
+            for f in sorted(os.listdir(tsv_dir)) if f.endswith(TSV_SUFFIXES)]
+
+
+def jobs_from_manifest(manifest: str) -> list:
+    """
+    A manifest has one TSV path per line, optionally followed by a tab
+    and the dataset id. Relative paths are relative to the manifest.
+    """
+    jobs = []
+    manifest_dir = os.path.dirname(os.path.abspath(manifest))
+    with open(manifest) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            fields = line.split("\t")
+            tsv_path = os.path.join(manifest_dir, fields[0])
+            label = fields[1] if len(fields) > 1 else dataset_id(tsv_path)
+            jobs.append((tsv_path, label))
+    return jobs
+
+
+def estimate_memory_mb(tsv_path: str) -> float:
+    """
+    Peak memory of converting a TSV. Data is read CHUNKSIZE rows at a
+    time, so this grows with the file size up to the size of a chunk.
+    """
+    opener = gzip.open if tsv_path.endswith(".gz") else open
+    with opener(tsv_path, "rb") as f:
+        lines = [line for _, line in zip(range(SAMPLE_LINES), f)]
+    line_bytes = sum(map(len, lines)) / max(1, len(lines))
+    chunk_bytes = CHUNKSIZE * line_bytes
+    if not tsv_path.endswith(".gz"):
+        chunk_bytes = min(chunk_bytes, os.path.getsize(tsv_path))
+    return BASE_JOB_MB + MB_PER_TSV_MB * chunk_bytes / 1024 ** 2
+
+
+def available_memory_mb():
+    try:
+        pages = os.sysconf("SC_AVPHYS_PAGES")
+        page_size = os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+    return pages * page_size / 1024 ** 2
+
+
+def tsv_signature(tsv_path: str) -> dict:
+    stat = os.stat(tsv_path)
+    return {"tsv_bytes": stat.st_size, "tsv_mtime_ns": stat.st_mtime_ns}
+
+
+def is_done(tsv_path: str, hdf5_path: str) -> bool:
+    """
+    Whether the dataset was converted by a previous run, from this
+    version of its TSV.
+    """
+    if not os.path.exists(hdf5_path):
+        return False
+    try:
+        with open(hdf5_path + DONE_EXT) as f:
+            done = json.load(f)
+    except (OSError, ValueError):
+        return False
+    signature = tsv_signature(tsv_path)
+    return all(done.get(k) == v for k, v in signature.items())
+
+
+def convert_dataset(tsv_path: str, hdf5_label: str, sort: bool = True) -> dict:
+    """
+    Converts one TSV and writes its completion marker. Runs in a
+    worker process.
+    """
+    hdf5_path = get_hdf5_path(type="data", label=hdf5_label)
+    # a file left without a marker is from an interrupted conversion,
+    # and appending to it would duplicate rows
+    if os.path.exists(hdf5_path + DONE_EXT):
+        os.remove(hdf5_path + DONE_EXT)
+    if os.path.isdir(hdf5_path):
+        shutil.rmtree(hdf5_path)
+    elif os.path.exists(hdf5_path):
+        os.remove(hdf5_path)
+    started = time.time()
+    rows = qtl_sumstats_tsv_to_hdf5(tsv_path=tsv_path,
+                                    hdf5_label=hdf5_label,
+                                    sort=sort)
+    result = {"label": hdf5_label,
+              "tsv": tsv_path,
+              "rows": rows,
+              "seconds": time.time() - started,
+              "hdf5_bytes": disk_bytes(hdf5_path),
+              **tsv_signature(tsv_path)}
+    marker = hdf5_path + DONE_EXT
+    with open(marker + ".tmp", "w") as f:
+        json.dump(result, f)
+    os.replace(marker + ".tmp", marker)
+    return result
+
+
+class BatchConverter:
+    """
+    Converts datasets on a pool of worker processes.
+
+    At most workers conversions run at once, and only as many as fit
+    in max_memory_mb by their estimated peak memory (one always runs,
+    however large). When the next dataset doesn't fit, a smaller one
+    further down the queue may start instead.
+
+    Datasets with a completion marker for their current TSV are
+    skipped, so a failed or interrupted batch can be run again to
+    resume it.
+
+    A worker dying, e.g. out of memory, breaks the pool and fails all
+    its running conversions. These are run again on a new pool, each
+    on its own, so that only a conversion that breaks the pool when
+    running alone fails.
+    """
+
+    def __init__(self, workers: int = None, max_memory_mb: float = None,
+                 sort: bool = True, force: bool = False):
+        self.workers = workers or os.cpu_count() or 1
+        if max_memory_mb is None:
+            available = available_memory_mb()
+            max_memory_mb = (None if available is None
+                             else available * MEMORY_FRACTION)
+        self.max_memory_mb = max_memory_mb
+        self.sort = sort
+        self.force = force
+
+    def run(self, jobs: list) -> list:
+        """
+        jobs are (tsv_path, hdf5_label) pairs. Returns a result per
+        dataset, with its status: done, skipped or failed.
+        """
+        results = []
+        pending = deque()
+        labels = set()
+        for tsv_path, label in jobs:
+            hdf5_path = get_hdf5_path(type="data", label=label)
+            if label in labels:
+                results.append(self._failed(tsv_path, label, ValueError(
+                    f"Dataset id {label} is used by more than one TSV")))
+            elif not os.path.isfile(tsv_path):
+                results.append(self._failed(tsv_path, label,
+                                            FileNotFoundError(tsv_path)))
+            elif not self.force and is_done(tsv_path, hdf5_path):
+                print(f"{label}: already converted, skipping")
+                results.append({"label": label, "tsv": tsv_path,
+                                "status": "skipped"})
+            else:
+                pending.append((tsv_path, label,
+                                estimate_memory_mb(tsv_path)))
+            labels.add(label)
+        running = {}
+        pools = {}
+        alone = set()
+        pool = self._pool()
+        try:
+            while pending or running:
+                while len(running) < self.workers:
+                    job = self._next_job(pending, running, alone)
+                    if job is None:
+                        break
+                    tsv_path, label, memory_mb = job
+                    print(f"{label}: converting {tsv_path} "
+                          f"(~{memory_mb:.0f} MB)")
+                    future = pool.submit(convert_dataset,
+                                         tsv_path, label, self.sort)
+                    running[future] = job
+                    pools[future] = pool
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    job = running.pop(future)
+                    tsv_path, label, _ = job
+                    future_pool = pools.pop(future)
+                    try:
+                        result = dict(future.result(), status="done")
+                        print(f"{label}: {result['rows']} rows "
+                              f"in {result['seconds']:.1f}s")
+                    except BrokenProcessPool as e:
+                        if future_pool is pool:
+                            pool.shutdown(wait=False)
+                            pool = self._pool()
+                        if label in alone:
+                            result = self._failed(tsv_path, label, e)
+                        else:
+                            # any of the pool's conversions may have
+                            # killed it, so each is retried on its own
+                            print(f"{label}: worker pool broke, "
+                                  f"retrying on its own")
+                            alone.add(label)
+                            pending.appendleft(job)
+                            continue
+                    except Exception as e:
+                        result = self._failed(tsv_path, label, e)
+                    results.append(result)
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+        return results
+
+    def _next_job(self, pending: deque, running: dict, alone: set):
+        """
+        The first pending job fitting in the memory left, if any. Jobs
+        in alone only run with no other job, and no other job runs
+        with them.
+        """
+        if not pending:
+            return None
+        if not running:
+            return pending.popleft()
+        if any(label in alone for _, label, _ in running.values()):
+            return None
+        used = sum(memory_mb for _, _, memory_mb in running.values())
+        for job in pending:
+            if job[1] in alone:
+                continue
+            if (self.max_memory_mb is None or
+                    used + job[2] <= self.max_memory_mb):
+                pending.remove(job)
+                return job
+        return None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        # a fresh interpreter per worker: HDF5 state isn't fork safe
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"))
+
+    @staticmethod
+    def _failed(tsv_path: str, label: str, error: Exception) -> dict:
+        print(f"{label}: failed: {error!r}")
+        return {"label": label, "tsv": tsv_path, "status": "failed",
+                "error": repr(error)}
+
+
+def summarise(results: list, seconds: float) -> dict:
+    """
+    Throughput per converted file and overall.
+    """
+    for result in results:
+        if result["status"] == "done":
+            result["rows_per_second"] = result["rows"] / result["seconds"]
+            result["tsv_mb_per_second"] = (result["tsv_bytes"] / 1024 ** 2
+                                           / result["seconds"])
+    done = [r for r in results if r["status"] == "done"]
+    rows = sum(r["rows"] for r in done)
+    return {
+        "datasets": results,
+        "done": len(done),
+        "skipped": sum(r["status"] == "skipped" for r in results),
+        "failed": sum(r["status"] == "failed" for r in results),
+        "rows": rows,
+        "seconds": seconds,
+        "rows_per_second": rows / seconds if seconds else 0.0,
+    }
+
+
+def print_summary(summary: dict) -> None:
+    print(f"{'dataset':<20} {'status':<8} {'rows':>12} {'TSV MB':>9} "
+          f"{'seconds':>9} {'rows/s':>10} {'MB/s':>7}")
+    for r in summary["datasets"]:
+        if r["status"] == "done":
+            print(f"{r['label']:<20} {r['status']:<8} {r['rows']:>12} "
+                  f"{r['tsv_bytes'] / 1024 ** 2:>9.1f} {r['seconds']:>9.1f} "
+                  f"{r['rows_per_second']:>10.0f} "
+                  f"{r['tsv_mb_per_second']:>7.2f}")
+        else:
+            print(f"{r['label']:<20} {r['status']:<8}")
+    print(f"{summary['done']} converted, {summary['skipped']} skipped, "
+          f"{summary['failed']} failed: {summary['rows']} rows "
+          f"in {summary['seconds']:.1f}s "
+          f"({summary['rows_per_second']:.0f} rows/s)")
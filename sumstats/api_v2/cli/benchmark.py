@@ -0,0 +1,329 @@
+"""
+Benchmark of the v2 HDF5 query patterns on synthetic datasets.
+
+Datasets are written under the configured HDF5_ROOT_DIR, in the
+configured STORAGE_BACKEND, e.g.
+
+HDF5_ROOT_DIR=/scratch/bench python -m sumstats.api_v2.cli.benchmark \
+    --rows 1000000 10000000 --output results.json
+"""
+
+import os
+import sys
+import json
+import time
+import contextlib
+import shutil
+import platform
+import argparse
+import resource
+
+import numpy as np
+import pandas as pd
+import tables as tb
+
+from sumstats.api_v2.cli.ingest import (qtl_sumstats_tsv_to_hdf5,
+                                        tsv_header_map)
+from sumstats.api_v2.schemas.eqtl import (RequestFilters,
+                                          VariantAssociation,
+                                          MAX_GENOMIC_WINDOW)
+from sumstats.api_v2.services.qtl_data import QTLDataService
+from sumstats.api_v2.config import STORAGE_BACKEND
+from sumstats.api_v2.utils.helpers import (get_hdf5_path,
+                                           get_hdf5_dir,
+                                           disk_bytes,
+                                           mkdir)
+
+
+# GRCh38 lengths in Mb, used to spread variants over the genome
+CHROMOSOME_LENGTHS_MB = {
+    "1": 248, "2": 242, "3": 198, "4": 190, "5": 181, "6": 171, "7": 159,
+    "8": 145, "9": 138, "10": 134, "11": 135, "12": 133, "13": 114,
+    "14": 107, "15": 102, "16": 90, "17": 83, "18": 80, "19": 59,
+    "20": 64, "21": 47, "22": 51, "X": 156
+}
+GENE_SPACING = 250_000  # one synthetic gene per window of this size
+GENERATE_CHUNK_ROWS = 1_000_000
+
+
+def generate_tsv(tsv_path: str, n_rows: int, seed: int = 0,
+                 traits_per_variant: int = 4) -> None:
+    """
+    Writes n_rows synthetic associations with the VariantAssociation
+    ingest columns. Each variant is tested against traits_per_variant
+    nearby genes. Rows are written in random order, as chunks in
+    random order each with its rows shuffled, so that ingest has to
+    sort them.
+    """
+    rng = np.random.default_rng(seed)
+    columns = [*tsv_header_map(VariantAssociation)]
+    chunk_variants = max(1, GENERATE_CHUNK_ROWS // traits_per_variant)
+    chunks = [(chromosome, positions[i:i + chunk_variants])
+              for chromosome, positions in _variant_positions(
+                  rng, n_rows // traits_per_variant)
+              for i in range(0, positions.size, chunk_variants)]
+    with open(tsv_path, "w") as tsv:
+        tsv.write("\t".join(columns) + "\n")
+        for i in rng.permutation(len(chunks)):
+            chromosome, positions = chunks[i]
+            chunk = _association_chunk(
+                rng=rng,
+                chromosome=chromosome,
+                positions=positions,
+                traits_per_variant=traits_per_variant)
+            chunk = chunk.iloc[rng.permutation(len(chunk))]
+            chunk[columns].to_csv(tsv, sep="\t", header=False, index=False)
+
+
+def _variant_positions(rng, n_variants: int):
+    """
+    Yields each chromosome with the sorted, unique positions of its
+    share of n_variants.
+    """
+    n_variants = max(1, n_variants)
+    genome_mb = sum(CHROMOSOME_LENGTHS_MB.values())
+    remaining = n_variants
+    for chromosome, length_mb in CHROMOSOME_LENGTHS_MB.items():
+        chr_variants = int(n_variants * length_mb / genome_mb)
+        if chromosome == "X":
+            chr_variants = remaining
+        remaining -= chr_variants
+        # random gaps keep positions unique and sorted
+        mean_gap = length_mb * 1_000_000 // max(1, chr_variants)
+        yield chromosome, np.cumsum(rng.integers(1, 2 * mean_gap,
+                                                 chr_variants))
+
+
+def _association_chunk(rng, chromosome: str, positions: np.ndarray,
+                       traits_per_variant: int) -> pd.DataFrame:
+    n = positions.size * traits_per_variant
+    position = np.repeat(positions, traits_per_variant)
+    gene_bin = (position // GENE_SPACING +
+                np.tile(np.arange(traits_per_variant), positions.size))
+    gene_id = np.char.add(f"ENSG{chromosome.zfill(2)}",
+                          np.char.zfill(gene_bin.astype(str), 9))
+    ref = rng.choice(np.array(list("ACGT")), size=positions.size)
+    alt = rng.choice(np.array(list("ACGT")), size=positions.size)
+    variant = np.char.add(
+        np.char.add(f"chr{chromosome}_", positions.astype(str)),
+        np.char.add(np.char.add("_", ref), np.char.add("_", alt)))
+    pvalue = rng.random(n) ** 4
+    return pd.DataFrame({
+        "variant": np.repeat(variant, traits_per_variant),
+        "rsid": np.repeat(np.char.add("rs", positions.astype(str)),
+                          traits_per_variant),
+        "position": position,
+        "chromosome": chromosome,
+        "ref": np.repeat(ref, traits_per_variant),
+        "alt": np.repeat(alt, traits_per_variant),
+        "type": "SNP",
+        "molecular_trait_id": gene_id,
+        "gene_id": gene_id,
+        "pvalue": pvalue,
+        "ac": rng.integers(1, 600, n),
+        "an": 600,
+        "beta": rng.normal(size=n),
+        "maf": rng.random(n) / 2,
+        "median_tpm": rng.random(n) * 100,
+        "r2": rng.random(n),
+        "se": rng.random(n),
+    })
+
+
+def sample_records(hdf5_label: str, n: int, seed: int) -> pd.DataFrame:
+    """
+    n random records of the sumstats table, to build queries from.
+    """
+    service = QTLDataService(hdf5_label=hdf5_label)
+    nrows = service.nrows(key="sumstats")
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(nrows, size=min(n, nrows), replace=False))
+    return pd.concat(service.select_frame(key="sumstats",
+                                          start=int(row),
+                                          size=1)[0] for row in rows)
+
+
+def query_shapes(record, deep_start: int) -> dict:
+    """
+    The canonical query shapes, as (filters, start, size), around
+    one sampled record.
+    """
+    chromosome, position = record["chromosome"], int(record["position"])
+    region_start = max(1, position - 50_000)
+    window_start = max(1, position - MAX_GENOMIC_WINDOW // 2)
+    window = dict(chromosome=chromosome,
+                  position_start=window_start,
+                  position_end=window_start + MAX_GENOMIC_WINDOW)
+    return {
+        "region": (dict(chromosome=chromosome,
+                        position_start=region_start,
+                        position_end=region_start + 100_000), 0, 20),
+        "variant": (dict(variant=record["variant"]), 0, 20),
+        "rsid": (dict(rsid=record["rsid"]), 0, 20),
+        "gene": (dict(gene_id=record["gene_id"]), 0, 20),
+        "pvalue_cutoff": (dict(window, pvalue=1e-4), 0, 1000),
+        "deep_page": (window, deep_start, 20),
+    }
+
+
+def run_query(hdf5_label: str, filters: dict, start: int = 0,
+              size: int = 20, cursor: str = None) -> tuple:
+    """
+    Returns the number of rows, the next cursor and whether the
+    query failed.
+    """
+    service = QTLDataService(hdf5_label=hdf5_label)
+    try:
+        results_df = service.query(filters=RequestFilters(**filters),
+                                   start=start, size=size, cursor=cursor)
+        return len(results_df), service.next_cursor, False
+    except ValueError as e:
+        if str(e) != "No results":
+            raise
+        # counted as an empty page
+        return 0, None, True
+
+
+def summarise(latencies: list, rows: int, empty: int) -> dict:
+    latencies_ms = np.array(latencies) * 1000
+    total_seconds = float(np.sum(latencies))
+    return {
+        "queries": len(latencies),
+        "empty": empty,
+        "rows": rows,
+        "mean_ms": float(latencies_ms.mean()),
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p90_ms": float(np.percentile(latencies_ms, 90)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+        "max_ms": float(latencies_ms.max()),
+        "rows_per_second": rows / total_seconds if total_seconds else 0.0,
+    }
+
+
+def peak_rss_mb() -> float:
+    """
+    Peak RSS of the process so far, which only ever grows, so it
+    can't be attributed to one query shape.
+    """
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 ** 2 if sys.platform == "darwin" else 1024)
+
+
+def benchmark_queries(hdf5_label: str, n_rows: int, repeat: int,
+                      cursor_pages: int, seed: int) -> dict:
+    genome_bp = sum(CHROMOSOME_LENGTHS_MB.values()) * 1_000_000
+    # start deep pages half way through an average window's matches
+    deep_start = max(0, int(n_rows / genome_bp * MAX_GENOMIC_WINDOW / 2))
+    timings = {}
+
+    def timed(shape, filters, start=0, size=20, cursor=None):
+        began = time.perf_counter()
+        rows, next_cursor, empty = run_query(hdf5_label, filters,
+                                             start=start, size=size,
+                                             cursor=cursor)
+        timing = timings.setdefault(shape, {"latencies": [],
+                                            "rows": 0,
+                                            "empty": 0})
+        timing["latencies"].append(time.perf_counter() - began)
+        timing["rows"] += rows
+        timing["empty"] += empty
+        return next_cursor
+
+    records = sample_records(hdf5_label, n=repeat, seed=seed)
+    for record in records.to_dict("records"):
+        shapes = query_shapes(record, deep_start)
+        for shape, (filters, start, size) in shapes.items():
+            timed(shape, filters, start=start, size=size)
+        # follow the cursor through the window, one page at a time
+        cursor = None
+        for _ in range(cursor_pages):
+            cursor = timed("cursor_page", shapes["deep_page"][0],
+                           size=1000, cursor=cursor)
+            if cursor is None:
+                break
+    return {shape: summarise(**timing) for shape, timing in timings.items()}
+
+
+def benchmark_dataset(n_rows: int, args) -> dict:
+    hdf5_label = f"BENCH{n_rows}"
+    hdf5_path = get_hdf5_path(type="data", label=hdf5_label)
+    tsv_path = os.path.join(args.work_dir, hdf5_label + ".tsv")
+    result = {"rows": n_rows, "label": hdf5_label}
+    if not (args.reuse and os.path.exists(hdf5_path)):
+        began = time.perf_counter()
+        generate_tsv(tsv_path, n_rows=n_rows, seed=args.seed)
+        result["generate_seconds"] = time.perf_counter() - began
+        if os.path.exists(hdf5_path):
+            if os.path.isdir(hdf5_path):
+                shutil.rmtree(hdf5_path)
+            else:
+                os.remove(hdf5_path)
+        began = time.perf_counter()
+        qtl_sumstats_tsv_to_hdf5(tsv_path=tsv_path, hdf5_label=hdf5_label)
+        result["ingest_seconds"] = time.perf_counter() - began
+        result["ingest_peak_rss_mb"] = peak_rss_mb()
+        if not args.keep_tsv:
+            os.remove(tsv_path)
+    result["file_bytes"] = disk_bytes(hdf5_path)
+    result["queries"] = benchmark_queries(hdf5_label=hdf5_label,
+                                          n_rows=n_rows,
+                                          repeat=args.repeat,
+                                          cursor_pages=args.cursor_pages,
+                                          seed=args.seed)
+    return result
+
+
+def environment() -> dict:
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "pandas": pd.__version__,
+        "tables": tb.__version__,
+        "numpy": np.__version__,
+        "storage_backend": STORAGE_BACKEND,
+        "hdf5_dir": os.path.abspath(get_hdf5_dir(type="data")),
+    }
+
+
+def get_args():
+    argparser = argparse.ArgumentParser(
+        description="Benchmark v2 HDF5 queries on synthetic datasets")
+    argparser.add_argument('--rows', type=int, nargs='+',
+                           default=[1_000_000, 10_000_000, 50_000_000],
+                           help='dataset sizes, in rows')
+    argparser.add_argument('--repeat', type=int, default=50,
+                           help='queries per shape')
+    argparser.add_argument('--cursor-pages', type=int, default=20,
+                           help='pages followed by cursor per sampled record')
+    argparser.add_argument('--seed', type=int, default=0)
+    argparser.add_argument('--work-dir', default='.',
+                           help='directory for the generated TSVs')
+    argparser.add_argument('--reuse', action='store_true',
+                           help='reuse existing benchmark HDF5 files')
+    argparser.add_argument('--keep-tsv', action='store_true',
+                           help='keep the generated TSVs')
+    argparser.add_argument('--output', default=None,
+                           help='JSON output path (default: stdout)')
+    return argparser.parse_args()
+
+
+def main():
+    args = get_args()
+    mkdir(args.work_dir)
+    # ingest prints its progress, which would break the JSON on stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        results = {"environment": environment(),
+                   "datasets": [benchmark_dataset(n, args)
+                                for n in args.rows]}
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
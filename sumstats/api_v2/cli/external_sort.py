@@ -0,0 +1,150 @@
+"""
+External merge sort of DataFrame chunks, for tables larger than memory
+"""
+
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from sumstats.api_v2.utils.helpers import chromosome_sort_key, mkdir
+
+
+CHROMOSOME_KEY = "_chromosome_key"
+ROW_KEY = "_row"
+
+
+class ExternalSort:
+    """
+    Sorts a stream of DataFrame chunks by the columns in by, in bounded
+    memory.
+
+    Each chunk added is sorted and written as a run to a scratch HDF5
+    file. sorted_chunks then merges the runs, reading each of them
+    buffer_rows / (number of runs) rows at a time, so at most about
+    buffer_rows rows are held at once on top of the chunk being emitted.
+
+    A chromosome column in by is sorted in natural order (see
+    chromosome_sort_key), not lexically. The sort is stable: the
+    running row number breaks ties, so rows with equal keys keep the
+    order they were added in.
+    """
+
+    def __init__(self, by: list, scratch_dir: str, buffer_rows: int):
+        self.by = by
+        self.buffer_rows = buffer_rows
+        self.sort_columns = [CHROMOSOME_KEY if col == "chromosome" else col
+                             for col in by] + [ROW_KEY]
+        mkdir(scratch_dir)
+        fd, self.scratch_path = tempfile.mkstemp(suffix=".sort.h5",
+                                                 dir=scratch_dir)
+        os.close(fd)
+        self.store = pd.HDFStore(self.scratch_path, mode="w")
+        self.runs = []
+        self.rows_added = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, df: pd.DataFrame) -> None:
+        """
+        Sorts df and writes it as a run.
+        """
+        if len(df) == 0:
+            return
+        df = df.assign(**{ROW_KEY: np.arange(self.rows_added,
+                                             self.rows_added + len(df))})
+        if "chromosome" in self.by:
+            keys = {c: chromosome_sort_key(c)
+                    for c in df["chromosome"].unique()}
+            df = df.assign(**{CHROMOSOME_KEY: df["chromosome"].map(keys)})
+        df = df.sort_values(self.sort_columns, kind="stable")
+        run = f"run{len(self.runs)}"
+        self.store.put(run, df.reset_index(drop=True), format="table")
+        self.runs.append((run, len(df)))
+        self.rows_added += len(df)
+
+    def sorted_chunks(self):
+        """
+        Yields the rows of all the runs in sorted order, as chunks.
+        """
+        block_rows = max(1, self.buffer_rows // max(1, len(self.runs)))
+        read_to = [0] * len(self.runs)
+        buffers = [None] * len(self.runs)
+        while True:
+            for i, (run, nrows) in enumerate(self.runs):
+                if (buffers[i] is None or len(buffers[i]) == 0) \
+                        and read_to[i] < nrows:
+                    buffers[i] = self.store.select(
+                        run, start=read_to[i], stop=read_to[i] + block_rows)
+                    read_to[i] += len(buffers[i])
+            if all(b is None or len(b) == 0 for b in buffers):
+                return
+            # rows up to the smallest last key of the runs with rows
+            # still on disk can't be preceded by any row not yet read
+            boundary = min((self._row_key(b, -1)
+                            for i, b in enumerate(buffers)
+                            if read_to[i] < self.runs[i][1]),
+                           key=self._comparable, default=None)
+            taken = []
+            for i, buffer in enumerate(buffers):
+                if buffer is None or len(buffer) == 0:
+                    continue
+                if boundary is None:
+                    taken.append(buffer)
+                    buffers[i] = None
+                    continue
+                mask = self._at_or_before(buffer, boundary)
+                taken.append(buffer[mask])
+                buffers[i] = buffer[~mask]
+            chunk = pd.concat(taken).sort_values(self.sort_columns,
+                                                 kind="stable")
+            # indexed by the input row number, as an unsorted read is
+            chunk.index = chunk[ROW_KEY].to_numpy()
+            yield chunk.drop(columns=[CHROMOSOME_KEY, ROW_KEY],
+                             errors="ignore")
+
+    def close(self) -> None:
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+        if os.path.exists(self.scratch_path):
+            os.remove(self.scratch_path)
+
+    def _row_key(self, df: pd.DataFrame, row: int) -> tuple:
+        return tuple(df[col].iat[row] for col in self.sort_columns)
+
+    @staticmethod
+    def _comparable(key: tuple) -> tuple:
+        """
+        key with missing values, which sort last, made comparable.
+        """
+        return tuple((True, 0) if pd.isna(value) else (False, value)
+                     for value in key)
+
+    def _at_or_before(self, df: pd.DataFrame, key: tuple) -> np.ndarray:
+        """
+        Mask of the rows of df whose sort key is <= key. Missing values
+        sort after all others, as in sort_values, and are only compared
+        with each other.
+        """
+        before = np.zeros(len(df), dtype=bool)
+        equal = np.ones(len(df), dtype=bool)
+        for col, value in zip(self.sort_columns, key):
+            missing = df[col].isna().to_numpy()
+            if pd.isna(value):
+                before |= equal & ~missing
+                equal &= missing
+                continue
+            values = df[col].to_numpy()[~missing]
+            less = np.zeros(len(df), dtype=bool)
+            same = np.zeros(len(df), dtype=bool)
+            less[~missing] = values < value
+            same[~missing] = values == value
+            before |= equal & less
+            equal &= same
+        return before | equal
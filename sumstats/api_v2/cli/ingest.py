@@ -1,5 +1,7 @@
+import numpy as np
 import pandas as pd
 
+from sumstats.api_v2.cli.external_sort import ExternalSort
 from sumstats.api_v2.services.qtl_meta import QTLMetadataService
 from sumstats.api_v2.services.qtl_data import QTLDataService
 from sumstats.api_v2.schemas.eqtl import (QTLMetadata,
@@ -12,6 +14,8 @@ from sumstats.api_v2.utils.helpers import (properties_from_model,
 
 
 LONG_STRING_PLACEHOLDER = "LONG_STRING"
+CHUNKSIZE = 1000000
+SUMSTATS_SORT_ORDER = ["chromosome", "position", "molecular_trait_id"]
 
 
 class TSV2HDF5:
@@ -30,6 +34,7 @@ class TSV2HDF5:
         self.service = service
         self.model = model
         self.hdf_interface = service(self.hdf5_label)
+        self.rows_written = 0
 
     def tsv_to_df(self, **kwargs) -> pd.DataFrame:
         return pd.read_table(self.tsv_path,
@@ -39,7 +44,17 @@ class TSV2HDF5:
                              float_precision='high',
                              **kwargs)
 
+    def select_columns(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        The usecols of df, in TSV order as tsv_to_df would read them.
+        """
+        return df[[col for col in df.columns if col in self.usecols]]
+
     def df_to_hdf5(self, df: pd.DataFrame, **kwargs):
+        """
+        Appends df without indexing it. Call build_indexes once all
+        the data has been appended.
+        """
         self.hdf_interface.create(data=df,
                                   key=self.key,
                                   complib='lzo',
@@ -48,9 +63,25 @@ class TSV2HDF5:
                                   data_columns=[*self._searchable_fields()],
                                   min_itemsize=self._field_size(),
                                   index=False)
+        self.rows_written += len(df)
+
+    def build_indexes(self):
+        """
+        Builds the indexes of the table in one go, rather than
+        rebuilding them after every appended chunk.
+        """
+        if self.rows_written == 0:
+            return
+        print(f"indexing {self.rows_written} rows of {self.key}")
         self.hdf_interface.reindex(index_fields=[*self._searchable_fields()],
                                    cs_index=self._cs_index(),
-                                   key=self.key)
+                                   key=self.key,
+                                   progress=print)
+
+    def record_sort_order(self, sort_order: list):
+        if self.rows_written > 0:
+            self.hdf_interface.set_sort_order(key=self.key,
+                                              sort_order=sort_order)
 
     def replace_value_if_too_long(self, df: pd.DataFrame) -> pd.DataFrame:
         for field, len_limit in self._field_size().items():
@@ -61,7 +92,7 @@ class TSV2HDF5:
     @staticmethod
     def _placeholder_if_string_too_long(df, field, len_limit):
         mask = df[field].str.len() <= len_limit
-        df[field].where(mask, LONG_STRING_PLACEHOLDER, inplace=True)
+        df[field] = df[field].where(mask, LONG_STRING_PLACEHOLDER)
 
     def _dtype(self) -> dict:
         return pandas_dtype_from_model(self.model)
@@ -105,9 +136,10 @@ def qtl_metadata_tsv_to_hdf5(tsv_path, hdf5_label) -> None:
     df = t2h.tsv_to_df()
     t2h.replace_value_if_too_long(df=df)
     t2h.df_to_hdf5(df=df)
+    t2h.build_indexes()
 
 
-def qtl_sumstats_tsv_to_hdf5(tsv_path, hdf5_label) -> None:
+def qtl_sumstats_tsv_to_hdf5(tsv_path, hdf5_label, sort=True) -> int:
     """
     data/
       QTD0001.h5
@@ -124,57 +156,122 @@ def qtl_sumstats_tsv_to_hdf5(tsv_path, hdf5_label) -> None:
             - cs: rsid (int) -> chr: pos
 
          ...
+
+    All three tables are written in a single pass over the TSV. The
+    genomic context and rsid maps are de-duplicated incrementally,
+    keeping the first occurrence of each key. The tables are indexed
+    once everything has been appended.
+
+    With sort, the sumstats rows are written in SUMSTATS_SORT_ORDER
+    (chromosomes in natural order), using an external merge sort that
+    holds about CHUNKSIZE rows at once. The order is recorded in the
+    table attributes, so that region queries read a contiguous block.
+    The genomic context and rsid maps still keep the first occurrence
+    in TSV order.
+
+    Returns the number of sumstats rows written.
     """
-    print('loading sumstats')
-    t2h = TSV2HDF5(tsv_path=tsv_path,
-                   hdf5_label=hdf5_label,
-                   key="sumstats",
-                   usecols=[*tsv_header_map(VariantAssociation)],
-                   service=QTLDataService,
-                   model=VariantAssociation)
-    df_iter = t2h.tsv_to_df(chunksize=1000000)
-    for df in df_iter:
-        t2h.replace_value_if_too_long(df=df)
-        t2h.df_to_hdf5(df=df)
-    print('sumstats loaded')
-    trait_and_gene_to_hdf5(tsv_path=tsv_path,
-                           hdf5_label=hdf5_label)
-    rsid_map_to_hdf5(tsv_path=tsv_path,
-                     hdf5_label=hdf5_label)
-
-
-def trait_and_gene_to_hdf5(tsv_path, hdf5_label) -> None:
-    print('loading gc')
-    t2h = TSV2HDF5(tsv_path=tsv_path,
-                   hdf5_label=hdf5_label,
-                   key="genomic_context",
-                   usecols=[*tsv_header_map(GenomicContextIngest)],
-                   service=QTLDataService,
-                   model=GenomicContextIngest)
-    df = t2h.tsv_to_df()
-    genomic_context_fields_to_group_on = properties_from_model(GenomicContext, "searchable")
-    df.drop_duplicates(subset=[*genomic_context_fields_to_group_on])
-    t2h.replace_value_if_too_long(df=df)
-    t2h.df_to_hdf5(df=df)
-    print('loaded gc')
+    sumstats = TSV2HDF5(tsv_path=tsv_path,
+                        hdf5_label=hdf5_label,
+                        key="sumstats",
+                        usecols=[*tsv_header_map(VariantAssociation)],
+                        service=QTLDataService,
+                        model=VariantAssociation)
+    genomic_context = TSV2HDF5(tsv_path=tsv_path,
+                               hdf5_label=hdf5_label,
+                               key="genomic_context",
+                               usecols=[*tsv_header_map(GenomicContextIngest)],
+                               service=QTLDataService,
+                               model=GenomicContextIngest)
+    rsid_map = TSV2HDF5(tsv_path=tsv_path,
+                        hdf5_label=hdf5_label,
+                        key="rsid",
+                        usecols=[*tsv_header_map(RsIdMapper)],
+                        service=QTLDataService,
+                        model=RsIdMapper)
+    sorter = None
+    if sort:
+        sorter = ExternalSort(by=SUMSTATS_SORT_ORDER,
+                              scratch_dir=sumstats.hdf_interface.par_dir,
+                              buffer_rows=CHUNKSIZE)
+    try:
+        load_tsv(sumstats=sumstats,
+                 genomic_context=genomic_context,
+                 rsid_map=rsid_map,
+                 sorter=sorter)
+        if sorter is not None:
+            print('writing sorted sumstats')
+            for df in sorter.sorted_chunks():
+                sumstats.df_to_hdf5(df=df)
+            sumstats.record_sort_order(SUMSTATS_SORT_ORDER)
+            print(f"sumstats sorted by {', '.join(SUMSTATS_SORT_ORDER)}")
+    finally:
+        if sorter is not None:
+            sorter.close()
+    for t2h in (sumstats, genomic_context, rsid_map):
+        t2h.build_indexes()
+    print('indexes built')
+    return sumstats.rows_written
 
 
-def rsid_map_to_hdf5(tsv_path, hdf5_label) -> None:
-    print('loading rs')
-    t2h = TSV2HDF5(tsv_path=tsv_path,
-                   hdf5_label=hdf5_label,
-                   key="rsid",
-                   usecols=[*tsv_header_map(RsIdMapper)],
-                   service=QTLDataService,
-                   model=RsIdMapper)
-    df = t2h.tsv_to_df()
-    print("Removing rs prefix")
-    df['rsid'] = df['rsid'].str.replace('rs', '', regex=False)
-    print("Dropping rsid duplicates")
+def load_tsv(sumstats: TSV2HDF5, genomic_context: TSV2HDF5,
+             rsid_map: TSV2HDF5, sorter: ExternalSort = None) -> None:
+    """
+    Feeds the TSV chunks to the three tables. With a sorter, the
+    sumstats chunks go to it rather than to the file.
+    """
+    seen_contexts = set()
+    seen_rsids = np.array([], dtype="int64")
+    print('loading sumstats, genomic context and rsids')
+    for df in sumstats.tsv_to_df(chunksize=CHUNKSIZE):
+        gc_df = new_genomic_contexts(df=genomic_context.select_columns(df),
+                                     seen=seen_contexts)
+        rs_df, seen_rsids = new_rsids(df=rsid_map.select_columns(df),
+                                      seen=seen_rsids)
+        sumstats.replace_value_if_too_long(df=df)
+        if sorter is not None:
+            sorter.add(df)
+        else:
+            sumstats.df_to_hdf5(df=df)
+        if len(gc_df) > 0:
+            genomic_context.replace_value_if_too_long(df=gc_df)
+            genomic_context.df_to_hdf5(df=gc_df)
+        if len(rs_df) > 0:
+            rsid_map.df_to_hdf5(df=rs_df)
+        print(f"loaded {len(df)} rows, {len(gc_df)} new genomic contexts, "
+              f"{len(rs_df)} new rsids")
+    print('sumstats, genomic context and rsids loaded')
+
+
+def new_genomic_contexts(df: pd.DataFrame, seen: set) -> pd.DataFrame:
+    """
+    Rows of df with a (molecular_trait_id, gene_id) not in seen,
+    first occurrence only. Adds their keys to seen.
+    """
+    fields = [*properties_from_model(GenomicContext, "searchable")]
+    df = df.drop_duplicates(subset=fields)
+    keys = list(zip(*(df[field] for field in fields)))
+    is_new = np.array([key not in seen for key in keys], dtype=bool)
+    seen.update(key for key, new in zip(keys, is_new) if new)
+    return df[is_new].copy()
+
+
+def new_rsids(df: pd.DataFrame, seen: np.ndarray) -> tuple:
+    """
+    Rows of df with an rsid (as int, without the rs prefix) not in
+    seen, first occurrence only. seen is a sorted array; returns it
+    updated with the new rsids.
+    """
+    df = df.assign(rsid=df['rsid'].str.replace('rs', '', regex=False))
     df = df.dropna(subset=['rsid']).drop_duplicates(subset=['rsid'])
-    print("Converting rsids to int")
     df['rsid'] = df['rsid'].astype("int64")
-    print("Writing to file")
-    t2h.df_to_hdf5(df=df)
-    print('loaded rs')
+    rsids = df['rsid'].to_numpy()
+    df = df[~_in_sorted(rsids, seen)]
+    return df, np.union1d(seen, df['rsid'].to_numpy())
+
 
+def _in_sorted(values: np.ndarray, sorted_values: np.ndarray) -> np.ndarray:
+    positions = np.searchsorted(sorted_values, values)
+    found = positions < sorted_values.size
+    found[found] = sorted_values[positions[found]] == values[found]
+    return found
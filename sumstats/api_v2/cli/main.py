@@ -1,11 +1,20 @@
+import sys
+import time
+import json
 import argparse
 
 from sumstats.api_v2.cli.ingest import (qtl_metadata_tsv_to_hdf5,
                                         qtl_sumstats_tsv_to_hdf5)
+from sumstats.api_v2.cli.batch import (BatchConverter,
+                                       jobs_from_dir,
+                                       jobs_from_manifest,
+                                       summarise,
+                                       print_summary)
 
 
 def get_args():
-    argparser = argparse.ArgumentParser()
+    argparser = argparse.ArgumentParser(
+        epilog='run "tsv2hdf batch --help" to convert many datasets')
     argparser.add_argument('-t',
                            help='tsv path',
                            required=True)
@@ -16,17 +25,78 @@ def get_args():
                            help='specify whether it is data or metadata',
                            choices=['data', 'metadata'],
                            required=True)
+    argparser.add_argument('-unsorted',
+                           help='keep the TSV row order rather than sorting '
+                                'the data by chromosome and position',
+                           action='store_true')
     args = argparser.parse_args()
     return args
 
 
+def get_batch_args(argv):
+    argparser = argparse.ArgumentParser(
+        prog='tsv2hdf batch',
+        description='Convert many data TSVs on a local process pool. '
+                    'Converted datasets get a .done marker next to their '
+                    'HDF5 file and are skipped when the batch is rerun.')
+    source = argparser.add_mutually_exclusive_group(required=True)
+    source.add_argument('-tsv-dir',
+                        help='directory of *.tsv* files, the dataset id '
+                             'being the file name up to the first dot')
+    source.add_argument('-manifest',
+                        help='file of TSV paths, one per line, each '
+                             'optionally followed by a tab and the dataset id')
+    argparser.add_argument('-workers', type=int, default=None,
+                           help='conversions run at once (default: CPUs)')
+    argparser.add_argument('-max-memory', type=float, default=None,
+                           help='GB of memory that running conversions may '
+                                'use, by their estimated peak (default: 80%% '
+                                'of the available memory)')
+    argparser.add_argument('-unsorted',
+                           help='keep the TSV row order rather than sorting '
+                                'the data by chromosome and position',
+                           action='store_true')
+    argparser.add_argument('-force',
+                           help='convert datasets already marked as done',
+                           action='store_true')
+    argparser.add_argument('-summary',
+                           help='write the throughput summary to this '
+                                'JSON file')
+    return argparser.parse_args(argv)
+
+
+def batch(argv):
+    args = get_batch_args(argv)
+    jobs = (jobs_from_dir(args.tsv_dir) if args.tsv_dir
+            else jobs_from_manifest(args.manifest))
+    max_memory_mb = None if args.max_memory is None else args.max_memory * 1024
+    converter = BatchConverter(workers=args.workers,
+                               max_memory_mb=max_memory_mb,
+                               sort=not args.unsorted,
+                               force=args.force)
+    started = time.time()
+    results = converter.run(jobs)
+    summary = summarise(results, seconds=time.time() - started)
+    print_summary(summary)
+    if args.summary:
+        with open(args.summary, 'w') as f:
+            json.dump(summary, f, indent=2)
+    if summary['failed']:
+        sys.exit(1)
+
+
 def main():
+    if sys.argv[1:2] == ['batch']:
+        batch(sys.argv[2:])
+        return
     args = get_args()
     if args.type == 'data':
-        qtl_sumstats_tsv_to_hdf5(tsv_path=args.t, hdf5_label=args.hdf)
+        qtl_sumstats_tsv_to_hdf5(tsv_path=args.t,
+                                 hdf5_label=args.hdf,
+                                 sort=not args.unsorted)
     if args.type == 'metadata':
         qtl_metadata_tsv_to_hdf5(tsv_path=args.t, hdf5_label=args.hdf)
 
  
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -9,6 +9,9 @@ HDF5_ROOT_DIR/
 - - dataset2.h5
 - HDF5_METADATA_DIR/
 - - HDF5_QTL_METADATA.h5
+
+With the parquet STORAGE_BACKEND, each .h5 file is instead a
+directory (e.g. dataset1.parquet/) with one Parquet file per table.
 """
 
 
@@ -22,6 +25,37 @@ HDF5_DATA_DIR = _get_env_var("HDF5_DATA_DIR", "data")
 HDF5_METADATA_DIR = _get_env_var("HDF5_METADATA_DIR", "metadata")
 HDF5_QTL_METADATA_LABEL = _get_env_var("HDF5_QTL_METADATA_LABEL", "qtl_metadata")
 HDF5_EXT = _get_env_var("HDF5_EXT", ".h5")
+# how datasets are stored: "hdf5" files or "parquet" directories
+STORAGE_BACKEND = _get_env_var("STORAGE_BACKEND", "hdf5")
+PARQUET_EXT = _get_env_var("PARQUET_EXT", ".parquet")
+DATASET_EXT = PARQUET_EXT if STORAGE_BACKEND == "parquet" else HDF5_EXT
+# rows per Parquet row group, the unit of predicate pushdown
+PARQUET_ROW_GROUP_ROWS = int(_get_env_var("PARQUET_ROW_GROUP_ROWS", 16384))
+PARQUET_COMPRESSION = _get_env_var("PARQUET_COMPRESSION", "zstd")
+# open read-only handles kept by the API process
+HDF5_HANDLE_POOL_SIZE = int(_get_env_var("HDF5_HANDLE_POOL_SIZE", 64))
+# max share of the process file descriptor limit used by the pool
+HDF5_HANDLE_POOL_FD_FRACTION = float(
+    _get_env_var("HDF5_HANDLE_POOL_FD_FRACTION", 0.5))
+# datasets whose gene/trait/rsid locations are kept in memory
+HDF5_RESOLUTION_CACHE_SIZE = int(
+    _get_env_var("HDF5_RESOLUTION_CACHE_SIZE", 16))
+# threads running blocking HDF5 reads for the API
+HDF5_EXECUTOR_WORKERS = int(_get_env_var("HDF5_EXECUTOR_WORKERS", 8))
+# reads allowed to wait for a thread before requests are refused (503)
+HDF5_EXECUTOR_QUEUE_SIZE = int(_get_env_var("HDF5_EXECUTOR_QUEUE_SIZE", 64))
+# time a request waits for its read before giving up (504)
+HDF5_QUERY_TIMEOUT_SECONDS = float(
+    _get_env_var("HDF5_QUERY_TIMEOUT_SECONDS", 30))
+# worker processes searching datasets for cross-dataset queries
+HDF5_CROSS_DATASET_WORKERS = int(
+    _get_env_var("HDF5_CROSS_DATASET_WORKERS", 4))
+# overall time allowed for a cross-dataset query
+HDF5_CROSS_DATASET_TIMEOUT_SECONDS = float(
+    _get_env_var("HDF5_CROSS_DATASET_TIMEOUT_SECONDS", 20))
+# start the worker processes with the API rather than on the first query
+HDF5_CROSS_DATASET_PREWARM = str(
+    _get_env_var("HDF5_CROSS_DATASET_PREWARM", "false")).lower() == "true"
 
 
 PA_DTYPES = {'str': str,
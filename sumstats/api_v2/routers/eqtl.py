@@ -1,12 +1,21 @@
-from typing import List
-from fastapi import APIRouter, Depends, Request
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Query, Request
 
+from sumstats.config import (CURSOR_DESCRIPTION,
+                             DATASETS_SEARCHED_HEADER,
+                             HAS_MORE_HEADER,
+                             NEXT_CURSOR_HEADER)
 from sumstats.api_v2.services.qtl_meta import QTLMetadataService
 from sumstats.api_v2.services.qtl_data import QTLDataService
+from sumstats.api_v2.services.executor import hdf5_executor
+from sumstats.api_v2.services.cross_dataset import (cross_dataset_search,
+                                                    dataset_labels)
 from sumstats.api_v2.schemas.eqtl import (RequestFilters,
                                           VariantAssociation,
+                                          DatasetVariantAssociation,
                                           QTLMetadata,
                                           QTLMetadataFilterable)
+from sumstats.api_v2.utils.serialization import columnar_response
 from sumstats.api_v2.schemas.requests import (CommonParams,
                                               MetadataFilters,
                                               DatasetID,
@@ -28,9 +37,10 @@ async def get_datasets(req_filters: MetadataFilters = Depends(),
     start = common_params.start
     size = common_params.size
     filters = QTLMetadataFilterable.parse_obj(vars(req_filters))
-    metadata_list = QTLMetadataService().select(filters=filters,
-                                                start=start,
-                                                size=size)
+    metadata_list = await hdf5_executor.run(QTLMetadataService().select,
+                                            filters=filters,
+                                            start=start,
+                                            size=size)
     return metadata_list
 
 
@@ -38,7 +48,9 @@ async def get_datasets(req_filters: MetadataFilters = Depends(),
             response_model=QTLMetadata)
 async def get_dataset_metadata(dataset_id: DatasetID = Depends()):
     filters = QTLMetadata.parse_obj(vars(dataset_id))
-    metadata = QTLMetadataService().select(filters=filters, many=False)
+    metadata = await hdf5_executor.run(QTLMetadataService().select,
+                                       filters=filters,
+                                       many=False)
     return metadata
 
 
@@ -46,12 +58,63 @@ async def get_dataset_metadata(dataset_id: DatasetID = Depends()):
             response_model=List[VariantAssociation])
 async def get_dataset_associations(dataset_id: DatasetID = Depends(),
                                    common_params: CommonParams = Depends(),
-                                   req_filters: SumStatsFilters = Depends()):
+                                   req_filters: SumStatsFilters = Depends(),
+                                   cursor: Optional[str] = Query(
+                                       default=None,
+                                       description=CURSOR_DESCRIPTION)):
+    """
+    The X-Has-More header tells whether there is a next page, and
+    X-Next-Cursor holds the cursor to fetch it with.
+    """
     start = common_params.start
     size = common_params.size
     hdf5_label = dataset_id.dataset_id
     filters = RequestFilters.parse_obj(vars(req_filters))
-    sumstats_list = QTLDataService(hdf5_label=hdf5_label).query(filters=filters,
-                                                                start=start,
-                                                                size=size)
-    return sumstats_list
+    service = QTLDataService(hdf5_label=hdf5_label)
+    sumstats_df = await hdf5_executor.run(service.query,
+                                          filters=filters,
+                                          start=start,
+                                          size=size,
+                                          cursor=cursor)
+    headers = {HAS_MORE_HEADER: str(service.next_cursor is not None).lower()}
+    if service.next_cursor:
+        headers[NEXT_CURSOR_HEADER] = service.next_cursor
+    return columnar_response(sumstats_df,
+                             model=VariantAssociation,
+                             headers=headers)
+
+
+@router.get("/associations",
+            response_model=List[DatasetVariantAssociation])
+async def get_associations(req_filters: SumStatsFilters = Depends(),
+                           metadata_filters: MetadataFilters = Depends(),
+                           size: int = Query(
+                               default=20, gt=0, le=1000,
+                               description=("Maximum number of associations "
+                                            "returned across datasets"))):
+    """
+    Searches the associations of all datasets, or of those whose
+    metadata match the metadata filters. Results are merged in
+    dataset order, each with its dataset_id.
+
+    The search stops at size results (X-Has-More is then true) or
+    when its time budget runs out. X-Datasets-Searched tells how many
+    of the candidate datasets were searched, e.g. 12/40.
+    """
+    filters = RequestFilters.parse_obj(vars(req_filters))
+    if not (filters.variant or filters.rsid or filters.chromosome or
+            filters.gene_id or filters.molecular_trait_id):
+        raise ValueError(("Query is not permitted. Apply filters "
+                          "to narrow your search by "
+                          "variant, genomic region or "
+                          "gene/molecular trait id"))
+    metadata = QTLMetadataFilterable.parse_obj(vars(metadata_filters))
+    labels = await hdf5_executor.run(dataset_labels,
+                                     metadata_filters=metadata)
+    sumstats_df, has_more, searched = await cross_dataset_search.search(
+        labels=labels, filters=filters, size=size)
+    headers = {HAS_MORE_HEADER: str(has_more).lower(),
+               DATASETS_SEARCHED_HEADER: f"{searched}/{len(labels)}"}
+    return columnar_response(sumstats_df,
+                             model=DatasetVariantAssociation,
+                             headers=headers)
@@ -332,6 +332,14 @@ class VariantAssociation(VariantIdentifer, Variant, GenomicContext, PValue):
     )
 
 
+class DatasetVariantAssociation(VariantAssociation):
+    dataset_id: Optional[str] = Field(
+        default=None,
+        description="Dataset ID the association belongs to",
+        example="QTD000001",
+    )
+
+
 class QTLMetadataFilterable(BaseModel):
     study_id: Optional[str] = Field(
         default=None,
@@ -12,7 +12,11 @@ from sumstats.api_v2.utils.helpers import neg_log_10_pval_to_pval
 class CommonParams:
     def __init__(
         self,
-        start: int = Query(default=0, ge=0, description="Page start"),
+        start: int = Query(
+            default=0,
+            ge=0,
+            description="Page start: the number of matching records to skip",
+        ),
         size: int = Query(default=20, gt=0, le=1000, description="Page size"),
     ):
         self.start = start
@@ -0,0 +1,172 @@
+"""
+Association search across dataset files
+"""
+
+import os
+import sys
+import asyncio
+import logging
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from sumstats.api_v2.config import (DATASET_EXT,
+                                    HDF5_CROSS_DATASET_WORKERS,
+                                    HDF5_CROSS_DATASET_TIMEOUT_SECONDS)
+from sumstats.api_v2.schemas.eqtl import RequestFilters
+from sumstats.api_v2.services.qtl_data import QTLDataService
+from sumstats.api_v2.services.qtl_meta import QTLMetadataService
+from sumstats.api_v2.utils.helpers import get_hdf5_dir
+
+
+logger = logging.getLogger(__name__)
+
+# errors of a dataset that holds no match for the filters: no rows,
+# a gene, trait or rsid it lacks, or no data at all
+NO_MATCH_ERRORS = ("No results",
+                   "Could not find resource with the following filters",
+                   "Can't find any data for the requested resource")
+
+
+def search_dataset(hdf5_label: str, filters: dict, size: int) -> pd.DataFrame:
+    """
+    First size associations of one dataset, with its dataset_id.
+    Runs in a worker process. Other errors than a dataset holding no
+    match are raised, so that they fail the search.
+    """
+    try:
+        results_df = QTLDataService(hdf5_label=hdf5_label).query(
+            filters=RequestFilters(**filters), start=0, size=size)
+    except ValueError as e:
+        if not str(e).startswith(NO_MATCH_ERRORS):
+            raise
+        return pd.DataFrame()
+    results_df['dataset_id'] = hdf5_label
+    return results_df
+
+
+def dataset_labels(metadata_filters=None) -> list:
+    """
+    Labels of the dataset files, sorted. With metadata filters,
+    only those of the datasets whose metadata match.
+    """
+    data_dir = get_hdf5_dir(type="data")
+    if not os.path.isdir(data_dir):
+        return []
+    labels = sorted(f[:-len(DATASET_EXT)] for f in os.listdir(data_dir)
+                    if f.endswith(DATASET_EXT))
+    criteria = ({} if metadata_filters is None
+                else metadata_filters.dict(exclude_none=True))
+    if criteria:
+        records = QTLMetadataService().select(filters=metadata_filters,
+                                              size=sys.maxsize)
+        matched = {record['dataset_id'] for record in records}
+        labels = [label for label in labels if label in matched]
+    return labels
+
+
+class CrossDatasetSearch:
+    """
+    Fans a query out to the dataset files on a pool of worker
+    processes, so the per-file PyTables reads run in parallel.
+
+    Datasets are searched in label order, a bounded window at a time,
+    and their results are merged in that order. The search stops once
+    it has more than size rows (the row budget) or the time budget has
+    run out. Searches not yet started are then cancelled. An error
+    searching a dataset, other than it holding no match, fails the
+    search.
+
+    The worker processes are started by the first search, or ahead of
+    it by start().
+    """
+
+    def __init__(self, max_workers: int = HDF5_CROSS_DATASET_WORKERS,
+                 timeout: float = HDF5_CROSS_DATASET_TIMEOUT_SECONDS):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._executor = None
+        self._lock = threading.Lock()
+
+    async def search(self, labels: list, filters: RequestFilters,
+                     size: int) -> tuple:
+        """
+        Returns the first size merged results, whether more results
+        were found, and the number of datasets that were fully
+        searched. size + 1 rows are looked for to tell whether there
+        are more.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        filters_dict = filters.dict(exclude_none=True)
+        to_search = deque(labels)
+        window = deque()
+        frames = []
+        rows = 0
+        searched = 0
+        has_more = False
+        try:
+            while to_search or window:
+                while to_search and len(window) < 2 * self.max_workers:
+                    label = to_search.popleft()
+                    future = loop.run_in_executor(self._pool(),
+                                                  search_dataset,
+                                                  label, filters_dict,
+                                                  size + 1)
+                    window.append((label, future))
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    logger.warning("Cross-dataset search ran out of time")
+                    break
+                label, future = window.popleft()
+                try:
+                    results_df = await asyncio.wait_for(future, remaining)
+                except asyncio.TimeoutError:
+                    logger.warning("Cross-dataset search ran out of time")
+                    break
+                except Exception:
+                    logger.exception(f"Searching dataset {label} failed")
+                    raise
+                searched += 1
+                if len(results_df) == 0:
+                    continue
+                frames.append(results_df[:size + 1 - rows])
+                rows += len(frames[-1])
+                if rows > size:
+                    has_more = True
+                    break
+        finally:
+            for _, future in window:
+                future.cancel()
+        results_df = pd.concat(frames)[:size] if frames else pd.DataFrame()
+        return results_df, has_more, searched
+
+    def start(self) -> None:
+        """
+        Starts the worker processes ahead of the first search, so
+        that their startup doesn't eat into its time budget.
+        """
+        pool = self._pool()
+        for _ in range(self.max_workers):
+            pool.submit(os.getpid)
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn, not fork: the API process runs threads
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+cross_dataset_search = CrossDatasetSearch()
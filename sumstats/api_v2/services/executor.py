@@ -0,0 +1,88 @@
+"""
+Bounded executor for blocking HDF5 reads
+"""
+
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from sumstats.api_v2.config import (HDF5_EXECUTOR_WORKERS,
+                                    HDF5_EXECUTOR_QUEUE_SIZE,
+                                    HDF5_QUERY_TIMEOUT_SECONDS)
+from sumstats.dependencies.error_classes import ServiceBusy, RequestTimedOut
+
+
+logger = logging.getLogger(__name__)
+
+
+class HDF5Executor:
+    """
+    Runs blocking PyTables calls in a dedicated thread pool, so that
+    they don't block the event loop.
+
+    - At most max_workers calls run at once and at most queue_size
+      wait for a thread; further calls are refused with ServiceBusy.
+    - A caller waits at most timeout seconds, then gets
+      RequestTimedOut. A call still queued is cancelled; one already
+      running can't be interrupted and holds its slot until it ends.
+
+    Threads rather than processes are used so the calls share the
+    process-wide handle pool and resolution cache.
+    """
+
+    def __init__(self, max_workers: int = HDF5_EXECUTOR_WORKERS,
+                 queue_size: int = HDF5_EXECUTOR_QUEUE_SIZE,
+                 timeout: float = HDF5_QUERY_TIMEOUT_SECONDS):
+        self.max_workers = max_workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._executor = None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def in_flight(self) -> int:
+        """
+        Calls running or waiting for a thread.
+        """
+        return self._in_flight
+
+    async def run(self, fn, *args, **kwargs):
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.queue_size:
+                raise ServiceBusy()
+            self._in_flight += 1
+        # the slot is released when the call itself finishes (or is
+        # cancelled before starting), not when the caller stops waiting
+        work = self._pool().submit(partial(fn, *args, **kwargs))
+        work.add_done_callback(self._release)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(work),
+                                          timeout=self.timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"HDF5 call {fn.__qualname__} timed out "
+                           f"after {self.timeout}s")
+            raise RequestTimedOut()
+
+    def _release(self, _) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="hdf5")
+            return self._executor
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+hdf5_executor = HDF5Executor()
@@ -0,0 +1,145 @@
+"""
+Process-wide pool of read-only HDF5 handles
+"""
+
+import os
+import logging
+import resource
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import pandas as pd
+
+from sumstats.api_v2.config import (HDF5_HANDLE_POOL_SIZE,
+                                    HDF5_HANDLE_POOL_FD_FRACTION)
+
+
+logger = logging.getLogger(__name__)
+
+
+def file_signature(path: str) -> tuple:
+    """
+    Identifies the file version on disk. A file that is replaced
+    (new inode) or rewritten in place (new mtime/size) gets a new
+    signature.
+    """
+    stat = os.stat(path)
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def _fd_limit() -> int:
+    soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY:
+        return HDF5_HANDLE_POOL_SIZE
+    return max(1, int(soft * HDF5_HANDLE_POOL_FD_FRACTION))
+
+
+class _PooledHandle:
+    def __init__(self, path: str, signature: tuple):
+        self.path = path
+        self.signature = signature
+        self.store = pd.HDFStore(path, mode='r')
+        self.lock = threading.RLock()
+        self.users = 0
+        self.retired = False
+
+    def close(self) -> None:
+        try:
+            self.store.close()
+        except Exception:
+            logger.exception(f"Failed to close HDF5 handle {self.path}")
+
+
+class HDF5HandlePool:
+    """
+    LRU pool of open read-only HDF5 stores keyed by file path.
+
+    Opening an HDF5 file re-reads its metadata and B-tree index
+    nodes on every request; keeping the handle open keeps these,
+    and the PyTables node/chunk caches, warm between requests.
+
+    - At most max_handles stores are open at once (also capped by
+      a fraction of the process file descriptor limit). The least
+      recently used idle store is closed to make room.
+    - A handle is dropped when the file's inode, mtime or size
+      changes, so a dataset replaced on disk is picked up on the
+      next request.
+    - A handle is used by one thread at a time (HDF5 handles are
+      not safe for concurrent use); reads of different files can
+      run in parallel.
+    """
+
+    def __init__(self, max_handles: int = None):
+        self.max_handles = min(max_handles or HDF5_HANDLE_POOL_SIZE,
+                               _fd_limit())
+        self._handles = OrderedDict()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def store(self, path: str):
+        handle = self._checkout(path)
+        try:
+            with handle.lock:
+                yield handle.store
+        finally:
+            self._checkin(handle)
+
+    def invalidate(self, path: str) -> None:
+        """
+        Drop the handle for path, e.g. before the file is written to.
+        """
+        with self._lock:
+            handle = self._handles.pop(path, None)
+            if handle is not None:
+                self._retire(handle)
+
+    def close_all(self) -> None:
+        with self._lock:
+            while self._handles:
+                _, handle = self._handles.popitem(last=False)
+                self._retire(handle)
+
+    def __len__(self) -> int:
+        return len(self._handles)
+
+    def _checkout(self, path: str) -> _PooledHandle:
+        signature = file_signature(path)
+        with self._lock:
+            handle = self._handles.get(path)
+            if handle is not None and handle.signature != signature:
+                logger.info(f"HDF5 file changed on disk, reopening {path}")
+                del self._handles[path]
+                self._retire(handle)
+                handle = None
+            if handle is None:
+                handle = _PooledHandle(path, signature)
+                self._handles[path] = handle
+                self._evict()
+            self._handles.move_to_end(path)
+            handle.users += 1
+            return handle
+
+    def _checkin(self, handle: _PooledHandle) -> None:
+        with self._lock:
+            handle.users -= 1
+            if handle.retired and handle.users == 0:
+                handle.close()
+
+    def _evict(self) -> None:
+        """
+        Retire least recently used handles until the pool is within
+        its limit. Handles in use are closed on their last checkin.
+        """
+        while len(self._handles) > self.max_handles:
+            _, handle = self._handles.popitem(last=False)
+            self._retire(handle)
+
+    @staticmethod
+    def _retire(handle: _PooledHandle) -> None:
+        handle.retired = True
+        if handle.users == 0:
+            handle.close()
+
+
+handle_pool = HDF5HandlePool()
@@ -3,17 +3,69 @@ HDF5/Pytables interface
 """
 
 import os
+import time
 import logging
+from functools import lru_cache
+from itertools import islice
+
+import numpy as np
 import pandas as pd
 import tables as tb
 
+from sumstats.api_v2.services.handle_pool import handle_pool
 from sumstats.api_v2.utils.service_result import SearchResult
 from sumstats.api_v2.utils.helpers import (mkdir,
-                                           properties_from_model)
+                                           properties_from_model,
+                                           chromosome_sort_key,
+                                           encode_cursor,
+                                           decode_cursor)
 
 
 logger = logging.getLogger(__name__)
 
+# a table whose sort_order attribute starts with these is laid out by
+# location, chromosomes in natural order
+LOCATION_SORT_ORDER = ['chromosome', 'position']
+
+
+@lru_cache(maxsize=None)
+def filter_terms(model, keys: tuple) -> tuple:
+    """
+    The comparison of each set filter key of a filter model, as
+    (filter key, column, operator) with operator one of '<=', '>='
+    and '=='.
+    """
+    lt_filters = properties_from_model(model, 'lt_filter')
+    gt_filters = properties_from_model(model, 'gt_filter')
+    filter_on = properties_from_model(model, 'filter_on')
+    terms = []
+    for key in keys:
+        filter_field = filter_on[key] if key in filter_on else key
+        if key in lt_filters:
+            terms.append((key, filter_field, '<='))
+        elif key in gt_filters:
+            terms.append((key, filter_field, '>='))
+        else:
+            terms.append((key, filter_field, '=='))
+    return tuple(terms)
+
+
+@lru_cache(maxsize=None)
+def condition_template(model, keys: tuple) -> tuple:
+    """
+    The condition for a filter shape (the filter model and the set
+    filter keys, in order), with the values as variables v0, v1, ...
+    Returns it with the (filter key, column) pair of each variable.
+
+    As the condition string is the same for all requests of a shape,
+    PyTables also reuses its compiled numexpr program.
+    """
+    terms = filter_terms(model, keys)
+    conditions = [f"({field} {op} v{i})"
+                  for i, (_, field, op) in enumerate(terms)]
+    statement = " & ".join(conditions) if len(conditions) > 0 else None
+    return statement, tuple((key, field) for key, field, _ in terms)
+
 
 class HDF5Interface:
     def __init__(self):
@@ -22,50 +74,231 @@ class HDF5Interface:
 
     def select(self, key: str = None, filters: object = None,
                many: bool = True, size: int = 20, start: int = 0):
+        records, _ = self.select_page(key=key,
+                                      filters=filters,
+                                      size=size,
+                                      start=start)
+        return SearchResult(data=records, many=many).result()
+
+    def select_page(self, key: str = None, filters: object = None,
+                    size: int = 20, start: int = 0,
+                    cursor: str = None) -> tuple:
+        """
+        Returns a page of matching records and the continuation cursor
+        for the next page (None on the last page).
+        """
+        results_df, next_cursor = self.select_frame(key=key,
+                                                    filters=filters,
+                                                    size=size,
+                                                    start=start,
+                                                    cursor=cursor)
+        return results_df.to_dict('records'), next_cursor
+
+    def select_frame(self, key: str = None, filters: object = None,
+                     size: int = 20, start: int = 0,
+                     cursor: str = None) -> tuple:
+        """
+        As select_page, but the page is returned as a DataFrame.
+
+        size + 1 matches are read to find out whether there is a next
+        page, so the total number of matches is never computed. A cursor
+        resumes after the last row of the previous page and takes
+        precedence over start.
+        """
         self._check_hdf5_exists()
-        results_df = pd.DataFrame()
-        condition = self._filters_to_condition(filters=filters)
-        with pd.HDFStore(self.hdf5, mode='r') as store:
+        with handle_pool.store(self.hdf5) as store:
             key = store.keys()[0] if key is None else key
-            if condition:
-                chunks = store.select(key,
-                                      chunksize=size,
-                                      start=start,
-                                      where=condition)
+            storer = store.get_storer(key)
+            table = storer.table
+            sort_order = list(getattr(storer.attrs, 'sort_order', []))
+            after_row = None
+            if cursor is not None:
+                after_row = self._row_from_cursor(table=table, cursor=cursor)
+                start = 0
+            coordinates = self._page_coordinates(table=table,
+                                                 filters=filters,
+                                                 start=start,
+                                                 size=size + 1,
+                                                 after_row=after_row,
+                                                 sort_order=sort_order)
+            next_cursor = None
+            if coordinates.size > size:
+                coordinates = coordinates[:size]
+                next_cursor = self._cursor_for_row(table=table,
+                                                   row=int(coordinates[-1]))
+            if coordinates.size == 0:
+                return pd.DataFrame(), None
+            return store.select(key, where=coordinates), next_cursor
+
+    def _page_coordinates(self, table: tb.Table, filters: object,
+                          start: int, size: int,
+                          after_row: int = None,
+                          sort_order: list = ()) -> np.ndarray:
+        """
+        Row numbers of the requested page of matches. Matches are
+        enumerated lazily (using the column indexes where possible)
+        and only up to the end of the page.
+
+        In a table sorted by location, the rows of a chromosome (and
+        position range) are found by binary search, and only the other
+        filters are evaluated, over that block of rows.
+        """
+        first_row = 0 if after_row is None else after_row + 1
+        stop = table.nrows
+        values = {} if filters is None else filters.dict(exclude_none=True)
+        if values and sort_order[:2] == LOCATION_SORT_ORDER:
+            location = self._location_rows(table=table,
+                                           model=type(filters),
+                                           values=values)
+            if location is not None:
+                (location_start, stop), values = location
+                first_row = max(first_row, location_start)
+        if first_row >= stop:
+            return np.array([], dtype=np.int64)
+        condition, condvars = self._filters_to_condition(model=type(filters),
+                                                         values=values,
+                                                         table=table)
+        if condition is None:
+            return np.arange(first_row + start,
+                             min(first_row + start + size, stop))
+        # without an explicit stop, PyTables reads just the start row
+        matches = table.where(condition, condvars=condvars,
+                              start=first_row, stop=stop)
+        return np.fromiter((row.nrow for row in
+                            islice(matches, start, start + size)),
+                           dtype=np.int64)
+
+    @classmethod
+    def _location_rows(cls, table: tb.Table, model, values: dict):
+        """
+        For a table sorted by location and filters with a chromosome,
+        the (start, stop) rows of the filtered location and the filters
+        left to evaluate. None without a chromosome filter.
+        """
+        chromosome, lowest, highest = None, 0, float('inf')
+        remaining = {}
+        for key, field, op in filter_terms(model, tuple(values)):
+            value = values[key]
+            if field == 'chromosome' and op == '==':
+                chromosome = chromosome_sort_key(value)
+            elif field == 'position':
+                if op != '<=':
+                    lowest = max(lowest, int(value))
+                if op != '>=':
+                    highest = min(highest, int(value))
             else:
-                chunks = store.select(key,
-                                      chunksize=size,
-                                      start=start)
-            result_size = chunks.coordinates.size
-            if result_size > 0 and result_size > start:
-                for _, chunk in enumerate(chunks):
-                    results_df = results_df.append(chunk)
-                    break
-                data_dict = results_df[:size].to_dict('records')
-                return SearchResult(data=data_dict, many=many).result()
+                remaining[key] = value
+        if chromosome is None:
+            return None
+        start = cls._first_row_from(table, (chromosome, lowest))
+        stop = cls._first_row_from(table, (chromosome, highest + 1))
+        return (start, stop), remaining
+
+    @staticmethod
+    def _first_row_from(table: tb.Table, location: tuple) -> int:
+        """
+        Binary search for the first row at or after location, a
+        (chromosome sort key, position) pair.
+        """
+        lo, hi = 0, table.nrows
+        while lo < hi:
+            mid = (lo + hi) // 2
+            row = table[mid]
+            row_location = (chromosome_sort_key(row['chromosome'].decode()),
+                            int(row['position']))
+            if row_location < location:
+                lo = mid + 1
             else:
-                return SearchResult(data=None, many=many).result()
+                hi = mid
+        return lo
+
+    @staticmethod
+    def _cursor_for_row(table: tb.Table, row: int) -> str:
+        position = None
+        if 'position' in table.colnames:
+            position = int(table.cols.position[row])
+        return encode_cursor(position=position, row=row)
+
+    @staticmethod
+    def _row_from_cursor(table: tb.Table, cursor: str) -> int:
+        """
+        The row a cursor resumes after. The position in the cursor is
+        checked against the row, so that a cursor issued before the
+        file was replaced is rejected rather than silently resumed at
+        a different variant.
+        """
+        position, row = decode_cursor(cursor)
+        if not 0 <= row < table.nrows:
+            raise ValueError("Invalid pagination cursor.")
+        if position is not None and 'position' in table.colnames:
+            if int(table.cols.position[row]) != position:
+                raise ValueError("Invalid pagination cursor.")
+        return row
+
+    def nrows(self, key: str = None) -> int:
+        self._check_hdf5_exists()
+        with handle_pool.store(self.hdf5) as store:
+            key = store.keys()[0] if key is None else key
+            return store.get_storer(key).nrows
+
+    @staticmethod
+    def read_chunks(path: str, key: str = None, columns: list = None,
+                    chunksize: int = 1_000_000):
+        """
+        Yields the rows of a table (the first one without a key) as
+        DataFrames of up to chunksize rows, with only the given columns.
+        """
+        with handle_pool.store(path) as store:
+            key = store.keys()[0] if key is None else key
+            nrows = store.get_storer(key).nrows
+            for start in range(0, nrows, chunksize):
+                yield store.select(key,
+                                   columns=columns,
+                                   start=start,
+                                   stop=start + chunksize)
 
     def create(self,
                data: pd.DataFrame,
                key: str,
                **kwargs) -> None:
         mkdir(self.par_dir)
+        handle_pool.invalidate(self.hdf5)
+        with pd.HDFStore(self.hdf5) as store:
+            data.to_hdf(store, key=key, format="table", **kwargs)
+
+    def set_sort_order(self, key: str, sort_order: list) -> None:
+        """
+        Records the order the rows of the table are sorted in.
+        """
+        handle_pool.invalidate(self.hdf5)
         with pd.HDFStore(self.hdf5) as store:
-            data.to_hdf(store, key, format="table", **kwargs)
+            store.get_storer(key).attrs.sort_order = list(sort_order)
 
     def reindex(self, index_fields: list,
-                cs_index: str = None, key: str = None):
+                cs_index: str = None, key: str = None,
+                progress=None):
         """
         index_fields = list of fields to enable searching on
         cs_index = column sorted index (primary column to sort by)
+        progress = called with a message as each index is built
         """
+        handle_pool.invalidate(self.hdf5)
+        progress = progress or logger.info
         with pd.HDFStore(self.hdf5) as store:
             try:
                 key = store.keys()[0] if key is None else key
-                [self._create_index(i, key) for i in index_fields if i != cs_index]
+                table = store.get_storer(key).table
+                fields = [i for i in index_fields if i != cs_index]
                 if cs_index:
-                    self._create_cs_index(cs_index, key)
+                    fields.append(cs_index)
+                for n, field in enumerate(fields, start=1):
+                    started = time.time()
+                    if field == cs_index:
+                        self._create_cs_index(table, field)
+                    else:
+                        self._create_index(table, field)
+                    progress(f"indexed {key} {field} ({n}/{len(fields)}) "
+                             f"in {time.time() - started:.1f}s")
             except IndexError:
                 os.remove(self.hdf5)
 
@@ -73,35 +306,45 @@ class HDF5Interface:
         if not os.path.exists(self.hdf5):
             raise ValueError("Can't find any data for the requested resource")
 
-    def _filters_to_condition(self, filters) -> str:
-        lt_filters = properties_from_model(filters, 'lt_filter')
-        gt_filters = properties_from_model(filters, 'gt_filter')
-        filter_on = properties_from_model(filters, 'filter_on')
-        conditions = []
-        for key, value in filters.dict(exclude_none=True).items():
-            filter_field = filter_on[key] if key in filter_on else key
-            if key in lt_filters:
-                conditions.append(f"{filter_field} <= {value}")
-            elif key in gt_filters:
-                conditions.append(f"{filter_field} >= {value}")
-            else:
-                conditions.append(f"{filter_field} == '{value}'")
-        statement = " & ".join(conditions) if len(conditions) > 0 else None
-        logger.info(f"Filter condition: {statement}")
-        return statement
-    
-    def _create_index(self,
+    def _filters_to_condition(self, model, values: dict,
+                              table: tb.Table) -> tuple:
+        """
+        PyTables condition and its variables, for the filter values of
+        a filter model. Values are passed as condvars coerced to the
+        column type, rather than formatted into the condition string.
+        """
+        if not values:
+            return None, {}
+        statement, filter_fields = condition_template(model, tuple(values))
+        condvars = {f"v{i}": self._coerce_to_column(table, field, values[key])
+                    for i, (key, field) in enumerate(filter_fields)}
+        logger.info(f"Filter condition: {statement}, {condvars}")
+        return statement, condvars
+
+    @staticmethod
+    def _coerce_to_column(table: tb.Table, field: str, value):
+        if field not in table.colnames:
+            raise ValueError(f"Can't filter on field '{field}'")
+        kind = table.coldtypes[field].kind
+        if kind == 'S':
+            return str(value).encode()
+        elif kind in 'iu':
+            return int(value)
+        elif kind == 'f':
+            return float(value)
+        return value
+
+    @staticmethod
+    def _create_index(table: tb.Table,
                       field: str,
-                      key: str,
                       optlevel=6,
                       kind="medium") -> None:
-        with tb.open_file(self.hdf5, "a") as hdf:
-            col = hdf.root[key].table.cols._f_col(field)
-            col.remove_index()
-            col.create_index(optlevel=optlevel, kind=kind)
-
-    def _create_cs_index(self, field: str, key: str) -> None:
-        with tb.open_file(self.hdf5, "a") as hdf:
-            col = hdf.root[key].table.cols._f_col(field)
-            col.remove_index()
-            col.create_csindex()
+        col = table.cols._f_col(field)
+        col.remove_index()
+        col.create_index(optlevel=optlevel, kind=kind)
+
+    @staticmethod
+    def _create_cs_index(table: tb.Table, field: str) -> None:
+        col = table.cols._f_col(field)
+        col.remove_index()
+        col.create_csindex()
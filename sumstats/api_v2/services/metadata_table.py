@@ -0,0 +1,83 @@
+"""
+In-memory QTL metadata table
+"""
+
+import logging
+import threading
+
+import pandas as pd
+
+from sumstats.api_v2.services.handle_pool import file_signature
+from sumstats.api_v2.services.storage import StorageInterface
+
+
+logger = logging.getLogger(__name__)
+
+
+class MetadataTable:
+    """
+    The metadata records in file order, with a hash index per field
+    mapping each value to the positions of the records holding it.
+    """
+
+    def __init__(self, records: list):
+        self.records = records
+        self.indexes = {}
+        for position, record in enumerate(records):
+            for field, value in record.items():
+                field_index = self.indexes.setdefault(field, {})
+                field_index.setdefault(str(value), []).append(position)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def select(self, criteria: dict, start: int = 0, size: int = 20) -> list:
+        """
+        Copies of the records equal to all the criteria, in file order.
+        """
+        matches = []
+        for field, value in criteria.items():
+            if field not in self.indexes:
+                raise ValueError(f"Can't filter on field '{field}'")
+            matches.append(self.indexes[field].get(str(value), []))
+        if not matches:
+            positions = range(len(self.records))
+        else:
+            matches.sort(key=len)
+            common = set(matches[0]).intersection(*matches[1:])
+            positions = [p for p in matches[0] if p in common]
+        return [dict(self.records[p]) for p in positions[start:start + size]]
+
+
+class MetadataTableCache:
+    """
+    MetadataTables keyed by file path, reloaded when the file
+    changes on disk.
+    """
+
+    def __init__(self):
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> MetadataTable:
+        signature = file_signature(path)
+        with self._lock:
+            entry = self._tables.get(path)
+            if entry is None or entry[0] != signature:
+                entry = (signature, self._load(path))
+                self._tables[path] = entry
+            return entry[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tables.clear()
+
+    @staticmethod
+    def _load(path: str) -> MetadataTable:
+        records = pd.concat(StorageInterface.read_chunks(path)
+                            ).to_dict('records')
+        logger.info(f"Loaded {len(records)} metadata records from {path}")
+        return MetadataTable(records)
+
+
+metadata_tables = MetadataTableCache()
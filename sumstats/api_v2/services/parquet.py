@@ -0,0 +1,421 @@
+"""
+Parquet/Arrow interface
+"""
+
+import os
+import json
+import glob
+import time
+import shutil
+import logging
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from sumstats.api_v2.config import (PARQUET_ROW_GROUP_ROWS,
+                                    PARQUET_COMPRESSION,
+                                    HDF5_HANDLE_POOL_SIZE)
+from sumstats.api_v2.services.handle_pool import file_signature
+from sumstats.api_v2.services.main import HDF5Interface, filter_terms
+from sumstats.api_v2.utils.helpers import mkdir, encode_cursor, decode_cursor
+
+
+logger = logging.getLogger(__name__)
+
+TABLE_EXT = ".parquet"
+PARTS_EXT = ".parts"
+ATTRS_FILE = "attrs.json"
+COMPARISONS = {'==': pc.equal, '>=': pc.greater_equal, '<=': pc.less_equal}
+# rows decoded at a time when reading the rows of a page
+READ_BATCH_ROWS = 1024
+
+
+class TableLayout:
+    """
+    The footer metadata of a Parquet file, the first row of each of
+    its row groups (plus the total), and the min/max statistics of the
+    filtered columns as arrays, to prune row groups in one go.
+    """
+
+    def __init__(self, path: str):
+        self.metadata = pq.read_metadata(path)
+        self.schema = self.metadata.schema.to_arrow_schema()
+        self.num_row_groups = self.metadata.num_row_groups
+        sizes = [self.metadata.row_group(i).num_rows
+                 for i in range(self.num_row_groups)]
+        self.offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+        self._statistics = {}
+
+    def statistics(self, field: str) -> tuple:
+        """
+        The row groups with min/max statistics for the column, and
+        their mins and maxes.
+        """
+        if field not in self._statistics:
+            column = self.schema.get_field_index(field)
+            known, mins, maxes = [], [], []
+            for i in range(self.num_row_groups):
+                row_group = self.metadata.row_group(i)
+                statistics = row_group.column(column).statistics
+                if statistics is not None and statistics.has_min_max:
+                    known.append(i)
+                    mins.append(statistics.min)
+                    maxes.append(statistics.max)
+            self._statistics[field] = (np.array(known, dtype=np.int64),
+                                       np.array(mins), np.array(maxes))
+        return self._statistics[field]
+
+    def candidate_groups(self, terms: list) -> np.ndarray:
+        """
+        The row groups whose statistics don't rule out a match for
+        all the (field, operator, value) terms.
+        """
+        may_match = np.ones(self.num_row_groups, dtype=bool)
+        for field, op, value in terms:
+            known, mins, maxes = self.statistics(field)
+            if known.size == 0:
+                continue
+            if op in ('==', '>='):
+                may_match[known[maxes < value]] = False
+            if op in ('==', '<='):
+                may_match[known[mins > value]] = False
+        return np.flatnonzero(may_match)
+
+
+@lru_cache(maxsize=HDF5_HANDLE_POOL_SIZE)
+def _table_layout(path: str, signature: tuple) -> TableLayout:
+    return TableLayout(path)
+
+
+def table_key(dataset_dir: str, key: str = None) -> str:
+    """
+    The key, or without one the dataset's only table.
+    """
+    if key is not None:
+        return key.strip('/')
+    names = sorted(f for f in os.listdir(dataset_dir)
+                   if f.endswith(TABLE_EXT) or f.endswith(PARTS_EXT))
+    if not names:
+        raise ValueError("Can't find any data for the requested resource")
+    return os.path.splitext(names[0])[0]
+
+
+def table_path(dataset_dir: str, key: str = None) -> str:
+    return os.path.join(dataset_dir, table_key(dataset_dir, key) + TABLE_EXT)
+
+
+def table_layout(path: str) -> TableLayout:
+    """
+    The layout of a Parquet file, cached until the file changes.
+    """
+    return _table_layout(path, file_signature(path))
+
+
+class ParquetInterface(HDF5Interface):
+    """
+    The HDF5Interface contract over a directory of Parquet files, one
+    per table (key). self.hdf5 is the directory.
+
+    create appends data to a table as a part file. reindex merges the
+    parts into the table's file, in row groups of PARQUET_ROW_GROUP_ROWS
+    with column statistics and page indexes. Data appended since the
+    last reindex isn't selected.
+
+    select_frame reads the filter columns only, one row group at a
+    time, skipping the row groups whose statistics rule out a match.
+    The other columns are then read from the row groups of the page
+    only, up to its last row in each. Rows are numbered across the
+    table, as in HDF5, so start and cursors work the same.
+    """
+
+    def select_frame(self, key: str = None, filters: object = None,
+                     size: int = 20, start: int = 0,
+                     cursor: str = None) -> tuple:
+        self._check_hdf5_exists()
+        path = table_path(self.hdf5, key)
+        if not os.path.exists(path):
+            raise ValueError("Can't find any data for the requested resource")
+        layout = table_layout(path)
+        offsets = layout.offsets
+        parquet_file = pq.ParquetFile(path, metadata=layout.metadata)
+        after_row = None
+        if cursor is not None:
+            after_row = self._row_from_cursor(parquet_file, offsets, cursor)
+            start = 0
+        rows, decoded = self._page_rows(parquet_file=parquet_file,
+                                        layout=layout,
+                                        filters=filters,
+                                        start=start,
+                                        size=size + 1,
+                                        after_row=after_row)
+        has_more = rows.size > size
+        rows = rows[:size]
+        if rows.size == 0:
+            return pd.DataFrame(), None
+        results_df = self._read_rows(parquet_file, offsets, rows,
+                                     decoded=decoded)
+        next_cursor = None
+        if has_more:
+            position = None
+            if 'position' in results_df:
+                position = int(results_df['position'].iat[-1])
+            next_cursor = encode_cursor(position=position, row=int(rows[-1]))
+        return results_df, next_cursor
+
+    def _page_rows(self, parquet_file: pq.ParquetFile, layout: TableLayout,
+                   filters: object, start: int, size: int,
+                   after_row: int = None) -> tuple:
+        """
+        Row numbers of the requested page of matches, reading row
+        groups only up to the end of the page, and the filter columns
+        read from the row groups holding them, by row group.
+        """
+        offsets = layout.offsets
+        first_row = 0 if after_row is None else after_row + 1
+        nrows = int(offsets[-1])
+        values = {} if filters is None else filters.dict(exclude_none=True)
+        if not values:
+            return np.arange(first_row + start,
+                             min(first_row + start + size, nrows)), {}
+        schema = parquet_file.schema_arrow
+        terms = [(field, op, self._coerce_to_field(schema, field, values[k]))
+                 for k, field, op in filter_terms(type(filters),
+                                                  tuple(values))]
+        columns = list(dict.fromkeys(field for field, _, _ in terms))
+        logger.info(f"Filter terms: {terms}")
+        pages = []
+        decoded = {}
+        to_skip, needed = start, size
+        groups = layout.candidate_groups(terms)
+        # the row groups ending after first_row
+        groups = groups[offsets[groups + 1] > first_row]
+        for group in groups:
+            group = int(group)
+            table = parquet_file.read_row_group(group, columns=columns)
+            matched = np.flatnonzero(self._mask(table, terms)) + offsets[group]
+            matched = matched[matched >= first_row]
+            skipped = min(to_skip, matched.size)
+            to_skip -= skipped
+            pages.append(matched[skipped:skipped + needed])
+            needed -= pages[-1].size
+            if pages[-1].size:
+                decoded[group] = table
+            if needed == 0:
+                break
+        if not pages:
+            return np.array([], dtype=np.int64), {}
+        return np.concatenate(pages).astype(np.int64), decoded
+
+    @staticmethod
+    def _mask(table: pa.Table, terms: list) -> np.ndarray:
+        mask = None
+        for field, op, value in terms:
+            term = COMPARISONS[op](table.column(field), value)
+            mask = term if mask is None else pc.and_(mask, term)
+        return pc.fill_null(mask, False).to_numpy(zero_copy_only=False)
+
+    @staticmethod
+    def _coerce_to_field(schema: pa.Schema, field: str, value):
+        if field not in schema.names:
+            raise ValueError(f"Can't filter on field '{field}'")
+        field_type = schema.field(field).type
+        if pa.types.is_string(field_type) or \
+                pa.types.is_large_string(field_type):
+            return str(value)
+        elif pa.types.is_integer(field_type):
+            return int(value)
+        elif pa.types.is_floating(field_type):
+            return float(value)
+        return value
+
+    @classmethod
+    def _read_rows(cls, parquet_file: pq.ParquetFile, offsets: np.ndarray,
+                   rows: np.ndarray, columns: list = None,
+                   decoded: dict = None) -> pd.DataFrame:
+        """
+        The columns of rows, in ascending order. Columns already in
+        decoded, a table per row group, aren't read again.
+        """
+        columns = columns or parquet_file.schema_arrow.names
+        decoded = decoded or {}
+        groups = np.searchsorted(offsets, rows, side='right') - 1
+        tables = []
+        for group in np.unique(groups):
+            local_rows = rows[groups == group] - offsets[group]
+            known = decoded.get(int(group))
+            known_columns = [] if known is None else known.column_names
+            to_read = [c for c in columns if c not in known_columns]
+            table = None
+            if to_read:
+                table = cls._read_group_rows(parquet_file, int(group),
+                                             local_rows, to_read)
+            for column in known_columns:
+                values = known.column(column).take(pa.array(local_rows))
+                table = (pa.table({column: values}) if table is None
+                         else table.append_column(column, values))
+            tables.append(table.select(columns))
+        results_df = pa.concat_tables(tables).to_pandas()
+        results_df.index = rows
+        return results_df
+
+    @staticmethod
+    def _read_group_rows(parquet_file: pq.ParquetFile, group: int,
+                         local_rows: np.ndarray, columns: list) -> pa.Table:
+        """
+        The ascending local_rows of a row group, decoded a batch at a
+        time up to the batch holding the last of them.
+        """
+        batches = []
+        batch_start = 0
+        for batch in parquet_file.iter_batches(batch_size=READ_BATCH_ROWS,
+                                               row_groups=[group],
+                                               columns=columns):
+            batch_stop = batch_start + batch.num_rows
+            in_batch = local_rows[(local_rows >= batch_start) &
+                                  (local_rows < batch_stop)]
+            if in_batch.size:
+                batches.append(batch.take(pa.array(in_batch - batch_start)))
+            batch_start = batch_stop
+            if batch_start > local_rows[-1]:
+                break
+        return pa.Table.from_batches(batches)
+
+    @classmethod
+    def _row_from_cursor(cls, parquet_file: pq.ParquetFile,
+                         offsets: np.ndarray, cursor: str) -> int:
+        position, row = decode_cursor(cursor)
+        if not 0 <= row < offsets[-1]:
+            raise ValueError("Invalid pagination cursor.")
+        if position is not None and \
+                'position' in parquet_file.schema_arrow.names:
+            if cls._position_at(parquet_file, offsets, row) != position:
+                raise ValueError("Invalid pagination cursor.")
+        return row
+
+    @classmethod
+    def _position_at(cls, parquet_file: pq.ParquetFile,
+                     offsets: np.ndarray, row: int) -> int:
+        position = cls._read_rows(parquet_file, offsets,
+                                  rows=np.array([row]),
+                                  columns=['position'])
+        return int(position['position'].iat[0])
+
+    def nrows(self, key: str = None) -> int:
+        self._check_hdf5_exists()
+        return table_layout(table_path(self.hdf5, key)).metadata.num_rows
+
+    @staticmethod
+    def read_chunks(path: str, key: str = None, columns: list = None,
+                    chunksize: int = 1_000_000):
+        parquet_file = pq.ParquetFile(table_path(path, key))
+        for batch in parquet_file.iter_batches(batch_size=chunksize,
+                                               columns=columns):
+            yield batch.to_pandas()
+
+    def create(self,
+               data: pd.DataFrame,
+               key: str,
+               **kwargs) -> None:
+        """
+        Writes data as a part of the table, replacing the table unless
+        append is set. The HDF5 storage options in kwargs don't apply.
+        """
+        key = table_key(self.hdf5, key)
+        parts_dir = os.path.join(self.hdf5, key + PARTS_EXT)
+        if not kwargs.get('append', False):
+            shutil.rmtree(parts_dir, ignore_errors=True)
+            if os.path.exists(table_path(self.hdf5, key)):
+                os.remove(table_path(self.hdf5, key))
+        mkdir(parts_dir)
+        n_parts = len(os.listdir(parts_dir))
+        part = os.path.join(parts_dir, f"part-{n_parts:06d}{TABLE_EXT}")
+        pq.write_table(pa.Table.from_pandas(data, preserve_index=False),
+                       part, compression=PARQUET_COMPRESSION)
+
+    def set_sort_order(self, key: str, sort_order: list) -> None:
+        """
+        Records the order the rows of the table are sorted in. It is
+        added to the Parquet file's metadata at the next reindex.
+        """
+        attrs = self._attrs()
+        attrs.setdefault(key.strip('/'), {})['sort_order'] = list(sort_order)
+        attrs_path = os.path.join(self.hdf5, ATTRS_FILE)
+        with open(attrs_path + ".tmp", "w") as f:
+            json.dump(attrs, f)
+        os.replace(attrs_path + ".tmp", attrs_path)
+
+    def reindex(self, index_fields: list,
+                cs_index: str = None, key: str = None,
+                progress=None):
+        """
+        Merges the parts appended to the table into its file. The
+        statistics and page indexes written for every column take the
+        place of the HDF5 column indexes, so index_fields and cs_index
+        aren't used.
+        """
+        progress = progress or logger.info
+        key = table_key(self.hdf5, key)
+        started = time.time()
+        rows = self._compact(key)
+        progress(f"wrote {rows} rows of {key} in row groups with statistics "
+                 f"in {time.time() - started:.1f}s")
+
+    def _compact(self, key: str) -> int:
+        path = table_path(self.hdf5, key)
+        parts_dir = os.path.join(self.hdf5, key + PARTS_EXT)
+        sources = ([path] if os.path.exists(path) else []) + \
+            sorted(glob.glob(os.path.join(parts_dir, "*" + TABLE_EXT)))
+        if not sources:
+            return 0
+        schema = pa.unify_schemas([pq.read_schema(s) for s in sources])
+        sort_order = self._attrs().get(key, {}).get('sort_order')
+        if sort_order:
+            # not as Parquet sorting columns, which would claim
+            # chromosomes are in lexical order
+            metadata = {**(schema.metadata or {}),
+                        b'sort_order': json.dumps(sort_order)}
+            schema = schema.with_metadata(metadata)
+        rows = 0
+        buffered = []
+        with pq.ParquetWriter(path + ".tmp", schema,
+                              compression=PARQUET_COMPRESSION,
+                              write_statistics=True,
+                              write_page_index=True) as writer:
+            for source in sources:
+                for batch in pq.ParquetFile(source).iter_batches(
+                        batch_size=PARQUET_ROW_GROUP_ROWS):
+                    table = pa.Table.from_batches([batch]).cast(schema)
+                    buffered.append(table)
+                    rows += batch.num_rows
+                    buffered = self._write_row_groups(writer, buffered)
+            if buffered:
+                writer.write_table(pa.concat_tables(buffered))
+        os.replace(path + ".tmp", path)
+        shutil.rmtree(parts_dir, ignore_errors=True)
+        return rows
+
+    @staticmethod
+    def _write_row_groups(writer: pq.ParquetWriter, buffered: list) -> list:
+        """
+        Writes the full row groups of the buffered tables, and returns
+        the rest.
+        """
+        table = pa.concat_tables(buffered)
+        full = table.num_rows - table.num_rows % PARQUET_ROW_GROUP_ROWS
+        if full == 0:
+            return buffered
+        writer.write_table(table.slice(0, full),
+                           row_group_size=PARQUET_ROW_GROUP_ROWS)
+        rest = table.slice(full)
+        return [rest] if rest.num_rows else []
+
+    def _attrs(self) -> dict:
+        try:
+            with open(os.path.join(self.hdf5, ATTRS_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
@@ -3,16 +3,20 @@ Summmary statistics data interface
 """
 import logging
 
-from sumstats.api_v2.services.main import HDF5Interface
+import pandas as pd
+
+from sumstats.api_v2.services.storage import StorageInterface
+from sumstats.api_v2.services.resolution_cache import resolution_cache
 from sumstats.api_v2.utils.helpers import (get_hdf5_path,
                                            get_hdf5_dir,
                                            pval_to_neg_log_10_pval)
+from sumstats.api_v2.utils.service_result import SearchResult
 
 
 logger = logging.getLogger(__name__)
 
 
-class QTLDataService(HDF5Interface):
+class QTLDataService(StorageInterface):
 
     BP_DISTANCE = 1_000_000  # distance from genetic feature
     BP_ERROR_MARGIN = 100  # an position error margin to add the rsid search
@@ -23,22 +27,28 @@ class QTLDataService(HDF5Interface):
         self.par_dir = get_hdf5_dir(type="data")
         self.filters = None
         self.result = []
+        self.next_cursor = None
 
-    def query(self, filters, start, size) -> list:
+    def query(self, filters, start, size, cursor=None) -> pd.DataFrame:
         """
         Convert: position query to select
                  rsID to postion
                  variant id tp position
                  gene_id to position +-1mb
                  trait to position +-1mb
+        The page is returned as a DataFrame, one column per field.
+        The cursor for the following page, if there is one,
+        is set on self.next_cursor.
         """
         self.filters = filters
         self._resolve_genomic_region_based_on_search_type()
         if self._is_genomic_region_search() or self._is_not_filtered():
-            self.result = self.select(filters=self.filters,
-                                      key="sumstats",
-                                      start=start,
-                                      size=size)
+            results_df, self.next_cursor = self.select_frame(filters=self.filters,
+                                                             key="sumstats",
+                                                             start=start,
+                                                             size=size,
+                                                             cursor=cursor)
+            self.result = SearchResult(data=results_df).result()
             return self._format_result()
         else:
             raise ValueError(("Query is not permitted. Apply filters "
@@ -46,14 +56,15 @@ class QTLDataService(HDF5Interface):
                               "variant, genomic region or "
                               "gene/molecular trait id"))
 
-    def _format_result(self):
-        return [self._add_neg_log_p(hit) for hit in self.result]
+    def _format_result(self) -> pd.DataFrame:
+        return self._add_neg_log_p(self.result)
 
     @staticmethod
-    def _add_neg_log_p(record):
-        if 'pvalue' in record:
-            record['nlog10p'] = pval_to_neg_log_10_pval(record['pvalue'])
-            return record
+    def _add_neg_log_p(results_df: pd.DataFrame) -> pd.DataFrame:
+        if 'pvalue' in results_df:
+            results_df['nlog10p'] = pval_to_neg_log_10_pval(
+                results_df['pvalue'].to_numpy())
+        return results_df
 
     def _resolve_genomic_region_based_on_search_type(self):
         if self._is_variant_search():
@@ -101,11 +112,13 @@ class QTLDataService(HDF5Interface):
                 )
 
     def _resolve_genomic_region(self, context_filters, key, distance):
-        region_to_search = self.select(filters=context_filters, key=key)
-        if len(region_to_search) > 0:
-            first_record = region_to_search[0]
-            chromosome, position = (first_record['chromosome'],
-                                    first_record['position'])
+        self._check_hdf5_exists()
+        location = resolution_cache.resolve(
+            path=self.hdf5,
+            key=key,
+            criteria=context_filters.dict(exclude_none=True))
+        if location is not None:
+            chromosome, position = location
             self.filters.chromosome = chromosome
             self.filters.position_start = position - distance if position > distance else 0
             self.filters.position_end = position + distance
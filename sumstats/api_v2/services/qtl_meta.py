@@ -3,12 +3,27 @@ Metadata interface
 """
 
 from sumstats.api_v2.config import HDF5_QTL_METADATA_LABEL
-from sumstats.api_v2.services.main import HDF5Interface
+from sumstats.api_v2.services.storage import StorageInterface
+from sumstats.api_v2.services.metadata_table import metadata_tables
 from sumstats.api_v2.utils.helpers import get_hdf5_path, get_hdf5_dir
+from sumstats.api_v2.utils.service_result import SearchResult
 
 
-class QTLMetadataService(HDF5Interface):
+class QTLMetadataService(StorageInterface):
     def __init__(self, qtl_meta_hdf5=HDF5_QTL_METADATA_LABEL):
         self.hdf5 = get_hdf5_path(type="metadata",
                                   label=qtl_meta_hdf5)
         self.par_dir = get_hdf5_dir(type="metadata")
+
+    def select(self, key: str = None, filters: object = None,
+               many: bool = True, size: int = 20, start: int = 0):
+        """
+        Served from the in-memory metadata table, which is
+        reloaded when the metadata file changes.
+        """
+        self._check_hdf5_exists()
+        criteria = {} if filters is None else filters.dict(exclude_none=True)
+        records = metadata_tables.get(self.hdf5).select(criteria=criteria,
+                                                        start=start,
+                                                        size=size)
+        return SearchResult(data=records, many=many).result()
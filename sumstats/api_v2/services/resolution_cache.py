@@ -0,0 +1,161 @@
+"""
+In-memory resolution of genes, molecular traits and rsids to locations
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from sumstats.api_v2.config import HDF5_RESOLUTION_CACHE_SIZE
+from sumstats.api_v2.services.handle_pool import file_signature
+from sumstats.api_v2.services.storage import StorageInterface
+
+
+logger = logging.getLogger(__name__)
+
+
+class LocationIndex:
+    """
+    Maps values of the key fields to the chromosome and position of
+    the first record (in table order) holding them.
+
+    Each key field is kept as a sorted NumPy array with the record
+    numbers in the same order, searched with np.searchsorted.
+    Chromosomes are stored as categorical codes.
+    """
+
+    def __init__(self, frame: pd.DataFrame, fields: list):
+        frame = frame.drop_duplicates(subset=fields)
+        self.fields = fields
+        chromosome = pd.Categorical(frame['chromosome'].astype(str))
+        self.chromosomes = np.asarray(chromosome.categories, dtype=object)
+        self.chromosome_codes = chromosome.codes
+        self.positions = frame['position'].to_numpy(dtype=np.int64)
+        self.sorted_keys = {}
+        self.orders = {}
+        for field in fields:
+            values = self._key_array(frame[field])
+            order = np.argsort(values, kind='stable')
+            self.sorted_keys[field] = values[order]
+            self.orders[field] = order
+
+    def __len__(self) -> int:
+        return self.positions.size
+
+    @staticmethod
+    def _key_array(column: pd.Series) -> np.ndarray:
+        if pd.api.types.is_integer_dtype(column):
+            return column.to_numpy(dtype=np.int64)
+        return column.astype(str).to_numpy(dtype=str)
+
+    def lookup(self, criteria: dict):
+        """
+        (chromosome, position) of the first record matching all the
+        criteria, or None.
+        """
+        records = None
+        for field, value in criteria.items():
+            keys = self.sorted_keys[field]
+            try:
+                value = keys.dtype.type(value)
+            except ValueError:
+                return None
+            lo = np.searchsorted(keys, value, side='left')
+            hi = np.searchsorted(keys, value, side='right')
+            matched = self.orders[field][lo:hi]
+            records = (matched if records is None
+                       else np.intersect1d(records, matched))
+        if records is None or records.size == 0:
+            return None
+        record = records.min()
+        return (str(self.chromosomes[self.chromosome_codes[record]]),
+                int(self.positions[record]))
+
+
+class ResolutionCache:
+    """
+    Per-dataset LocationIndexes for the genomic_context and rsid
+    tables, loaded on first use and shared across requests.
+
+    An index is reloaded when its file changes on disk. At most
+    max_entries indexes are kept, least recently used first out, and
+    an index's load lock is dropped with it.
+    """
+
+    KEY_FIELDS = {'genomic_context': ['gene_id', 'molecular_trait_id'],
+                  'rsid': ['rsid']}
+    CHUNKSIZE = 1_000_000
+
+    def __init__(self, max_entries: int = None):
+        self.max_entries = max_entries or HDF5_RESOLUTION_CACHE_SIZE
+        self._entries = OrderedDict()
+        self._load_locks = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, path: str, key: str, criteria: dict):
+        return self.index(path=path, key=key).lookup(criteria)
+
+    def index(self, path: str, key: str) -> LocationIndex:
+        signature = file_signature(path)
+        entry_key = (path, key)
+        index = self._cached(entry_key, signature)
+        if index is not None:
+            return index
+        with self._lock:
+            load_lock = self._load_locks.setdefault(entry_key,
+                                                    threading.Lock())
+        with load_lock:
+            # another request may have loaded it while we waited
+            index = self._cached(entry_key, signature)
+            if index is None:
+                try:
+                    index = self._load(path=path, key=key)
+                except Exception:
+                    with self._lock:
+                        if entry_key not in self._entries:
+                            self._load_locks.pop(entry_key, None)
+                    raise
+                self._store(entry_key, signature, index)
+            return index
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._load_locks.clear()
+
+    def _cached(self, entry_key: tuple, signature: tuple):
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry is None or entry[0] != signature:
+                return None
+            self._entries.move_to_end(entry_key)
+            return entry[1]
+
+    def _store(self, entry_key: tuple, signature: tuple,
+               index: LocationIndex) -> None:
+        with self._lock:
+            self._entries[entry_key] = (signature, index)
+            self._entries.move_to_end(entry_key)
+            while len(self._entries) > self.max_entries:
+                evicted_key, _ = self._entries.popitem(last=False)
+                self._load_locks.pop(evicted_key, None)
+
+    def _load(self, path: str, key: str) -> LocationIndex:
+        fields = self.KEY_FIELDS[key]
+        columns = [*fields, 'chromosome', 'position']
+        chunks = [chunk.drop_duplicates(subset=fields)
+                  for chunk in StorageInterface.read_chunks(
+                      path=path,
+                      key=key,
+                      columns=columns,
+                      chunksize=self.CHUNKSIZE)]
+        frame = pd.concat(chunks) if chunks else pd.DataFrame(columns=columns)
+        index = LocationIndex(frame=frame, fields=fields)
+        logger.info(f"Loaded {len(index)} {key} locations from {path}")
+        return index
+
+
+resolution_cache = ResolutionCache()
@@ -0,0 +1,17 @@
+"""
+Storage interface selected by STORAGE_BACKEND
+"""
+
+from sumstats.api_v2.config import STORAGE_BACKEND
+from sumstats.api_v2.services.main import HDF5Interface
+
+
+if STORAGE_BACKEND == "parquet":
+    # pyarrow is only needed by deployments using it
+    from sumstats.api_v2.services.parquet import ParquetInterface
+    StorageInterface = ParquetInterface
+elif STORAGE_BACKEND == "hdf5":
+    StorageInterface = HDF5Interface
+else:
+    raise ValueError(f"Unknown STORAGE_BACKEND '{STORAGE_BACKEND}', "
+                     "expected 'hdf5' or 'parquet'")
@@ -0,0 +1,135 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import sumstats.api_v2.utils.helpers as helpers
+import sumstats.api_v2.cli.ingest as ingest
+from sumstats.api_v2.services.handle_pool import handle_pool
+from sumstats.api_v2.services.resolution_cache import resolution_cache
+
+
+# out of natural order on purpose
+CHROMOSOMES = ["MT", "10", "X", "2", "Y", "1"]
+
+
+def associations(variants: int = 40, traits: int = 3,
+                 seed: int = 0) -> pd.DataFrame:
+    """
+    Synthetic associations of variants on CHROMOSOMES, each tested
+    against traits molecular traits, in random row order. Positions
+    repeat, and r2 is partly missing.
+    """
+    rng = np.random.default_rng(seed)
+    frames = []
+    for chromosome in CHROMOSOMES:
+        position = rng.integers(1, 20_000, variants) * 10
+        ref = rng.choice(list("ACGT"), variants)
+        alt = rng.choice(list("ACGT"), variants)
+        variant = [f"chr{chromosome}_{p}_{r}_{a}"
+                   for p, r, a in zip(position, ref, alt)]
+        frames.append(pd.DataFrame({
+            "variant": np.repeat(variant, traits),
+            "rsid": np.repeat([f"rs{p}" for p in position], traits),
+            "position": np.repeat(position, traits),
+            "chromosome": chromosome,
+            "ref": np.repeat(ref, traits),
+            "alt": np.repeat(alt, traits),
+            "type": "SNP",
+            "molecular_trait_id": np.tile(
+                [f"ENSG{chromosome}{t:09d}" for t in range(traits)],
+                variants),
+            "gene_id": np.tile(
+                [f"ENSG{chromosome}{t:09d}" for t in range(traits)],
+                variants),
+        }))
+    df = pd.concat(frames, ignore_index=True)
+    n = len(df)
+    df = df.assign(pvalue=rng.random(n) ** 3,
+                   ac=rng.integers(1, 600, n),
+                   an=600,
+                   beta=rng.normal(size=n),
+                   maf=rng.random(n) / 2,
+                   median_tpm=rng.random(n) * 100,
+                   r2=np.where(rng.random(n) < 0.2, np.nan, rng.random(n)),
+                   se=rng.random(n))
+    return df.iloc[rng.permutation(n)].reset_index(drop=True)
+
+
+def write_tsv(path: str, df: pd.DataFrame) -> str:
+    df.to_csv(path, sep="\t", index=False)
+    return path
+
+
+def ingest_datasets(root: str, tsv_path: str) -> dict:
+    """
+    The same TSV ingested sorted (QTD000001) and in TSV order
+    (QTD000002) under root. Ingest reads small chunks, so that
+    sorting merges several runs.
+    """
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(helpers, "HDF5_ROOT_DIR", root)
+        mp.setattr(ingest, "CHUNKSIZE", 100)
+        ingest.qtl_sumstats_tsv_to_hdf5(tsv_path=tsv_path,
+                                        hdf5_label="QTD000001")
+        ingest.qtl_sumstats_tsv_to_hdf5(tsv_path=tsv_path,
+                                        hdf5_label="QTD000002",
+                                        sort=False)
+    return {"sorted": "QTD000001", "unsorted": "QTD000002"}
+
+
+def use_root(monkeypatch, root: str) -> None:
+    """
+    Points the v2 data and metadata directories at root, in this
+    process and in spawned worker processes.
+    """
+    monkeypatch.setattr(helpers, "HDF5_ROOT_DIR", root)
+    monkeypatch.setenv("HDF5_ROOT_DIR", root)
+
+
+@pytest.fixture(autouse=True)
+def _release_handles():
+    yield
+    handle_pool.close_all()
+    resolution_cache.clear()
+
+
+@pytest.fixture
+def hdf5_root(tmp_path, monkeypatch):
+    root = str(tmp_path / "hdf5")
+    use_root(monkeypatch, root)
+    return root
+
+
+@pytest.fixture(scope="session")
+def ingested(tmp_path_factory):
+    work_dir = tmp_path_factory.mktemp("v2")
+    tsv_path = write_tsv(str(work_dir / "QTD000001.all.tsv"),
+                         associations())
+    root = str(work_dir / "hdf5")
+    return root, ingest_datasets(root, tsv_path)
+
+
+@pytest.fixture
+def datasets(ingested, monkeypatch):
+    """
+    Labels of the shared sorted and unsorted datasets, which tests
+    must not modify.
+    """
+    root, labels = ingested
+    use_root(monkeypatch, root)
+    return labels
+
+
+@pytest.fixture
+def api(monkeypatch):
+    # the app logs to logs/, as in the docker image
+    os.makedirs("logs", exist_ok=True)
+    # pytest puts sumstats/api_v2 first on sys.path, where its config
+    # module hides the top level config package v1 imports
+    monkeypatch.syspath_prepend(os.getcwd())
+    from fastapi.testclient import TestClient
+    from sumstats.main import app
+
+    return TestClient(app)
@@ -0,0 +1,86 @@
+import os
+import shutil
+
+import pytest
+
+from sumstats.api_v2.utils.helpers import get_hdf5_path
+from sumstats.config import API_BASE, HAS_MORE_HEADER, NEXT_CURSOR_HEADER
+
+
+REGION = dict(pos="1:1-200000")
+
+
+def url(label):
+    return f"{API_BASE}/v2/datasets/{label}/associations"
+
+
+def cursor_pages(api, label, size, **params):
+    pages = []
+    params = dict(params, size=size)
+    while True:
+        response = api.get(url(label), params=params)
+        assert response.status_code == 200
+        pages.append(response)
+        if NEXT_CURSOR_HEADER not in response.headers:
+            return pages
+        params["cursor"] = response.headers[NEXT_CURSOR_HEADER]
+
+
+class TestDatasetAssociationsRoute(object):
+    @pytest.mark.parametrize("layout", ["sorted", "unsorted"])
+    @pytest.mark.parametrize("params", [REGION,
+                                        dict(REGION, nlog10p=1.3),
+                                        dict(gene_id="ENSG2000000001")])
+    def test_cursor_pages_match_offset_pages(self, api, datasets, layout,
+                                             params):
+        label = datasets[layout]
+        pages = cursor_pages(api, label, size=7, **params)
+        assert len(pages) > 2
+        for n, page in enumerate(pages):
+            offset_page = api.get(url(label),
+                                  params=dict(params, start=n * 7, size=7))
+            assert page.json() == offset_page.json()
+
+    def test_last_page_has_no_cursor(self, api, datasets):
+        pages = cursor_pages(api, datasets["sorted"], size=7, **REGION)
+        assert all(page.headers[HAS_MORE_HEADER] == "true"
+                   for page in pages[:-1])
+        assert all(len(page.json()) == 7 for page in pages[:-1])
+        last = pages[-1]
+        assert last.headers[HAS_MORE_HEADER] == "false"
+        assert NEXT_CURSOR_HEADER not in last.headers
+        assert 0 < len(last.json()) <= 7
+        assert {r["chromosome"] for page in pages
+                for r in page.json()} == {"1"}
+
+    def test_exactly_size_matches_is_one_page(self, api, datasets):
+        label = datasets["sorted"]
+        matches = api.get(url(label), params=dict(REGION, size=1000)).json()
+        response = api.get(url(label),
+                           params=dict(REGION, size=len(matches)))
+        assert response.json() == matches
+        assert response.headers[HAS_MORE_HEADER] == "false"
+        assert NEXT_CURSOR_HEADER not in response.headers
+
+    def test_cursor_of_a_replaced_file_returns_400(self, api, ingested,
+                                                   hdf5_root):
+        source_root, labels = ingested
+        path = get_hdf5_path(label="QTD000003", type="data")
+        os.makedirs(os.path.dirname(path))
+
+        def copy_of(label):
+            source = get_hdf5_path(label=label, type="data")
+            return os.path.join(source_root,
+                                os.path.relpath(source, hdf5_root))
+
+        shutil.copyfile(copy_of(labels["sorted"]), path)
+        first = api.get(url("QTD000003"), params={"size": 5})
+        cursor = first.headers[NEXT_CURSOR_HEADER]
+        # same rows, in another order: the cursor's row now holds
+        # another variant
+        shutil.copyfile(copy_of(labels["unsorted"]), path + ".tmp")
+        os.replace(path + ".tmp", path)
+        response = api.get(url("QTD000003"),
+                           params={"size": 5, "cursor": cursor})
+        assert response.status_code == 400
+        assert response.json() == {"message": "Invalid pagination cursor."}
@@ -0,0 +1,104 @@
+import os
+import pickle
+import subprocess
+import sys
+
+import pandas as pd
+import pytest
+
+from sumstats.api_v2.tests.conftest import associations, write_tsv
+
+
+BACKENDS = ["hdf5", "parquet"]
+REGION = dict(chromosome="1", position_start=1, position_end=200_000)
+QUERIES = {
+    "region": REGION,
+    "region_pvalue": dict(REGION, pvalue=0.2),
+    "chromosome_10": dict(chromosome="10", position_start=1,
+                          position_end=1_000_000),
+    "gene": dict(gene_id="ENSG2000000001"),
+    "trait_pvalue": dict(molecular_trait_id="ENSGX000000002", pvalue=0.5),
+}
+
+
+def dump(tsv_path: str, out_path: str) -> None:
+    """
+    Ingests the TSV with the configured STORAGE_BACKEND, then pickles
+    the pages of each query, followed by cursor and by start, with
+    their cursors. Runs in a subprocess, as the backend is chosen at
+    import time.
+    """
+    import sumstats.api_v2.cli.ingest as ingest
+    from sumstats.api_v2.config import STORAGE_BACKEND
+    from sumstats.api_v2.schemas.eqtl import RequestFilters
+    from sumstats.api_v2.services.qtl_data import QTLDataService
+
+    if STORAGE_BACKEND == "parquet":
+        import sumstats.api_v2.services.parquet as parquet
+        parquet.READ_BATCH_ROWS = 16
+    ingest.CHUNKSIZE = 500
+    ingest.qtl_sumstats_tsv_to_hdf5(tsv_path=tsv_path,
+                                    hdf5_label="QTD000001")
+
+    def page(filters, start=0, cursor=None):
+        service = QTLDataService(hdf5_label="QTD000001")
+        results_df = service.query(filters=RequestFilters(**filters),
+                                   start=start, size=9, cursor=cursor)
+        return results_df, service.next_cursor
+
+    pages = {}
+    for name, filters in QUERIES.items():
+        by_cursor = [page(filters)]
+        while by_cursor[-1][1] is not None:
+            by_cursor.append(page(filters, cursor=by_cursor[-1][1]))
+        by_start = [page(filters, start=9 * n)
+                    for n in range(len(by_cursor))]
+        pages[name] = {"cursor": by_cursor, "start": by_start}
+    with open(out_path, "wb") as f:
+        pickle.dump(pages, f)
+
+
+@pytest.fixture(scope="module")
+def pages(tmp_path_factory):
+    work_dir = tmp_path_factory.mktemp("backends")
+    tsv_path = write_tsv(str(work_dir / "QTD000001.all.tsv"),
+                         associations(variants=80))
+    pages = {}
+    for backend in BACKENDS:
+        out_path = str(work_dir / f"{backend}.pickle")
+        env = dict(os.environ,
+                   STORAGE_BACKEND=backend,
+                   HDF5_ROOT_DIR=str(work_dir / backend),
+                   PARQUET_ROW_GROUP_ROWS="64")
+        subprocess.run(
+            [sys.executable, "-c",
+             "import sys; from sumstats.api_v2.tests.test_backends "
+             "import dump; dump(*sys.argv[1:])", tsv_path, out_path],
+            env=env, check=True, capture_output=True)
+        with open(out_path, "rb") as f:
+            pages[backend] = pickle.load(f)
+    return pages
+
+
+class TestBackendParity(object):
+    @pytest.mark.parametrize("query", QUERIES)
+    @pytest.mark.parametrize("paging", ["cursor", "start"])
+    def test_pages_match(self, pages, query, paging):
+        hdf5_pages = pages["hdf5"][query][paging]
+        parquet_pages = pages["parquet"][query][paging]
+        assert len(hdf5_pages) > 1
+        assert len(hdf5_pages) == len(parquet_pages)
+        for (hdf5_df, hdf5_cursor), (parquet_df, parquet_cursor) in zip(
+                hdf5_pages, parquet_pages):
+            # hdf5 keeps the TSV row index, which no response exposes
+            pd.testing.assert_frame_equal(hdf5_df.reset_index(drop=True),
+                                          parquet_df.reset_index(drop=True))
+            assert hdf5_cursor == parquet_cursor
+
+    @pytest.mark.parametrize("backend", BACKENDS)
+    def test_cursor_pages_match_start_pages(self, pages, backend):
+        for query in QUERIES:
+            by_cursor = pages[backend][query]["cursor"]
+            by_start = pages[backend][query]["start"]
+            for (cursor_df, _), (start_df, _) in zip(by_cursor, by_start):
+                pd.testing.assert_frame_equal(cursor_df, start_df)
@@ -0,0 +1,72 @@
+import os
+import time
+
+import pytest
+
+from sumstats.api_v2.cli import batch
+
+
+def fake_convert(tsv_path: str, hdf5_label: str, sort: bool = True) -> dict:
+    """
+    Stands in for convert_dataset in the worker processes: CRASH
+    datasets kill their worker, the others take a moment.
+    """
+    if hdf5_label.startswith("CRASH"):
+        os._exit(1)
+    time.sleep(0.5)
+    return {"label": hdf5_label, "tsv": tsv_path, "rows": 1,
+            "seconds": 0.5, "pid": os.getpid()}
+
+
+@pytest.fixture
+def tsv_dir(tmp_path):
+    for name in ["QTD000001.all.tsv", "QTD000002.all.tsv.gz",
+                 "QTD000003.tsv.done", "QTD000004.tsv.bak", "README.md"]:
+        (tmp_path / name).write_text("variant\n")
+    return tmp_path
+
+
+@pytest.fixture
+def jobs(tsv_dir, hdf5_root, monkeypatch):
+    monkeypatch.setattr(batch, "convert_dataset", fake_convert)
+    tsv_path = str(tsv_dir / "QTD000001.all.tsv")
+    return [(tsv_path, label) for label in
+            ["QTD1", "QTD2", "CRASH1", "QTD3", "QTD4"]]
+
+
+class TestJobsFromDir(object):
+    def test_matches_tsv_suffixes_only(self, tsv_dir):
+        assert batch.jobs_from_dir(str(tsv_dir)) == [
+            (str(tsv_dir / "QTD000001.all.tsv"), "QTD000001"),
+            (str(tsv_dir / "QTD000002.all.tsv.gz"), "QTD000002"),
+        ]
+
+
+class TestBrokenPool(object):
+    def test_other_conversions_are_retried(self, jobs):
+        results = batch.BatchConverter(workers=3).run(jobs)
+        status = {r["label"]: r["status"] for r in results}
+        assert status == {"QTD1": "done", "QTD2": "done", "QTD3": "done",
+                          "QTD4": "done", "CRASH1": "failed"}
+        assert "BrokenProcessPool" in next(
+            r["error"] for r in results if r["label"] == "CRASH1")
+
+    def test_retried_conversions_run_on_their_own(self, jobs, monkeypatch):
+        converter = batch.BatchConverter(workers=3)
+        started = []
+        next_job = converter._next_job
+
+        def recording_next_job(pending, running, alone):
+            job = next_job(pending, running, alone)
+            if job is not None:
+                started.append((job[1], len(running), set(alone)))
+            return job
+
+        monkeypatch.setattr(converter, "_next_job", recording_next_job)
+        converter.run(jobs)
+        # which other conversions were running when CRASH1 broke the
+        # pool depends on timing
+        retried = [(label, others) for label, others, alone in started
+                   if label in alone]
+        assert "CRASH1" in {label for label, _ in retried}
+        assert all(others == 0 for _, others in retried)
@@ -0,0 +1,74 @@
+import json
+import sys
+
+import pandas as pd
+import pytest
+
+from sumstats.api_v2.cli import benchmark
+from sumstats.api_v2.tests.conftest import ingest_datasets
+
+
+@pytest.fixture
+def tsv(tmp_path, monkeypatch):
+    monkeypatch.setattr(benchmark, "GENERATE_CHUNK_ROWS", 40)
+    path = str(tmp_path / "bench.tsv")
+    benchmark.generate_tsv(path, n_rows=1000, seed=1)
+    return pd.read_csv(path, sep="\t", dtype={"chromosome": str})
+
+
+class TestGenerateTsv(object):
+    def test_rows_are_not_sorted(self, tsv):
+        assert len(tsv) == 1000
+        assert not tsv["chromosome"].is_monotonic_increasing
+        chr1 = tsv[tsv["chromosome"] == "1"]
+        assert not chr1["position"].is_monotonic_increasing
+
+    def test_variants_are_unique(self, tsv):
+        assert set(tsv["chromosome"]) == set(benchmark.CHROMOSOME_LENGTHS_MB)
+        assert (tsv.groupby("variant").size() == 4).all()
+        by_position = tsv.groupby(["chromosome", "position"])
+        assert (by_position["variant"].nunique() == 1).all()
+
+
+class TestRunQuery(object):
+    def test_no_results_is_an_empty_page(self, datasets):
+        rows, cursor, empty = benchmark.run_query(
+            datasets["sorted"], dict(variant="chr1_5_A_G"))
+        assert (rows, cursor, empty) == (0, None, True)
+
+    def test_other_errors_are_raised(self, datasets):
+        with pytest.raises(ValueError, match="Invalid pagination cursor"):
+            benchmark.run_query(datasets["sorted"],
+                                dict(chromosome="1", position_start=1,
+                                     position_end=200_000),
+                                cursor="not-a-cursor")
+
+    def test_sampled_records_are_found(self, tmp_path, hdf5_root,
+                                       monkeypatch):
+        monkeypatch.setattr(benchmark, "GENERATE_CHUNK_ROWS", 100)
+        tsv_path = str(tmp_path / "bench.tsv")
+        benchmark.generate_tsv(tsv_path, n_rows=400)
+        labels = ingest_datasets(hdf5_root, tsv_path)
+        records = benchmark.sample_records(labels["sorted"], n=3, seed=0)
+        for record in records.to_dict("records"):
+            shapes = benchmark.query_shapes(record, deep_start=0)
+            for shape in ["region", "variant", "rsid", "gene"]:
+                filters, start, size = shapes[shape]
+                rows, _, empty = benchmark.run_query(labels["sorted"],
+                                                     filters, start=start,
+                                                     size=size)
+                assert rows > 0 and not empty
+
+
+class TestMain(object):
+    def test_stdout_is_the_json_report(self, tmp_path, hdf5_root,
+                                       monkeypatch, capsys):
+        monkeypatch.setattr(benchmark, "GENERATE_CHUNK_ROWS", 100)
+        monkeypatch.setattr(sys, "argv", [
+            "benchmark", "--rows", "400", "--repeat", "2",
+            "--cursor-pages", "2", "--work-dir", str(tmp_path)])
+        benchmark.main()
+        out, err = capsys.readouterr()
+        report = json.loads(out)
+        assert [d["rows"] for d in report["datasets"]] == [400]
+        assert err
@@ -0,0 +1,107 @@
+import asyncio
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+from sumstats.api_v2.config import DATASET_EXT
+from sumstats.api_v2.schemas.eqtl import RequestFilters
+from sumstats.api_v2.services.cross_dataset import (cross_dataset_search,
+                                                    search_dataset)
+from sumstats.api_v2.utils.helpers import get_hdf5_dir
+from sumstats.config import (API_BASE, DATASETS_SEARCHED_HEADER,
+                             HAS_MORE_HEADER)
+
+
+GENE = dict(gene_id="ENSG2000000001")
+
+
+@pytest.fixture
+def search():
+    yield cross_dataset_search
+    cross_dataset_search.shutdown()
+
+
+def dataset_matches(api, label):
+    return api.get(f"{API_BASE}/v2/datasets/{label}/associations",
+                   params=dict(GENE, size=1000)).json()
+
+
+class TestAssociationsRoute(object):
+    url = f"{API_BASE}/v2/associations"
+
+    def test_stops_after_size_results(self, api, datasets, search):
+        matches = dataset_matches(api, datasets["sorted"])
+        response = api.get(self.url, params=dict(GENE, size=3))
+        assert response.status_code == 200
+        assert response.headers[HAS_MORE_HEADER] == "true"
+        assert response.headers[DATASETS_SEARCHED_HEADER] == "1/2"
+        assert [r["dataset_id"] for r in response.json()] == [
+            datasets["sorted"]] * 3
+        assert [r["variant"] for r in response.json()] == [
+            r["variant"] for r in matches[:3]]
+
+    def test_exactly_size_results_has_no_more(self, api, datasets, search):
+        matches = dataset_matches(api, datasets["sorted"])
+        response = api.get(self.url,
+                           params=dict(GENE, size=2 * len(matches)))
+        assert len(response.json()) == 2 * len(matches)
+        assert response.headers[HAS_MORE_HEADER] == "false"
+        assert response.headers[DATASETS_SEARCHED_HEADER] == "2/2"
+
+    def test_one_result_short_has_more(self, api, datasets, search):
+        matches = dataset_matches(api, datasets["sorted"])
+        response = api.get(self.url,
+                           params=dict(GENE, size=2 * len(matches) - 1))
+        assert len(response.json()) == 2 * len(matches) - 1
+        assert response.headers[HAS_MORE_HEADER] == "true"
+        assert response.headers[DATASETS_SEARCHED_HEADER] == "2/2"
+
+    def test_needs_a_variant_region_or_gene_filter(self, api, datasets):
+        response = api.get(self.url, params={"nlog10p": 2})
+        assert response.status_code == 400
+
+
+class TestSearchDataset(object):
+    @pytest.mark.parametrize("filters", [
+        dict(gene_id="ENSG9999999999"),
+        dict(chromosome="1", position_start=900_000_000,
+             position_end=900_000_100),
+    ])
+    def test_no_match_is_an_empty_frame(self, datasets, filters):
+        assert search_dataset(datasets["sorted"], filters, size=3).empty
+
+    def test_other_errors_are_raised(self, datasets):
+        with pytest.raises(ValueError, match="Query is not permitted"):
+            search_dataset(datasets["sorted"], dict(pvalue=0.1), size=3)
+
+
+@pytest.fixture
+def corrupt_dataset(hdf5_root):
+    data_dir = get_hdf5_dir(type="data")
+    os.makedirs(data_dir)
+    with open(os.path.join(data_dir, "QTD000009" + DATASET_EXT), "w") as f:
+        f.write("not a dataset")
+    return "QTD000009"
+
+
+class TestSearchErrors(object):
+    def test_a_failed_dataset_fails_the_search(self, corrupt_dataset,
+                                               search):
+        with pytest.raises(Exception, match=corrupt_dataset):
+            asyncio.run(search.search(labels=[corrupt_dataset],
+                                      filters=RequestFilters(**GENE),
+                                      size=3))
+
+    def test_a_failed_dataset_returns_500(self, api, corrupt_dataset,
+                                          search):
+        api = TestClient(api.app, raise_server_exceptions=False)
+        response = api.get(f"{API_BASE}/v2/associations", params=GENE)
+        assert response.status_code == 500
+
+
+class TestLifespan(object):
+    def test_worker_processes_start_with_the_first_search(self, api,
+                                                          search):
+        with TestClient(api.app):
+            assert search._executor is None
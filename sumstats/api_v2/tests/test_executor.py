@@ -0,0 +1,98 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import sumstats.api_v2.routers.eqtl as routes_v2
+from sumstats.api_v2.services.executor import HDF5Executor
+from sumstats.config import API_BASE
+from sumstats.dependencies.error_classes import RequestTimedOut, ServiceBusy
+
+
+def wait_until_idle(executor, timeout=5):
+    deadline = time.monotonic() + timeout
+    while executor.in_flight and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return executor.in_flight == 0
+
+
+@pytest.fixture
+def executor():
+    executor = HDF5Executor(max_workers=1, queue_size=1, timeout=0.2)
+    yield executor
+    executor.shutdown()
+
+
+@pytest.fixture
+def release():
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+class TestHDF5Executor(object):
+    def test_runs_calls_off_the_event_loop(self, executor):
+        async def main():
+            return await executor.run(threading.current_thread)
+
+        assert asyncio.run(main()).name.startswith("hdf5")
+        assert executor.in_flight == 0
+
+    def test_refuses_calls_once_the_queue_is_full(self, executor, release):
+        async def main():
+            # one call runs, one waits for the thread
+            waiting = [asyncio.ensure_future(executor.run(release.wait))
+                       for _ in range(2)]
+            await asyncio.sleep(0.05)
+            with pytest.raises(ServiceBusy):
+                await executor.run(release.wait)
+            release.set()
+            await asyncio.gather(*waiting)
+
+        asyncio.run(main())
+        assert executor.in_flight == 0
+
+    def test_times_out_slow_calls(self, executor, release):
+        async def main():
+            with pytest.raises(RequestTimedOut):
+                await executor.run(release.wait)
+
+        asyncio.run(main())
+        # the running call keeps its slot until it ends
+        assert executor.in_flight == 1
+        release.set()
+        assert wait_until_idle(executor)
+
+    def test_cancels_queued_calls_that_time_out(self, executor, release):
+        calls = []
+
+        async def main():
+            running = asyncio.ensure_future(executor.run(release.wait))
+            await asyncio.sleep(0.05)
+            with pytest.raises(RequestTimedOut):
+                await executor.run(calls.append, "queued")
+            with pytest.raises(RequestTimedOut):
+                await running
+
+        asyncio.run(main())
+        # the queued call was cancelled and never ran
+        assert executor.in_flight == 1
+        release.set()
+        assert wait_until_idle(executor)
+        assert calls == []
+
+
+class TestExecutorErrors(object):
+    url = f"{API_BASE}/v2/datasets"
+
+    @pytest.mark.parametrize("error, status_code", [(ServiceBusy, 503),
+                                                    (RequestTimedOut, 504)])
+    def test_status_codes(self, api, monkeypatch, error, status_code):
+        async def run(fn, *args, **kwargs):
+            raise error()
+
+        monkeypatch.setattr(routes_v2.hdf5_executor, "run", run)
+        response = api.get(self.url)
+        assert response.status_code == status_code
+        assert response.json() == {"message": error().message}
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from sumstats.api_v2.cli.external_sort import ExternalSort
+from sumstats.api_v2.utils.helpers import chromosome_sort_key
+from sumstats.api_v2.tests.conftest import associations
+
+
+BY = ["chromosome", "position", "molecular_trait_id"]
+
+
+def external_sort(chunks, tmp_path, buffer_rows=50) -> pd.DataFrame:
+    with ExternalSort(by=BY, scratch_dir=str(tmp_path),
+                      buffer_rows=buffer_rows) as sorter:
+        for chunk in chunks:
+            sorter.add(chunk)
+        return pd.concat(sorter.sorted_chunks())
+
+
+def in_memory_sort(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The stable sort of df by BY, with chromosomes in natural order.
+    """
+    key = df["chromosome"].map(chromosome_sort_key)
+    return df.assign(_key=key).sort_values(
+        ["_key", "position", "molecular_trait_id"],
+        kind="stable").drop(columns="_key")
+
+
+def split(df: pd.DataFrame, rows: int) -> list:
+    return [df[i:i + rows] for i in range(0, len(df), rows)]
+
+
+@pytest.fixture
+def df():
+    return associations(variants=20, traits=2, seed=3)
+
+
+class TestExternalSort(object):
+    @pytest.mark.parametrize("buffer_rows", [30, 10_000])
+    def test_matches_an_in_memory_sort(self, df, tmp_path, buffer_rows):
+        result = external_sort(split(df, 40), tmp_path, buffer_rows)
+        pd.testing.assert_frame_equal(result, in_memory_sort(df))
+
+    def test_chromosomes_are_in_natural_order(self, df, tmp_path):
+        result = external_sort(split(df, 40), tmp_path)
+        chromosomes = list(dict.fromkeys(result["chromosome"]))
+        assert chromosomes == ["1", "2", "10", "MT", "X", "Y"]
+
+    def test_equal_keys_keep_the_order_they_were_added_in(self, df,
+                                                          tmp_path):
+        # every key is repeated in each run, so ties span runs
+        df = pd.concat([df[:100].assign(run=run) for run in range(5)],
+                       ignore_index=True)
+        chunks = [chunk.sample(frac=1, random_state=n)
+                  for n, chunk in enumerate(split(df, len(df) // 5))]
+        result = external_sort(chunks, tmp_path, buffer_rows=30)
+        for _, rows in result.groupby(BY, sort=False):
+            assert list(rows["run"]) == list(range(5))
+        pd.testing.assert_frame_equal(result,
+                                      in_memory_sort(pd.concat(
+                                          chunks, ignore_index=True)))
+
+    def test_missing_trait_ids_sort_last(self, df, tmp_path):
+        df = df.assign(molecular_trait_id=df["molecular_trait_id"].where(
+            np.arange(len(df)) % 3 != 0, np.nan))
+        result = external_sort(split(df, 40), tmp_path, buffer_rows=20)
+        # missing values are read back from the runs as object columns
+        pd.testing.assert_frame_equal(result, in_memory_sort(df),
+                                      check_dtype=False)
+        position = result.groupby(["chromosome", "position"], sort=False)
+        assert position["molecular_trait_id"].apply(
+            lambda ids: ids.isna().is_monotonic_increasing).all()
+
+    def test_scratch_file_is_removed(self, df, tmp_path):
+        external_sort(split(df, 40), tmp_path)
+        assert list(tmp_path.iterdir()) == []
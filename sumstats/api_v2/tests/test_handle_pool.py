@@ -0,0 +1,94 @@
+import os
+
+import pandas as pd
+import pytest
+
+from sumstats.api_v2.services.handle_pool import HDF5HandlePool
+
+
+def write_h5(path, rows=3):
+    pd.DataFrame({"a": range(rows)}).to_hdf(path, key="t", format="table")
+
+
+def read(pool, path):
+    with pool.store(path) as store:
+        return store, len(store.select("t"))
+
+
+@pytest.fixture
+def files(tmp_path):
+    paths = [str(tmp_path / f"{name}.h5") for name in "abc"]
+    for path in paths:
+        write_h5(path)
+    return paths
+
+
+@pytest.fixture
+def pool():
+    pool = HDF5HandlePool(max_handles=2)
+    yield pool
+    pool.close_all()
+
+
+class TestHDF5HandlePool(object):
+    def test_reuses_open_handles(self, pool, files):
+        first, _ = read(pool, files[0])
+        second, _ = read(pool, files[0])
+        assert first is second
+        assert first.is_open
+        assert len(pool) == 1
+
+    def test_evicts_least_recently_used(self, pool, files):
+        a, _ = read(pool, files[0])
+        b, _ = read(pool, files[1])
+        read(pool, files[0])
+        c, _ = read(pool, files[2])
+        assert len(pool) == 2
+        assert a.is_open and c.is_open
+        assert not b.is_open
+
+    def test_evicted_handle_in_use_closes_on_checkin(self, files):
+        pool = HDF5HandlePool(max_handles=1)
+        with pool.store(files[0]) as a:
+            read(pool, files[1])
+            assert a.is_open
+            assert len(a.select("t")) == 3
+        assert not a.is_open
+        pool.close_all()
+
+    def test_reopens_a_replaced_file(self, pool, files, tmp_path):
+        old, _ = read(pool, files[0])
+        replacement = str(tmp_path / "new.h5")
+        write_h5(replacement, rows=5)
+        os.replace(replacement, files[0])
+        new, rows = read(pool, files[0])
+        assert new is not old
+        assert not old.is_open
+        assert rows == 5
+
+    def test_reopens_a_file_rewritten_in_place(self, pool, files, tmp_path):
+        old, _ = read(pool, files[0])
+        inode = os.stat(files[0]).st_ino
+        other = str(tmp_path / "other.h5")
+        write_h5(other, rows=500)
+        with open(other, "rb") as src, open(files[0], "wb") as dst:
+            dst.write(src.read())
+        assert os.stat(files[0]).st_ino == inode
+        new, rows = read(pool, files[0])
+        assert new is not old
+        assert not old.is_open
+        assert rows == 500
+
+    def test_reopens_on_mtime_change(self, pool, files):
+        old, _ = read(pool, files[0])
+        stat = os.stat(files[0])
+        os.utime(files[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        new, _ = read(pool, files[0])
+        assert new is not old
+        assert not old.is_open
+
+    def test_invalidate_closes_the_handle(self, pool, files):
+        old, _ = read(pool, files[0])
+        pool.invalidate(files[0])
+        assert len(pool) == 0
+        assert not old.is_open
@@ -0,0 +1,87 @@
+import pandas as pd
+import pytest
+
+from sumstats.api_v2.schemas.eqtl import RequestFilters
+from sumstats.api_v2.services.qtl_data import QTLDataService
+from sumstats.api_v2.tests.conftest import associations
+
+
+def query(label, start=0, size=20, cursor=None, **filters):
+    service = QTLDataService(hdf5_label=label)
+    results_df = service.query(filters=RequestFilters(**filters),
+                               start=start, size=size, cursor=cursor)
+    return results_df, service.next_cursor
+
+
+REGION = dict(chromosome="1", position_start=1, position_end=200_000)
+
+
+class TestStart(object):
+    @pytest.mark.parametrize("layout", ["sorted", "unsorted"])
+    def test_start_skips_matches_not_rows(self, datasets, layout):
+        label = datasets[layout]
+        matches, _ = query(label, size=1000, pvalue=0.1, **REGION)
+        assert 10 < len(matches) < 100
+        page, _ = query(label, start=3, size=4, pvalue=0.1, **REGION)
+        pd.testing.assert_frame_equal(page, matches[3:7])
+
+    def test_start_past_the_last_match(self, datasets):
+        matches, _ = query(datasets["sorted"], size=1000, pvalue=0.1,
+                           **REGION)
+        with pytest.raises(ValueError, match="No results"):
+            query(datasets["sorted"], start=len(matches), pvalue=0.1,
+                  **REGION)
+
+
+def all_matches(label, **filters) -> pd.DataFrame:
+    try:
+        results_df, _ = query(label, size=10_000, **filters)
+    except ValueError as e:
+        if str(e) != "No results":
+            raise
+        return pd.DataFrame()
+    return results_df.sort_values(
+        ["chromosome", "position", "molecular_trait_id"]).reset_index(
+            drop=True)
+
+
+DATA = associations()
+VARIANT = DATA["variant"].iloc[0]
+
+
+class TestLayouts(object):
+    @pytest.mark.parametrize("filters", [
+        REGION,
+        dict(chromosome="10", position_start=50_000, position_end=150_000),
+        dict(gene_id="ENSG2000000001"),
+        dict(molecular_trait_id="ENSGX000000002"),
+        dict(variant=VARIANT),
+        dict(REGION, pvalue=0.05),
+        dict(gene_id="ENSGMT000000001", pvalue=0.2),
+    ])
+    def test_sorted_and_unsorted_match(self, datasets, filters):
+        sorted_matches = all_matches(datasets["sorted"], **filters)
+        assert len(sorted_matches) > 0
+        pd.testing.assert_frame_equal(
+            sorted_matches, all_matches(datasets["unsorted"], **filters))
+
+    @pytest.mark.parametrize("chromosome", ["1", "2", "10", "MT", "X", "Y"])
+    def test_region_spanning_a_whole_chromosome(self, datasets, chromosome):
+        # the neighbouring chromosomes in the table hold positions in
+        # the same range
+        matches = all_matches(datasets["sorted"], chromosome=chromosome,
+                              position_start=1, position_end=1_000_000)
+        expected = DATA[DATA["chromosome"] == chromosome]
+        assert len(matches) == len(expected)
+        assert set(matches["chromosome"]) == {chromosome}
+
+    def test_region_past_the_end_of_a_chromosome(self, datasets):
+        last = DATA.loc[DATA["chromosome"] == "2", "position"].max()
+        for layout in ["sorted", "unsorted"]:
+            matches = all_matches(datasets[layout], chromosome="2",
+                                  position_start=last - 100,
+                                  position_end=last + 500_000)
+            assert set(matches["position"]) == {last}
+            assert len(all_matches(datasets[layout], chromosome="2",
+                                   position_start=last + 1,
+                                   position_end=last + 500_000)) == 0
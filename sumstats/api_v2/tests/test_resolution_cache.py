@@ -0,0 +1,48 @@
+import pytest
+
+from sumstats.api_v2.services.resolution_cache import ResolutionCache
+from sumstats.api_v2.utils.helpers import get_hdf5_path
+
+
+@pytest.fixture
+def paths(datasets):
+    return [get_hdf5_path(label=label, type="data")
+            for label in datasets.values()]
+
+
+class TestResolutionCache(object):
+    def test_evicts_load_locks_with_entries(self, paths):
+        cache = ResolutionCache(max_entries=2)
+        for path in paths:
+            for key in ResolutionCache.KEY_FIELDS:
+                cache.index(path=path, key=key)
+                assert set(cache._load_locks) == set(cache._entries)
+        assert list(cache._entries) == [
+            (paths[-1], "genomic_context"), (paths[-1], "rsid")]
+
+    def test_keeps_the_most_recently_used(self, paths):
+        cache = ResolutionCache(max_entries=2)
+        first = cache.index(path=paths[0], key="rsid")
+        cache.index(path=paths[1], key="rsid")
+        assert cache.index(path=paths[0], key="rsid") is first
+        cache.index(path=paths[1], key="genomic_context")
+        assert (paths[1], "rsid") not in cache._entries
+        assert cache.index(path=paths[0], key="rsid") is first
+
+    def test_failed_load_drops_its_lock(self, paths, monkeypatch):
+        cache = ResolutionCache(max_entries=2)
+
+        def fail(path, key):
+            raise OSError("unreadable")
+
+        monkeypatch.setattr(cache, "_load", fail)
+        with pytest.raises(OSError):
+            cache.index(path=paths[0], key="rsid")
+        assert cache._load_locks == {}
+
+    def test_clear_drops_load_locks(self, paths):
+        cache = ResolutionCache(max_entries=2)
+        cache.index(path=paths[0], key="rsid")
+        cache.clear()
+        assert cache._entries == {}
+        assert cache._load_locks == {}
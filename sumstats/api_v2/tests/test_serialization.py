@@ -0,0 +1,98 @@
+from typing import List
+
+import numpy as np
+import orjson
+import pandas as pd
+import pytest
+from pydantic import TypeAdapter
+
+from sumstats.api_v2.schemas.eqtl import (DatasetVariantAssociation,
+                                          RequestFilters,
+                                          VariantAssociation)
+from sumstats.api_v2.services.qtl_data import QTLDataService
+from sumstats.api_v2.utils.serialization import frame_to_json
+from sumstats.config import API_BASE
+
+
+def pydantic_body(results_df: pd.DataFrame, model) -> bytes:
+    """
+    The body the routes returned when they validated the records
+    against their response_model.
+    """
+    adapter = TypeAdapter(List[model])
+    records = adapter.validate_python(results_df.to_dict("records"))
+    return orjson.dumps(adapter.dump_python(records, mode="json"))
+
+
+def frame(n: int = 5) -> pd.DataFrame:
+    """
+    Values that JSON encoders format differently, missing values,
+    and ints stored as floats.
+    """
+    return pd.DataFrame({
+        "variant": [f"chr1_{p}_A_\"G\"," for p in range(n)],
+        "chromosome": "1",
+        "position": np.arange(1, n + 1, dtype=np.int64) * 10,
+        "pvalue": [1.2e-30, np.nan, 0.1 + 0.2, 3e-300, 1.0][:n],
+        "beta": np.array([-0.1234567890123, 0, 2.5, -1e-7, 7][:n]),
+        "ac": np.array([1.0, 2.0, 3.0, 4.0, 5.0][:n]),
+        "r2": np.float32(0.1),
+        "rsid": pd.Series(["rs1", None, "rs3", None, "rs5"][:n],
+                          dtype=object),
+        "dataset_id": "QTD000001",
+    })
+
+
+class TestFrameToJson(object):
+    @pytest.mark.parametrize("model", [VariantAssociation,
+                                       DatasetVariantAssociation])
+    def test_body_matches_response_model_body(self, model):
+        assert frame_to_json(frame(), model) == pydantic_body(frame(),
+                                                              model)
+
+    def test_nan_and_missing_fields_are_null(self):
+        # NaN in int and str columns failed response_model validation
+        results_df = frame().assign(an=[600, np.nan, 600, 600, 600],
+                                    rsid=["rs1", np.nan, "rs3", None, "rs5"])
+        records = orjson.loads(frame_to_json(results_df, VariantAssociation))
+        assert list(records[1]) == list(VariantAssociation.model_fields)
+        assert records[1]["pvalue"] is None
+        assert records[1]["maf"] is None
+        assert [r["an"] for r in records] == [600, None, 600, 600, 600]
+        assert [r["rsid"] for r in records] == ["rs1", None, "rs3", None,
+                                                "rs5"]
+
+    def test_missing_ints_match_response_model_body(self):
+        results_df = frame().assign(ac=[1.0, np.nan, 3.0, np.nan, 5.0])
+        # the routes passed missing values to validation as None
+        validated_df = results_df.astype(object).where(
+            results_df.notna(), None)
+        body = frame_to_json(results_df, VariantAssociation)
+        assert body == pydantic_body(validated_df, VariantAssociation)
+        assert b'"ac":1,' in body and b'"ac":null,' in body
+
+    def test_empty_frame(self):
+        assert frame_to_json(frame(0), VariantAssociation) == b"[]"
+
+
+REGION = dict(chromosome="1", position_start=1, position_end=200_000)
+
+
+class TestAssociationsBody(object):
+    @pytest.mark.parametrize("params, filters", [
+        (dict(pos="1:1-200000"), REGION),
+        (dict(pos="1:1-200000", nlog10p=1.3),
+         dict(REGION, pvalue=10 ** -1.3)),
+    ])
+    @pytest.mark.parametrize("start", [0, 3])
+    def test_body_matches_response_model_body(self, api, datasets,
+                                              params, filters, start):
+        label = datasets["sorted"]
+        response = api.get(f"{API_BASE}/v2/datasets/{label}/associations",
+                           params=dict(params, start=start, size=50))
+        results_df = QTLDataService(hdf5_label=label).query(
+            filters=RequestFilters(**filters), start=start, size=50)
+        assert results_df["r2"].isna().any()
+        assert response.headers["content-type"] == "application/json"
+        assert response.content == pydantic_body(results_df,
+                                                 VariantAssociation)
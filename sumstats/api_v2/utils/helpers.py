@@ -4,12 +4,16 @@ General helper functions
 
 
 import os
+import json
+import base64
+from functools import lru_cache
+
 import numpy as np
 import pathlib
 from sumstats.api_v2.config import (HDF5_ROOT_DIR,
                                     HDF5_DATA_DIR,
                                     HDF5_METADATA_DIR,
-                                    HDF5_EXT,
+                                    DATASET_EXT,
                                     PA_DTYPES)
 
 
@@ -31,16 +35,37 @@ def get_hdf5_dir(type=None):
 
 
 def _construct_path(par_dir, label):
-    return os.path.join(par_dir, label + HDF5_EXT)
+    return os.path.join(par_dir, label + DATASET_EXT)
 
 
 def mkdir(dir):
     pathlib.Path(dir).mkdir(parents=True, exist_ok=True)
 
 
+def disk_bytes(path) -> int:
+    """
+    Size of a file, or of all the files under a directory.
+    """
+    if os.path.isdir(path):
+        return sum(f.stat().st_size for f in pathlib.Path(path).rglob("*")
+                   if f.is_file())
+    return os.path.getsize(path)
+
+
 def properties_from_model(model, key) -> dict:
+    """
+    model is a pydantic model class or instance. The maps are
+    built once per model class and key, since generating the
+    JSON schema is slow.
+    """
+    model_class = model if isinstance(model, type) else type(model)
+    return dict(_properties_from_model_class(model_class, key))
+
+
+@lru_cache(maxsize=None)
+def _properties_from_model_class(model_class, key) -> dict:
     props = {}
-    for field_name, field in model.schema()["properties"].items():
+    for field_name, field in model_class.schema()["properties"].items():
         if key in field:
             props[field_name] = field.get(key)
     return props
@@ -57,3 +82,31 @@ def pval_to_neg_log_10_pval(value: float) -> float:
 
 def neg_log_10_pval_to_pval(value: float) -> float:
     return 10 ** -value
+
+
+def encode_cursor(position: int, row: int) -> str:
+    """
+    Opaque continuation token from the (position, row) key of the
+    last record of a page.
+    """
+    payload = json.dumps({"position": position, "row": row})
+    return base64.urlsafe_b64encode(payload.encode()).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        position = payload["position"]
+        return (None if position is None else int(position),
+                int(payload["row"]))
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError("Invalid pagination cursor.") from e
+
+
+def chromosome_sort_key(chromosome: str) -> str:
+    """
+    Key putting chromosomes in natural order: 1, 2, ..., 22, then
+    MT, X and Y.
+    """
+    chromosome = str(chromosome)
+    return chromosome.zfill(2) if chromosome.isdigit() else chromosome
@@ -0,0 +1,107 @@
+import argparse
+import asyncio
+import json
+
+from sumstats.api_v3.db.client import create_mongo_client
+from sumstats.api_v3.db.indexes import ensure_indexes, index_report
+from sumstats.api_v3.db.repositories.studies import list_studies
+from sumstats.api_v3.db.routing import (
+    build_study_routing,
+    ensure_routing_indexes,
+)
+
+
+def get_args():
+    argparser = argparse.ArgumentParser(
+        description="Maintenance tasks for the API v3 MongoDB database"
+    )
+    subparsers = argparser.add_subparsers(dest="command", required=True)
+
+    routing = subparsers.add_parser(
+        "routing", help="build the study routing index"
+    )
+    routing.add_argument(
+        "--study-id",
+        nargs="+",
+        help="studies to (re)build, defaults to all studies",
+    )
+    routing.add_argument(
+        "--expected-items",
+        type=int,
+        help=(
+            "expected distinct rsids/variants per study, used to size "
+            "the bloom filters. Defaults to the number of distinct "
+            "values of each field."
+        ),
+    )
+
+    indexes = subparsers.add_parser(
+        "indexes",
+        help="create missing indexes, or report missing and unused ones",
+    )
+    indexes.add_argument(
+        "--study-id",
+        nargs="+",
+        help="studies to check, defaults to all study collections",
+    )
+    indexes.add_argument(
+        "--report",
+        action="store_true",
+        help="only report missing and unused indexes",
+    )
+    indexes.add_argument(
+        "--drop-extra",
+        action="store_true",
+        help="drop indexes that are not declared",
+    )
+    indexes.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="number of collections processed at once",
+    )
+    return argparser.parse_args()
+
+
+async def build_routing(client, study_ids=None, expected_items=None):
+    await ensure_routing_indexes(client)
+    if not study_ids:
+        study_ids = [st.study_id for st in await list_studies(client)]
+    for study_id in study_ids:
+        await build_study_routing(
+            client, study_id, expected_items=expected_items
+        )
+
+
+async def run(args):
+    client = create_mongo_client()
+    try:
+        if args.command == "routing":
+            await build_routing(
+                client,
+                study_ids=args.study_id,
+                expected_items=args.expected_items,
+            )
+        elif args.command == "indexes" and args.report:
+            report = await index_report(
+                client, study_ids=args.study_id, concurrency=args.concurrency
+            )
+            print(json.dumps(report, indent=2))
+        elif args.command == "indexes":
+            changes = await ensure_indexes(
+                client,
+                study_ids=args.study_id,
+                drop_extra=args.drop_extra,
+                concurrency=args.concurrency,
+            )
+            print(json.dumps(changes, indent=2))
+    finally:
+        client.close()
+
+
+def main():
+    asyncio.run(run(get_args()))
+
+
+if __name__ == "__main__":
+    main()
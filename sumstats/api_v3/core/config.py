@@ -1,4 +1,5 @@
 import os
+from typing import Literal, Optional
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -29,6 +30,25 @@ class Settings(BaseSettings):
     mongo_uri: str = "mongodb://localhost:27017"
     db_name: str = "eqtl_db"
 
+    # MongoDB client pool and timeouts (None leaves the driver default)
+    mongo_max_pool_size: int = 100
+    mongo_min_pool_size: int = 0
+    mongo_max_idle_time_ms: Optional[int] = None
+    mongo_server_selection_timeout_ms: int = 30000
+    mongo_connect_timeout_ms: int = 20000
+    mongo_socket_timeout_ms: Optional[int] = None
+    # Wire compression, in order of preference
+    # (snappy additionally needs python-snappy installed)
+    mongo_compressors: str = "zstd,zlib"
+    # Association searches may be served by secondaries
+    mongo_search_read_preference: Literal[
+        "primary",
+        "primaryPreferred",
+        "secondary",
+        "secondaryPreferred",
+        "nearest",
+    ] = "secondaryPreferred"
+
     # API configuration
     api_title: str = "eQTL API with MongoDB"
     api_prefix: str = "/api/v3"
@@ -37,6 +57,30 @@ class Settings(BaseSettings):
     default_page_size: int = 20
     max_page_size: int = 100
 
+    # Maximum number of study collections queried concurrently per search
+    search_concurrency: int = 16
+
+    # /associations/count: time allowed for exact counts before falling
+    # back to estimates from a sample of this many documents per study
+    count_time_budget_ms: int = 2000
+    count_sample_size: int = 1000
+
+    # Study routing index bloom filters (see db/routing.py)
+    routing_bloom_buckets: int = 1024
+    routing_bloom_fp_rate: float = 0.01
+    routing_bloom_max_items: int = 20_000_000
+    routing_region_bucket_size: int = 1_000_000
+
+    # Study/dataset catalogue cache (see db/catalogue.py)
+    catalogue_ttl_seconds: int = 300
+    catalogue_refresh_seconds: int = 60
+
+    # Create missing indexes in the background when the app starts
+    ensure_indexes_on_startup: bool = False
+
+    # Encode association pages with orjson without pydantic validation
+    fast_serialization: bool = True
+
     # Logging configuration
     log_level: str = "INFO"
 
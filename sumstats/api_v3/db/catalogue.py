@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from sumstats.api_v3.core.config import settings
+from sumstats.api_v3.db.repositories.datasets import list_datasets
+from sumstats.api_v3.db.repositories.studies import list_studies
+from sumstats.api_v3.db.routing import list_routing
+from sumstats.api_v3.models.schemas import DatasetModel, StudyModel
+
+
+class Catalogue:
+    """
+    In-process cache of the study and dataset metadata from
+    'pipeline_status' and of the study routing documents, so that
+    searches don't need a metadata round trip.
+
+    Entries are reloaded by the background refresher, or on access
+    once they are older than the TTL or have been invalidated.
+    """
+
+    def __init__(self, ttl_seconds: Optional[float] = None):
+        self.ttl_seconds = ttl_seconds
+        self._studies: List[StudyModel] = []
+        self._datasets: List[DatasetModel] = []
+        self._dataset_studies: Dict[str, str] = {}
+        self._routing: Dict[str, Any] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def ttl(self) -> float:
+        if self.ttl_seconds is None:
+            return settings.catalogue_ttl_seconds
+        return self.ttl_seconds
+
+    def is_stale(self) -> bool:
+        return (
+            self._loaded_at is None
+            or time.monotonic() - self._loaded_at > self.ttl
+        )
+
+    def invalidate(self) -> None:
+        self._loaded_at = None
+
+    async def refresh(self, client: AsyncIOMotorClient) -> None:
+        studies, datasets, routing = await asyncio.gather(
+            list_studies(client),
+            list_datasets(client),
+            list_routing(client),
+        )
+        self._studies = studies
+        self._datasets = datasets
+        self._dataset_studies = {d.dataset_id: d.study_id for d in datasets}
+        self._routing = routing
+        self._loaded_at = time.monotonic()
+        logging.info(
+            f"Catalogue refreshed: {len(studies)} studies, "
+            f"{len(datasets)} datasets, {len(routing)} routed studies."
+        )
+
+    async def _ensure_fresh(self, client: AsyncIOMotorClient) -> None:
+        if self.is_stale():
+            async with self._lock:
+                # another request may have refreshed while we waited
+                if self.is_stale():
+                    await self.refresh(client)
+
+    async def studies(self, client: AsyncIOMotorClient) -> List[StudyModel]:
+        await self._ensure_fresh(client)
+        return self._studies
+
+    async def datasets(self, client: AsyncIOMotorClient) -> List[DatasetModel]:
+        await self._ensure_fresh(client)
+        return self._datasets
+
+    async def study_for_dataset(
+        self, client: AsyncIOMotorClient, dataset_id: str
+    ) -> Optional[str]:
+        await self._ensure_fresh(client)
+        return self._dataset_studies.get(dataset_id)
+
+    async def routing(self, client: AsyncIOMotorClient) -> Dict[str, Any]:
+        await self._ensure_fresh(client)
+        return self._routing
+
+    async def run_refresher(
+        self,
+        client: AsyncIOMotorClient,
+        interval_seconds: Optional[float] = None,
+    ) -> None:
+        """
+        Reloads the catalogue every interval until cancelled.
+        """
+        interval = interval_seconds or settings.catalogue_refresh_seconds
+        while True:
+            try:
+                await self.refresh(client)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception("Catalogue refresh failed.")
+            await asyncio.sleep(interval)
+
+
+catalogue = Catalogue()
@@ -1,24 +1,152 @@
-from typing import Optional
+import logging
+import threading
+from typing import Any, Dict, Optional
 
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import ReadPreference, monitoring
 
 from sumstats.api_v3.core.config import settings
 
+READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    Counts connection pool events across all servers, to size
+    maxPoolSize against the real request concurrency.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open = 0
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "open": self.open,
+                "checked_out": self.checked_out,
+                "max_checked_out": self.max_checked_out,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "max_pool_size": settings.mongo_max_pool_size,
+            }
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open -= 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+
+pool_metrics = PoolMetrics()
+
 # Global variable to store the client instance
 _mongo_client: Optional[AsyncIOMotorClient] = None
 
 
-def get_mongo_client() -> AsyncIOMotorClient:
+def create_mongo_client() -> AsyncIOMotorClient:
+    """
+    Creates a client with the pool, timeout and compression settings.
     """
-    Get or create a MongoDB client using the singleton pattern.
-    This ensures we only create one client instance during the
-    application lifecycle.
+    options = {
+        "maxPoolSize": settings.mongo_max_pool_size,
+        "minPoolSize": settings.mongo_min_pool_size,
+        "maxIdleTimeMS": settings.mongo_max_idle_time_ms,
+        "serverSelectionTimeoutMS": settings.mongo_server_selection_timeout_ms,
+        "connectTimeoutMS": settings.mongo_connect_timeout_ms,
+        "socketTimeoutMS": settings.mongo_socket_timeout_ms,
+        "event_listeners": [pool_metrics],
+    }
+    if settings.mongo_compressors:
+        options["compressors"] = settings.mongo_compressors
+    return AsyncIOMotorClient(
+        settings.mongo_uri,
+        **{k: v for k, v in options.items() if v is not None},
+    )
+
+
+def connect() -> AsyncIOMotorClient:
+    """
+    Creates the application's client. Called from the app lifespan.
     """
     global _mongo_client
     if _mongo_client is None:
-        print(">>>>>>>>>>>>>>>>")
-        print(settings.mongo_uri)
-        print(settings.db_name)
-        print("<<<<<<<<<<<<<<<<")
-        _mongo_client = AsyncIOMotorClient(settings.mongo_uri)
+        _mongo_client = create_mongo_client()
+        logging.info(
+            f"MongoDB client created for database '{settings.db_name}' "
+            f"(maxPoolSize={settings.mongo_max_pool_size})."
+        )
     return _mongo_client
+
+
+def close() -> None:
+    global _mongo_client
+    if _mongo_client is not None:
+        _mongo_client.close()
+        _mongo_client = None
+        logging.info("MongoDB client closed.")
+
+
+def get_mongo_client() -> AsyncIOMotorClient:
+    """
+    Get the application's MongoDB client, creating it if the
+    app lifespan hasn't (e.g. outside the web app).
+    """
+    return connect()
+
+
+def get_search_database(client: AsyncIOMotorClient) -> AsyncIOMotorDatabase:
+    """
+    The database handle for association searches, which may read
+    from secondaries (MONGO_SEARCH_READ_PREFERENCE).
+    """
+    return client.get_database(
+        settings.db_name,
+        read_preference=READ_PREFERENCES[
+            settings.mongo_search_read_preference
+        ],
+    )
@@ -0,0 +1,64 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from sumstats.api_v3.core.config import settings
+from sumstats.api_v3.db.client import get_search_database
+
+
+async def fan_out_find(
+    client: AsyncIOMotorClient,
+    queries: List[Tuple[str, Dict[str, Any]]],
+    sort: List[Tuple[str, int]],
+    size: int,
+    projection: Optional[Dict[str, Any]] = None,
+    concurrency: Optional[int] = None,
+) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Runs a 'find' on each 'study_{study_id}' collection in 'queries'
+    (a list of (study_id, query) pairs) with at most 'concurrency'
+    queries in flight.
+
+    Results are merged in the order of 'queries' and, within a study,
+    by 'sort'. As soon as the studies that are complete, in order,
+    hold 'size' documents the remaining queries are cancelled.
+
+    Returns up to 'size' (study_id, document) pairs.
+    """
+    semaphore = asyncio.Semaphore(concurrency or settings.search_concurrency)
+
+    async def find(study_id: str, query: Dict[str, Any]):
+        async with semaphore:
+            return (
+                await get_search_database(client)[f"study_{study_id}"]
+                .find(query, projection)
+                .sort(sort)
+                .limit(size)
+                .to_list(length=None)
+            )
+
+    # tasks acquire the semaphore in creation order, so the studies
+    # needed first are also queried first
+    tasks = [
+        asyncio.ensure_future(find(study_id, query))
+        for study_id, query in queries
+    ]
+    results: List[Tuple[str, Dict[str, Any]]] = []
+    try:
+        for (study_id, _), task in zip(queries, tasks):
+            docs = await task
+            results.extend((study_id, doc) for doc in docs)
+            if len(results) >= size:
+                break
+    finally:
+        pending = [task for task in tasks if not task.done()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        logging.info(
+            f"Fan-out: {len(tasks) - len(pending)} of {len(tasks)} "
+            "study queries completed."
+        )
+    return results[:size]
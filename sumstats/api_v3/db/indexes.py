@@ -0,0 +1,173 @@
+"""
+Index declarations for the API v3 collections.
+
+Every filter in SearchFilters has an index in the 'study_{study_id}'
+collections. The indexes end in _id because the keyset pages of
+search_all_studies are sorted by _id within a study.
+"""
+
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from sumstats.api_v3.core.config import settings
+from sumstats.api_v3.db.routing import ensure_routing_indexes
+
+STUDY_INDEXES = [
+    IndexModel([("gene_id", ASCENDING), ("_id", ASCENDING)]),
+    IndexModel([("rsid", ASCENDING), ("_id", ASCENDING)]),
+    IndexModel([("variant", ASCENDING), ("_id", ASCENDING)]),
+    IndexModel([("molecular_trait_id", ASCENDING), ("_id", ASCENDING)]),
+    IndexModel(
+        [
+            ("chromosome", ASCENDING),
+            ("position", ASCENDING),
+            ("_id", ASCENDING),
+        ]
+    ),
+    IndexModel([("dataset_id", ASCENDING), ("_id", ASCENDING)]),
+]
+
+PIPELINE_STATUS_INDEXES = [
+    IndexModel([("study_id", ASCENDING), ("date", DESCENDING)]),
+    IndexModel([("dataset_id", ASCENDING), ("date", DESCENDING)]),
+    IndexModel([("date", DESCENDING)]),
+]
+
+
+def _key(spec) -> Tuple[Tuple[str, Any], ...]:
+    """
+    Normalises an index key, e.g. {'_id': 1.0} and [('_id', 1)].
+    """
+    items = spec.items() if isinstance(spec, dict) else spec
+    return tuple(
+        (field, int(direction) if isinstance(direction, float) else direction)
+        for field, direction in items
+    )
+
+
+def _declared(collection_name: str) -> List[IndexModel]:
+    if collection_name == "pipeline_status":
+        return PIPELINE_STATUS_INDEXES
+    return STUDY_INDEXES
+
+
+async def _study_collections(
+    client: AsyncIOMotorClient, study_ids: Optional[List[str]] = None
+) -> List[str]:
+    if study_ids:
+        return [f"study_{study_id}" for study_id in study_ids]
+    names = await client[settings.db_name].list_collection_names(
+        filter={"name": {"$regex": "^study_"}}
+    )
+    # skip the routing index collections
+    return sorted(n for n in names if not n.startswith("study_routing"))
+
+
+async def _reconcile(
+    client: AsyncIOMotorClient, collection_name: str, drop_extra: bool
+) -> Dict[str, List[str]]:
+    collection = client[settings.db_name][collection_name]
+    existing = await collection.index_information()
+    existing_keys = {
+        _key(info["key"]): name for name, info in existing.items()
+    }
+    declared = _declared(collection_name)
+    declared_keys = {_key(index.document["key"]) for index in declared}
+
+    missing = [
+        index
+        for index in declared
+        if _key(index.document["key"]) not in existing_keys
+    ]
+    created = await collection.create_indexes(missing) if missing else []
+    dropped = []
+    if drop_extra:
+        for key, name in existing_keys.items():
+            if name != "_id_" and key not in declared_keys:
+                await collection.drop_index(name)
+                dropped.append(name)
+    if created or dropped:
+        logging.info(
+            f"{collection_name}: created {created}, dropped {dropped}."
+        )
+    return {"created": created, "dropped": dropped}
+
+
+async def _gather_limited(coroutines, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*(limited(c) for c in coroutines))
+
+
+async def ensure_indexes(
+    client: AsyncIOMotorClient,
+    study_ids: Optional[List[str]] = None,
+    drop_extra: bool = False,
+    concurrency: int = 4,
+) -> Dict[str, Dict[str, List[str]]]:
+    """
+    Creates the declared indexes missing from 'pipeline_status' and the
+    study collections (all, or those of study_ids), a few collections at
+    a time. With drop_extra, undeclared indexes are dropped.
+
+    Returns the created and dropped index names by collection.
+    """
+    await ensure_routing_indexes(client)
+    collections = ["pipeline_status"] + await _study_collections(
+        client, study_ids
+    )
+    results = await _gather_limited(
+        [_reconcile(client, name, drop_extra) for name in collections],
+        concurrency,
+    )
+    return dict(zip(collections, results))
+
+
+async def _collection_report(
+    client: AsyncIOMotorClient, collection_name: str
+) -> Dict[str, Any]:
+    collection = client[settings.db_name][collection_name]
+    stats = await collection.aggregate([{"$indexStats": {}}]).to_list(
+        length=None
+    )
+    existing_keys = {_key(s["key"]) for s in stats}
+    return {
+        "collection": collection_name,
+        "missing": [
+            index.document["name"]
+            for index in _declared(collection_name)
+            if _key(index.document["key"]) not in existing_keys
+        ],
+        "unused": [
+            s["name"]
+            for s in stats
+            if s["name"] != "_id_" and s["accesses"]["ops"] == 0
+        ],
+    }
+
+
+async def index_report(
+    client: AsyncIOMotorClient,
+    study_ids: Optional[List[str]] = None,
+    concurrency: int = 4,
+) -> List[Dict[str, Any]]:
+    """
+    For 'pipeline_status' and the study collections, lists the declared
+    indexes that are missing and the indexes that have not been used
+    since the server started ($indexStats).
+    """
+    collections = ["pipeline_status"] + await _study_collections(
+        client, study_ids
+    )
+    return await _gather_limited(
+        [_collection_report(client, name) for name in collections],
+        concurrency,
+    )
@@ -1,22 +1,33 @@
+import asyncio
+import base64
 import logging
-from typing import Any, Dict, List
+from bisect import bisect_left
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
+from bson import json_util
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import ExecutionTimeout, OperationFailure
 
 from sumstats.api_v3.core.config import settings
-from sumstats.api_v3.db.repositories.studies import list_studies
-from sumstats.api_v3.models.schemas import AssociationModel, SearchFilters
-
-
-async def search_in_study(
-    client: AsyncIOMotorClient,
-    study_id: str,
-    filters: SearchFilters,
-    start: int,
-    size: int,
-) -> List[AssociationModel]:
+from sumstats.api_v3.db.catalogue import catalogue
+from sumstats.api_v3.db.client import get_search_database
+from sumstats.api_v3.db.fanout import fan_out_find
+from sumstats.api_v3.db.routing import route_studies
+from sumstats.api_v3.models.schemas import (
+    AssociationModel,
+    CountModel,
+    SearchFilters,
+)
+
+# Searches return plain dicts of the AssociationModel fields, leaving
+# validation to the response (see routes/serialization.py)
+ASSOCIATION_FIELDS = list(AssociationModel.model_fields)
+ASSOCIATION_PROJECTION = {"_id": 0, **{f: 1 for f in ASSOCIATION_FIELDS}}
+
+
+def build_query(filters: SearchFilters) -> Dict[str, Any]:
     """
-    Searches documents in collection 'study_{study_id}' using filters.
+    Translates the search filters into a MongoDB match query.
     """
     query = {}
     if filters.gene_id:
@@ -29,18 +40,114 @@ async def search_in_study(
         query["molecular_trait_id"] = filters.molecular_trait_id
     if filters.chromosome:
         query["chromosome"] = filters.chromosome
+    if is_region_search(filters):
+        query["position"] = {
+            "$gte": filters.position_start,
+            "$lte": filters.position_end,
+        }
+    return query
+
+
+def is_region_search(filters: SearchFilters) -> bool:
+    return filters.position_start is not None
+
+
+def sort_keys(filters: SearchFilters) -> List[str]:
+    """
+    The keys that define the order of documents within
+    a study collection. The last key must be unique.
+
+    Region searches are ordered by position, so that the
+    (chromosome, position, _id) index serves both the range
+    and the sort.
+    """
+    if is_region_search(filters):
+        return ["position", "_id"]
+    return ["_id"]
+
+
+def encode_cursor(study_id: str, last_key: Dict[str, Any]) -> str:
+    """
+    Builds an opaque continuation token from the study the
+    previous page ended in and the sort key of its last document.
+    """
+    payload = json_util.dumps({"study_id": study_id, "last_key": last_key})
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str, keys: List[str]) -> Tuple[str, Dict[str, Any]]:
+    """
+    Reverses encode_cursor. Raises a ValueError for malformed tokens,
+    and for tokens whose last key doesn't hold exactly the sort keys
+    'keys', e.g. a gene search cursor sent back with a region.
+    """
+    try:
+        payload = json_util.loads(
+            base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        )
+        study_id, last_key = str(payload["study_id"]), dict(
+            payload["last_key"]
+        )
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError("Invalid pagination cursor.") from e
+    if set(last_key) != set(keys):
+        raise ValueError("Invalid pagination cursor.")
+    return study_id, last_key
+
+
+def after_key_query(
+    keys: List[str], last_key: Dict[str, Any]
+) -> Dict[str, Any]:
+    """
+    Match documents sorting strictly after last_key, i.e. the
+    lexicographic (k1, k2, ...) > (v1, v2, ...) comparison.
+    """
+    clauses = []
+    for i, key in enumerate(keys):
+        clause = {k: last_key[k] for k in keys[:i]}
+        clause[key] = {"$gt": last_key[key]}
+        clauses.append(clause)
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+
+async def search_in_study(
+    client: AsyncIOMotorClient,
+    study_id: str,
+    filters: SearchFilters,
+    start: int,
+    size: int,
+) -> List[Dict[str, Any]]:
+    """
+    Searches documents in collection 'study_{study_id}' using filters.
+    """
+    query = build_query(filters)
 
     collection_name = f"study_{study_id}"
     cursor = (
-        client[settings.db_name][collection_name]
-        .find(query)
+        get_search_database(client)[collection_name]
+        .find(query, ASSOCIATION_PROJECTION)
         .skip(start)
         .limit(size)
     )
-    results = []
-    async for doc in cursor:
-        results.append(AssociationModel(**doc))
-    return results
+    return await cursor.to_list(length=None)
+
+
+async def study_for_dataset(
+    client: AsyncIOMotorClient, dataset_id: str
+) -> Optional[str]:
+    """
+    The study_id of the dataset, from the catalogue or, for a dataset
+    loaded since the last catalogue refresh, from pipeline_status.
+    None if the dataset is not found.
+    """
+    study_id = await catalogue.study_for_dataset(client, dataset_id)
+    if study_id is None:
+        doc = await client[settings.db_name]["pipeline_status"].find_one(
+            {"dataset_id": dataset_id}
+        )
+        if doc:
+            study_id = doc["study_id"]
+    return study_id
 
 
 async def search_in_dataset(
@@ -49,84 +156,263 @@ async def search_in_dataset(
     filters: SearchFilters,
     start: int,
     size: int,
-) -> List[AssociationModel]:
+) -> List[Dict[str, Any]]:
     """
-    Finds the study_id for the given dataset from 'pipeline_status',
+    Finds the study_id for the given dataset from the catalogue,
     then searches in collection 'study_{study_id}' by provided filters.
     """
-    doc = await client[settings.db_name]["pipeline_status"].find_one(
-        {"dataset_id": dataset_id}
-    )
-    if not doc:
+    study_id = await study_for_dataset(client, dataset_id)
+    if study_id is None:
         # Optionally raise an HTTPException if dataset not found
         return []
-
-    study_id = doc["study_id"]
     collection_name = f"study_{study_id}"
 
-    query = {"dataset_id": dataset_id}
-    if filters.gene_id:
-        query["gene_id"] = filters.gene_id
-    if filters.rsid:
-        query["rsid"] = filters.rsid
-    if filters.variant:
-        query["variant"] = filters.variant
-    if filters.molecular_trait_id:
-        query["molecular_trait_id"] = filters.molecular_trait_id
-    if filters.chromosome:
-        query["chromosome"] = filters.chromosome
+    query = {"dataset_id": dataset_id, **build_query(filters)}
 
     cursor = (
-        client[settings.db_name][collection_name]
-        .find(query)
+        get_search_database(client)[collection_name]
+        .find(query, ASSOCIATION_PROJECTION)
         .skip(start)
         .limit(size)
     )
+    return await cursor.to_list(length=None)
+
+
+async def search_all_studies(
+    client: AsyncIOMotorClient,
+    filters: SearchFilters,
+    start: int,
+    size: int,
+    cursor: Optional[str] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Search the 'study_{study_id}' collections that the routing index
+    does not rule out, in study_id order and by sort key within each
+    collection.
+
+    Pages are resolved by keyset: the query resumes in the study named
+    by the cursor, after its last key, so the cost of a page does not
+    depend on how deep it is. The study collections are queried
+    concurrently (see fan_out_find). Returns the page and the cursor
+    for the next page (None when the results are exhausted).
+
+    An offset ('start' > 0 without a cursor) falls back to the
+    $unionWith/$skip aggregation.
+    """
+    all_studies = await catalogue.studies(client)
+    logging.info(f"Fetch all studies: {len(all_studies)} studies.")
+    study_ids = await route_studies(
+        client,
+        filters,
+        sorted(st.study_id for st in all_studies),
+        routed=await catalogue.routing(client),
+    )
+
+    if cursor is None and start > 0:
+        results = await _search_union(client, study_ids, filters, start, size)
+        return results, None
+
+    query = build_query(filters)
+    keys = sort_keys(filters)
+    ordinal, last_key = 0, None
+    if cursor is not None:
+        cursor_study_id, last_key = decode_cursor(cursor, keys)
+        ordinal = bisect_left(study_ids, cursor_study_id)
+        if ordinal == len(study_ids) or study_ids[ordinal] != cursor_study_id:
+            # the study has gone, so resume from the start of the next one
+            last_key = None
+
+    queries = []
+    for study_id in study_ids[ordinal:]:
+        study_query = query
+        if last_key is not None:
+            study_query = {"$and": [query, after_key_query(keys, last_key)]}
+            last_key = None
+        queries.append((study_id, study_query))
+
+    rows = await fan_out_find(
+        client,
+        queries,
+        sort=[(k, 1) for k in keys],
+        size=size,
+        projection={**ASSOCIATION_PROJECTION, **{k: 1 for k in keys}},
+    )
+    next_cursor = None
+    if len(rows) >= size:
+        last_study_id, last_doc = rows[-1]
+        next_cursor = encode_cursor(
+            last_study_id, {k: last_doc[k] for k in keys}
+        )
+    # drop the sort keys that were only fetched for the cursor
+    hidden_keys = [k for k in keys if k not in ASSOCIATION_FIELDS]
     results = []
-    async for record in cursor:
-        results.append(AssociationModel(**record))
+    for _, doc in rows:
+        for k in hidden_keys:
+            doc.pop(k, None)
+        results.append(doc)
 
-    return results
+    return results, next_cursor
 
 
-async def search_all_studies(
-    client: AsyncIOMotorClient, filters: SearchFilters, start: int, size: int
-) -> List[AssociationModel]:
+async def count_all_studies(
+    client: AsyncIOMotorClient,
+    filters: SearchFilters,
+    time_budget_ms: Optional[int] = None,
+) -> CountModel:
+    """
+    Counts the matches in every routed study collection in parallel.
+
+    Studies whose count_documents doesn't finish within the time budget
+    (or fails) are estimated instead, in what is left of the budget,
+    from the matching fraction of a random sample scaled by the
+    collection size, and the total is flagged as approximate. If any
+    study can't be estimated, e.g. because the sample holds no match
+    for a selective filter, the count is null rather than a guess.
+    """
+    budget_ms = time_budget_ms or settings.count_time_budget_ms
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + budget_ms / 1000
+    all_studies = await catalogue.studies(client)
+    study_ids = await route_studies(
+        client,
+        filters,
+        sorted(st.study_id for st in all_studies),
+        routed=await catalogue.routing(client),
+    )
+    query = build_query(filters)
+    db = get_search_database(client)
+    semaphore = asyncio.Semaphore(settings.search_concurrency)
+
+    def remaining_ms() -> int:
+        return int((deadline - loop.time()) * 1000)
+
+    async def count(study_id: str) -> int:
+        async with semaphore:
+            return await db[f"study_{study_id}"].count_documents(
+                query, maxTimeMS=max(1, remaining_ms())
+            )
+
+    tasks = {
+        asyncio.ensure_future(count(study_id)): study_id
+        for study_id in study_ids
+    }
+    total, to_estimate = 0, []
+    if tasks:
+        done, pending = await asyncio.wait(
+            tasks, timeout=max(0, remaining_ms()) / 1000
+        )
+        for task in pending:
+            task.cancel()
+            to_estimate.append(tasks[task])
+        for task in done:
+            error = task.exception()
+            if error is None:
+                total += task.result()
+            elif isinstance(error, OperationFailure):
+                if not isinstance(error, ExecutionTimeout):
+                    logging.warning(
+                        f"Count: study_{tasks[task]} failed: {error!r}"
+                    )
+                to_estimate.append(tasks[task])
+            else:
+                raise error
+    if not to_estimate:
+        return CountModel(count=total)
+
+    logging.info(f"Count: estimating {len(to_estimate)} studies.")
+    estimates = [None] * len(to_estimate)
+    if remaining_ms() > 0:
+        estimate_tasks = [
+            asyncio.ensure_future(
+                _estimate_count(client, study_id, query, remaining_ms())
+            )
+            for study_id in to_estimate
+        ]
+        done, pending = await asyncio.wait(
+            estimate_tasks, timeout=max(0, remaining_ms()) / 1000
+        )
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        estimates = [
+            task.result() if task in done else None for task in estimate_tasks
+        ]
+    if any(estimate is None for estimate in estimates):
+        return CountModel(count=None, approximate=True)
+    return CountModel(count=total + sum(estimates), approximate=True)
+
+
+async def _estimate_count(
+    client: AsyncIOMotorClient,
+    study_id: str,
+    query: Dict[str, Any],
+    time_budget_ms: int,
+) -> Optional[int]:
+    """
+    The matches in a study, estimated from a random sample. None if
+    the sample holds no match, or the estimate fails or runs out of
+    time.
+    """
+    collection = get_search_database(client)[f"study_{study_id}"]
+    try:
+        size = await collection.estimated_document_count(
+            maxTimeMS=max(1, time_budget_ms)
+        )
+        if not query or size == 0:
+            return size
+        sample_size = min(settings.count_sample_size, size)
+        result = await collection.aggregate(
+            [
+                {"$sample": {"size": sample_size}},
+                {"$match": query},
+                {"$count": "matches"},
+            ],
+            maxTimeMS=max(1, time_budget_ms),
+        ).to_list(length=1)
+    except OperationFailure as e:
+        logging.warning(f"Count: could not estimate study_{study_id}: {e!r}")
+        return None
+    matches = result[0]["matches"] if result else 0
+    if matches == 0:
+        return None
+    return round(size * matches / sample_size)
+
+
+async def _search_union(
+    client: AsyncIOMotorClient,
+    study_ids: List[str],
+    filters: SearchFilters,
+    start: int,
+    size: int,
+) -> List[Dict[str, Any]]:
     """
     Use MongoDB aggregation with $unionWith to gather results
     from each 'study_{study_id}' collection, then apply a
     single skip/limit at the end.
     """
-    all_studies = await list_studies(client)
-    logging.info(f"Fetch all studies: {len(all_studies)} studies.")
-
     # 1) Build the base match query
-    query = {}
-    if filters.gene_id:
-        query["gene_id"] = filters.gene_id
-    if filters.rsid:
-        query["rsid"] = filters.rsid
-    if filters.variant:
-        query["variant"] = filters.variant
-    if filters.molecular_trait_id:
-        query["molecular_trait_id"] = filters.molecular_trait_id
-    if filters.chromosome:
-        query["chromosome"] = filters.chromosome
+    query = build_query(filters)
+    sort = {k: 1 for k in sort_keys(filters)}
 
     # 2) Build a pipeline starting with a match
     # that returns no docs from pipeline_status
     # so we have a base pipeline to union onto.
     pipeline: List[Dict[str, Any]] = [{"$match": {"_id": {"$exists": False}}}]
 
-    # 3) For each study, union its collection with the match query
+    # 3) For each study, union its collection with the match query,
+    # ordered the same way as the keyset pages
     logging.info("Getting studies...")
-    for st in all_studies:
-        study_coll = f"study_{st.study_id}"
+    for study_id in study_ids:
+        study_coll = f"study_{study_id}"
         pipeline.append(
             {
                 "$unionWith": {
                     "coll": study_coll,
-                    "pipeline": [{"$match": query}],
+                    "pipeline": [
+                        {"$match": query},
+                        {"$sort": sort},
+                        {"$project": ASSOCIATION_PROJECTION},
+                    ],
                 }
             }
         )
@@ -138,98 +424,50 @@ async def search_all_studies(
 
     # 5) Run aggregation on any collection (pipeline_status is used as base).
     logging.info("Running the query...")
-    cursor = client[settings.db_name]["pipeline_status"].aggregate(pipeline)
+    cursor = get_search_database(client)["pipeline_status"].aggregate(pipeline)
     logging.info("Running the query...DONE.")
 
     logging.info("Gathering results...")
-    results = []
-    async for doc in cursor:
-        results.append(AssociationModel(**doc))
+    results = await cursor.to_list(length=None)
     logging.info("Gathering results...DONE.")
 
     return results
 
 
-# async def search_chunked(
-#     client: AsyncIOMotorClient, filters: SearchFilters, start: int, size: int
-# ) -> List[AssociationModel]:
-#     """
-#     Chunk-based approach:
-#     1) We get the sorted list of study IDs.
-#     2) For each 'study_{id}' collection, we do:
-#        - Count how many docs match the query.
-#        - If 'start' >= that count, decrement 'start' by count and move on.
-#        - Otherwise, query the partial chunk we need from this collection
-#          (skip=start, limit=(size - collected_so_far)).
-#        - Decrement 'size' by the number of docs fetched from that collection.
-#        - Reset 'start' to 0 (we've already accounted for skipping).
-#        - Move on to the next collection if we still need more docs.
-#     3) Return once we've collected 'size' docs or exhausted all collections.
-#     """
-#     # 1) gather the query
-#     query = {}
-#     if filters.gene_id:
-#         query["gene_id"] = filters.gene_id
-#     if filters.rsid:
-#         query["rsid"] = filters.rsid
-#     if filters.variant:
-#         query["variant"] = filters.variant
-#     if filters.molecular_trait_id:
-#         query["molecular_trait_id"] = filters.molecular_trait_id
-#     if filters.chromosome:
-#         query["chromosome"] = filters.chromosome
-
-#     # 2) get all studies to know which collections to read from
-#     #    optionally sort them by study_id or by date
-#     studies = await list_studies(client)
-#     studies_sorted = sorted(studies, key=lambda s: s.study_id)
-
-#     final_results: List[AssociationModel] = []
-#     skip_remaining = start
-#     size_remaining = size
-
-#     # 3) loop over each study
-#     logging.info("Iterating study collections...")
-#     for st in studies_sorted:
-#         logging.info(f"study_{st.study_id}")
-#         if size_remaining <= 0:
-#             break  # we've collected enough
-
-#         coll_name = f"study_{st.study_id}"
-#         coll = client[settings.db_name][coll_name]
-
-#         # count how many docs match
-#         logging.info("Counting match...")
-#         match_count = await coll.count_documents(query)
-#         logging.info("Counting match...DONE.")
-
-#         if skip_remaining >= match_count:
-#             # skip all in this collection, continue to next
-#             skip_remaining -= match_count
-#             continue
-
-#         # partial docs in this collection
-#         # skip only the leftover skip_remaining if any
-#         partial_skip = skip_remaining
-#         partial_limit = size_remaining
-
-#         # we've accounted for skip
-#         skip_remaining = 0
-
-#         # 4) fetch docs
-#         logging.info("Fetching docs...")
-#         cursor = coll.find(query).skip(partial_skip).limit(partial_limit)
-#         async for doc in cursor:
-#             final_results.append(AssociationModel(**doc))
-#         logging.info("Fetching docs...DONE.")
-
-#         # now we've filled part or all of size_remaining
-#         fetched_count = len(final_results) - (size - size_remaining)
-#         size_remaining -= fetched_count
-
-#         if size_remaining <= 0:
-#             break
-
-#     logging.info("Iterating study collections...DONE.")
-
-#     return final_results
+async def stream_all_studies(
+    client: AsyncIOMotorClient,
+    filters: SearchFilters,
+    batch_size: int = 1000,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Yields every matching association, as a dict of the
+    AssociationModel fields, in the same order as search_all_studies.
+    Documents are read from one cursor at a time as they arrive,
+    so memory use does not depend on the size of the result.
+
+    filters.study_id and filters.dataset_id restrict the export
+    to a single study or dataset.
+    """
+    study_ids = sorted(st.study_id for st in await catalogue.studies(client))
+    query = build_query(filters)
+    if filters.dataset_id:
+        query["dataset_id"] = filters.dataset_id
+        dataset_study_id = await study_for_dataset(client, filters.dataset_id)
+        # the study may be newer than the catalogue too
+        study_ids = [dataset_study_id] if dataset_study_id else []
+    if filters.study_id:
+        study_ids = [s for s in study_ids if s == filters.study_id]
+    study_ids = await route_studies(
+        client, filters, study_ids, routed=await catalogue.routing(client)
+    )
+
+    sort = [(k, 1) for k in sort_keys(filters)]
+    for study_id in study_ids:
+        cursor = (
+            get_search_database(client)[f"study_{study_id}"]
+            .find(query, ASSOCIATION_PROJECTION)
+            .sort(sort)
+            .batch_size(batch_size)
+        )
+        async for doc in cursor:
+            yield doc
@@ -0,0 +1,369 @@
+"""
+Study routing index.
+
+One document per study in 'study_routing' lists the gene_ids,
+chromosomes and genomic regions (chromosome:bucket, where bucket is
+position // ROUTING_REGION_BUCKET_SIZE) found in its 'study_{study_id}'
+collection, so gene, chromosome and region searches only touch the
+collections that contain them.
+
+rsid and variant membership is held in bloom filters in
+'study_routing_bloom'. Each study's filter is split into a fixed number
+of buckets, one document each, and a value only ever sets bits in the
+bucket it hashes to. Membership is tested server side with $bitsAllSet
+on the single bucket per study a value can be in.
+
+Studies without a routing document are always searched.
+"""
+
+import hashlib
+import logging
+import math
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from bson.binary import Binary
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DeleteMany, InsertOne
+
+from sumstats.api_v3.core.config import settings
+from sumstats.api_v3.db.client import get_search_database
+from sumstats.api_v3.models.schemas import SearchFilters
+
+ROUTING_COLLECTION = "study_routing"
+BLOOM_COLLECTION = "study_routing_bloom"
+BLOOM_FIELDS = ("rsid", "variant")
+
+
+def _hash(value: str) -> Tuple[int, int]:
+    digest = hashlib.blake2b(value.encode("utf-8"), digest_size=16).digest()
+    return (
+        int.from_bytes(digest[:8], "little"),
+        int.from_bytes(digest[8:], "little") | 1,
+    )
+
+
+def region_key(chromosome: str, position: int) -> str:
+    return (
+        f"{chromosome}:{int(position) // settings.routing_region_bucket_size}"
+    )
+
+
+def bloom_bucket(value: str, buckets: int) -> int:
+    return _hash(value)[0] % buckets
+
+
+def bloom_positions(
+    value: str, buckets: int, bits_per_bucket: int, hashes: int
+) -> List[int]:
+    """
+    Bit positions for value within its bucket (double hashing).
+    """
+    a, b = _hash(value)
+    return sorted(
+        {((a // buckets) + i * b) % bits_per_bucket for i in range(hashes)}
+    )
+
+
+def bloom_size(
+    expected_items: int, buckets: int, fp_rate: float
+) -> Tuple[int, int]:
+    """
+    The bits per bucket and number of hash functions for a filter of
+    expected_items at fp_rate. Bits are rounded up to a power of two
+    so that few distinct sizes exist across studies.
+    """
+    per_bucket = max(1, math.ceil(expected_items / buckets))
+    bits = -per_bucket * math.log(fp_rate) / (math.log(2) ** 2)
+    bits_per_bucket = max(64, 1 << math.ceil(math.log2(bits)))
+    hashes = max(1, round(bits_per_bucket / per_bucket * math.log(2)))
+    return bits_per_bucket, min(hashes, 16)
+
+
+class BloomFilter:
+    def __init__(self, buckets: int, bits_per_bucket: int, hashes: int):
+        self.buckets = buckets
+        self.bits_per_bucket = bits_per_bucket
+        self.hashes = hashes
+        self.bits = [bytearray(bits_per_bucket // 8) for _ in range(buckets)]
+
+    def add(self, value: str) -> None:
+        bucket = self.bits[bloom_bucket(value, self.buckets)]
+        for p in bloom_positions(
+            value, self.buckets, self.bits_per_bucket, self.hashes
+        ):
+            # BinData bit 0 is the least significant bit of the first byte
+            bucket[p >> 3] |= 1 << (p & 7)
+
+    def __contains__(self, value: str) -> bool:
+        bucket = self.bits[bloom_bucket(value, self.buckets)]
+        return all(
+            bucket[p >> 3] & (1 << (p & 7))
+            for p in bloom_positions(
+                value, self.buckets, self.bits_per_bucket, self.hashes
+            )
+        )
+
+
+async def distinct_count(collection, field: str) -> int:
+    """
+    The number of distinct non-empty values of field in collection,
+    counted server side.
+    """
+    result = await collection.aggregate(
+        [
+            {"$match": {field: {"$nin": [None, ""]}}},
+            {"$group": {"_id": f"${field}"}},
+            {"$count": "items"},
+        ],
+        allowDiskUse=True,
+    ).to_list(length=1)
+    return result[0]["items"] if result else 0
+
+
+async def build_study_routing(
+    client: AsyncIOMotorClient,
+    study_id: str,
+    expected_items: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Scans 'study_{study_id}' once and (re)writes its routing document
+    and bloom filter buckets. Intended to run after a study is loaded.
+
+    Each bloom filter is sized for the number of distinct values of its
+    field (rows repeat per molecular trait, so the collection size
+    would oversize it many times), or for expected_items if given.
+    """
+    db = client[settings.db_name]
+    collection = db[f"study_{study_id}"]
+    buckets = settings.routing_bloom_buckets
+    blooms = {}
+    for field in BLOOM_FIELDS:
+        items = expected_items
+        if items is None:
+            items = await distinct_count(collection, field)
+        bits_per_bucket, hashes = bloom_size(
+            min(items, settings.routing_bloom_max_items),
+            buckets,
+            settings.routing_bloom_fp_rate,
+        )
+        blooms[field] = BloomFilter(buckets, bits_per_bucket, hashes)
+    gene_ids: Set[str] = set()
+    chromosomes: Set[str] = set()
+    regions: Set[str] = set()
+
+    logging.info(f"Building routing for study_{study_id}...")
+    projection = {
+        "_id": 0,
+        "gene_id": 1,
+        "chromosome": 1,
+        "position": 1,
+        **{field: 1 for field in BLOOM_FIELDS},
+    }
+    batch: Dict[str, Set[str]] = {field: set() for field in BLOOM_FIELDS}
+    async for doc in collection.find({}, projection, batch_size=10_000):
+        if doc.get("gene_id"):
+            gene_ids.add(doc["gene_id"])
+        if doc.get("chromosome"):
+            chromosomes.add(str(doc["chromosome"]))
+            if doc.get("position") is not None:
+                regions.add(region_key(doc["chromosome"], doc["position"]))
+        for field in BLOOM_FIELDS:
+            if doc.get(field):
+                batch[field].add(doc[field])
+                # rows repeat per molecular trait, so dedupe before hashing
+                if len(batch[field]) >= 100_000:
+                    _add_all(blooms[field], batch[field])
+    for field in BLOOM_FIELDS:
+        _add_all(blooms[field], batch[field])
+
+    routing = {
+        "study_id": study_id,
+        "gene_ids": sorted(gene_ids),
+        "chromosomes": sorted(chromosomes),
+        "regions": sorted(regions),
+        "region_bucket_size": settings.routing_region_bucket_size,
+        "buckets": buckets,
+        "blooms": {
+            field: {
+                "bits_per_bucket": bloom.bits_per_bucket,
+                "hashes": bloom.hashes,
+            }
+            for field, bloom in blooms.items()
+        },
+        "updated": datetime.now(timezone.utc),
+    }
+    await db[BLOOM_COLLECTION].bulk_write(
+        [DeleteMany({"study_id": study_id})]
+        + [
+            InsertOne(
+                {
+                    "study_id": study_id,
+                    "field": field,
+                    "bucket": i,
+                    "buckets": buckets,
+                    "bits_per_bucket": bloom.bits_per_bucket,
+                    "hashes": bloom.hashes,
+                    "bits": Binary(bytes(bits)),
+                }
+            )
+            for field, bloom in blooms.items()
+            for i, bits in enumerate(bloom.bits)
+        ],
+        ordered=True,
+    )
+    await db[ROUTING_COLLECTION].replace_one(
+        {"study_id": study_id}, routing, upsert=True
+    )
+    sizes = ", ".join(
+        f"{field} {bloom.bits_per_bucket * buckets // 8}"
+        for field, bloom in blooms.items()
+    )
+    logging.info(
+        f"Building routing for study_{study_id}...DONE. "
+        f"{len(gene_ids)} genes, bloom filter bytes: {sizes}."
+    )
+    return routing
+
+
+def _add_all(bloom: BloomFilter, values: Set[str]) -> None:
+    for value in values:
+        bloom.add(value)
+    values.clear()
+
+
+async def ensure_routing_indexes(client: AsyncIOMotorClient) -> None:
+    db = get_search_database(client)
+    await db[ROUTING_COLLECTION].create_index("study_id", unique=True)
+    await db[ROUTING_COLLECTION].create_index("gene_ids")
+    await db[BLOOM_COLLECTION].create_index(
+        [("field", ASCENDING), ("bucket", ASCENDING), ("study_id", ASCENDING)]
+    )
+
+
+async def list_routing(client: AsyncIOMotorClient) -> Dict[str, Any]:
+    """
+    The routing documents, without their gene lists, by study_id.
+    """
+    docs = await (
+        get_search_database(client)[ROUTING_COLLECTION]
+        .find({}, {"_id": 0, "study_id": 1, "buckets": 1, "blooms": 1})
+        .to_list(length=None)
+    )
+    return {doc["study_id"]: doc for doc in docs}
+
+
+async def route_studies(
+    client: AsyncIOMotorClient,
+    filters: SearchFilters,
+    study_ids: Iterable[str],
+    routed: Optional[Dict[str, Any]] = None,
+) -> List[str]:
+    """
+    Narrows study_ids, keeping their order, to the studies that can
+    hold a match for the gene_id, chromosome, region, rsid and variant
+    filters.
+    'routed' is the output of list_routing, fetched if not given.
+
+    The routing documents and bloom filter buckets are both read with
+    the search read preference, so they come from the same member.
+    """
+    study_ids = list(study_ids)
+    if not (
+        filters.gene_id
+        or filters.chromosome
+        or any(getattr(filters, field) for field in BLOOM_FIELDS)
+    ):
+        return study_ids
+
+    db = get_search_database(client)
+    if routed is None:
+        routed = await list_routing(client)
+    candidates = set(routed)
+
+    exact = {}
+    if filters.gene_id:
+        exact["gene_ids"] = filters.gene_id
+    if filters.chromosome:
+        exact["chromosomes"] = filters.chromosome
+    if filters.position_start is not None:
+        bucket_size = settings.routing_region_bucket_size
+        regions = [
+            f"{filters.chromosome}:{bucket}"
+            for bucket in range(
+                filters.position_start // bucket_size,
+                filters.position_end // bucket_size + 1,
+            )
+        ]
+        # routing built before regions were recorded can't rule out a study
+        exact["$or"] = [
+            {"regions": {"$in": regions}},
+            {"regions": {"$exists": False}},
+        ]
+    if exact:
+        candidates &= set(
+            await db[ROUTING_COLLECTION].distinct("study_id", exact)
+        )
+
+    for field in BLOOM_FIELDS:
+        value = getattr(filters, field)
+        if value and candidates:
+            candidates = await _bloom_candidates(
+                client, field, value, {s: routed[s] for s in candidates}
+            )
+
+    routed_ids = [s for s in study_ids if s in routed]
+    selected = [s for s in study_ids if s in candidates or s not in routed]
+    logging.info(
+        f"Routing: {len(selected)} of {len(study_ids)} studies selected "
+        f"({len(study_ids) - len(routed_ids)} without routing)."
+    )
+    return selected
+
+
+async def _bloom_candidates(
+    client: AsyncIOMotorClient,
+    field: str,
+    value: str,
+    routing_docs: Dict[str, Dict[str, Any]],
+) -> Set[str]:
+    """
+    The studies whose bloom filter for field may contain value.
+    Studies without a filter for field are kept.
+    """
+    candidates = set()
+    shapes = set()
+    for study_id, doc in routing_docs.items():
+        bloom = doc.get("blooms", {}).get(field)
+        if bloom is None:
+            candidates.add(study_id)
+        else:
+            shapes.add(
+                (doc["buckets"], bloom["bits_per_bucket"], bloom["hashes"])
+            )
+    if not shapes:
+        return candidates
+
+    clauses = [
+        {
+            "bucket": bloom_bucket(value, buckets),
+            "buckets": buckets,
+            "bits_per_bucket": bits_per_bucket,
+            "hashes": hashes,
+            "bits": {
+                "$bitsAllSet": bloom_positions(
+                    value, buckets, bits_per_bucket, hashes
+                )
+            },
+        }
+        for buckets, bits_per_bucket, hashes in shapes
+    ]
+    matched = await get_search_database(client)[BLOOM_COLLECTION].distinct(
+        "study_id",
+        {
+            "field": field,
+            "study_id": {"$in": list(routing_docs)},
+            "$or": clauses,
+        },
+    )
+    return candidates | set(matched)
@@ -1,6 +1,9 @@
+from enum import Enum
 from typing import Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
+
+MAX_GENOMIC_WINDOW = 1_000_000
 
 
 class StudyModel(BaseModel):
@@ -38,6 +41,11 @@ class AssociationModel(BaseModel):
     dataset_id: str
 
 
+class CountModel(BaseModel):
+    count: Optional[int]
+    approximate: bool = False
+
+
 class SearchFilters(BaseModel):
     gene_id: Optional[str] = None
     rsid: Optional[str] = None
@@ -46,3 +54,34 @@ class SearchFilters(BaseModel):
     chromosome: Optional[str] = None
     study_id: Optional[str] = None
     dataset_id: Optional[str] = None
+    position_start: Optional[int] = Field(None, ge=0)
+    position_end: Optional[int] = Field(None, ge=0)
+
+    @model_validator(mode="after")
+    def validate_region(self):
+        if self.position_start is None and self.position_end is None:
+            return self
+        if (
+            self.chromosome is None
+            or self.position_start is None
+            or self.position_end is None
+        ):
+            raise ValueError(
+                "chromosome, position_start and position_end "
+                "must all be provided together"
+            )
+        if self.position_start > self.position_end:
+            raise ValueError(
+                "position_start must not be greater than position_end"
+            )
+        if self.position_end - self.position_start > MAX_GENOMIC_WINDOW:
+            raise ValueError(
+                "Requested region is larger than the "
+                f"maximum allowable window of {MAX_GENOMIC_WINDOW}"
+            )
+        return self
+
+
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    tsv = "tsv"
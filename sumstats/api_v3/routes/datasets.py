@@ -1,6 +1,6 @@
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from motor.motor_asyncio import AsyncIOMotorClient
 
 from sumstats.api_v3.db.client import get_mongo_client
@@ -14,7 +14,12 @@ from sumstats.api_v3.models.schemas import (
     DatasetModel,
     SearchFilters,
 )
-from sumstats.config import API_BASE
+from sumstats.api_v3.routes.serialization import association_response
+from sumstats.config import (
+    API_BASE,
+    FILTER_POSITION_END,
+    FILTER_POSITION_START,
+)
 
 router = APIRouter(prefix=f"{API_BASE}/v3/datasets", tags=["eQTL API v3"])
 
@@ -52,12 +57,19 @@ async def get_dataset_route(
     response_model=List[AssociationModel],
 )
 async def search_within_dataset_route(
+    response: Response,
     dataset_id: str,
     gene_id: Optional[str] = Query(None),
     rsid: Optional[str] = Query(None),
     variant: Optional[str] = Query(None),
     molecular_trait_id: Optional[str] = Query(None),
     chromosome: Optional[str] = Query(None),
+    position_start: Optional[int] = Query(
+        None, ge=0, description=FILTER_POSITION_START
+    ),
+    position_end: Optional[int] = Query(
+        None, ge=0, description=FILTER_POSITION_END
+    ),
     start: int = Query(0, ge=0, description="Pagination start index"),
     size: int = Query(20, gt=0, description="Number of records to return"),
     client: AsyncIOMotorClient = Depends(get_mongo_client),
@@ -71,5 +83,8 @@ async def search_within_dataset_route(
         variant=variant,
         molecular_trait_id=molecular_trait_id,
         chromosome=chromosome,
+        position_start=position_start,
+        position_end=position_end,
     )
-    return await search_in_dataset(client, dataset_id, filters, start, size)
+    results = await search_in_dataset(client, dataset_id, filters, start, size)
+    return association_response(results, response)
@@ -0,0 +1,14 @@
+from fastapi import APIRouter
+
+from sumstats.api_v3.db.client import pool_metrics
+from sumstats.config import API_BASE
+
+router = APIRouter(prefix=f"{API_BASE}/v3/metrics", tags=["eQTL API v3"])
+
+
+@router.get("/pool", include_in_schema=False)
+async def get_pool_metrics_route():
+    """
+    MongoDB connection pool usage for this worker.
+    """
+    return pool_metrics.snapshot()
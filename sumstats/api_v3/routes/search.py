@@ -1,15 +1,41 @@
 import logging
-from typing import List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional
 
-from fastapi import APIRouter, Depends, Query
+import orjson
+from fastapi import APIRouter, Depends, Query, Response
+from fastapi.responses import StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorClient
 
 from sumstats.api_v3.db.client import get_mongo_client
-from sumstats.api_v3.db.repositories.search import (  # search_chunked,
+from sumstats.api_v3.db.repositories.search import (
+    ASSOCIATION_FIELDS,
+    count_all_studies,
     search_all_studies,
+    stream_all_studies,
+)
+from sumstats.api_v3.models.schemas import (
+    AssociationModel,
+    CountModel,
+    ExportFormat,
+    SearchFilters,
+)
+from sumstats.api_v3.routes.serialization import association_response
+from sumstats.config import (
+    API_BASE,
+    COUNT_DESCRIPTION,
+    CURSOR_DESCRIPTION,
+    EXPORT_DESCRIPTION,
+    FILTER_POSITION_END,
+    FILTER_POSITION_START,
+    NEXT_CURSOR_HEADER,
+)
+
+# rows per chunk written to the response stream
+EXPORT_CHUNK_ROWS = 1000
+# backslash escapes for the characters that would split a TSV field
+TSV_ESCAPES = str.maketrans(
+    {"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"}
 )
-from sumstats.api_v3.models.schemas import AssociationModel, SearchFilters
-from sumstats.config import API_BASE
 
 router = APIRouter(prefix=f"{API_BASE}/v3", tags=["eQTL API v3"])
 
@@ -20,17 +46,26 @@ router = APIRouter(prefix=f"{API_BASE}/v3", tags=["eQTL API v3"])
     summary="Search associations across collections",
 )
 async def search_all_studies_route(
+    response: Response,
     gene_id: Optional[str] = Query(None),
     rsid: Optional[str] = Query(None),
     variant: Optional[str] = Query(None),
     molecular_trait_id: Optional[str] = Query(None),
     chromosome: Optional[str] = Query(None),
+    position_start: Optional[int] = Query(
+        None, ge=0, description=FILTER_POSITION_START
+    ),
+    position_end: Optional[int] = Query(
+        None, ge=0, description=FILTER_POSITION_END
+    ),
     start: int = Query(0, ge=0, description="Pagination start index"),
     size: int = Query(20, gt=0, description="Number of records to return"),
+    cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION),
     client: AsyncIOMotorClient = Depends(get_mongo_client),
 ):
     """
     Search associations across all studies by gene_id, rsid, or variant.
+    The cursor for the next page is returned in the X-Next-Cursor header.
     """
     filters = SearchFilters(
         gene_id=gene_id,
@@ -38,46 +73,146 @@ async def search_all_studies_route(
         variant=variant,
         molecular_trait_id=molecular_trait_id,
         chromosome=chromosome,
+        position_start=position_start,
+        position_end=position_end,
     )
     logging.info(
         f"""Filters: gene_id: '{gene_id}' rsid='{rsid}' variant='{variant}'
-        molecular_trait_id='{molecular_trait_id}' chromosome='{chromosome}'"""
+        molecular_trait_id='{molecular_trait_id}' chromosome='{chromosome}'
+        position_start='{position_start}' position_end='{position_end}'"""
     )
-    return await search_all_studies(client, filters, start, size)
-
-
-# @router.get(
-#     "/search_chunked",
-#     response_model=List[AssociationModel],
-#     summary="Chunk-based search across collections",
-# )
-# async def search_all_studies_chunked_route(
-#     gene_id: Optional[str] = Query(None),
-#     rsid: Optional[str] = Query(None),
-#     variant: Optional[str] = Query(None),
-#     molecular_trait_id: Optional[str] = Query(None),
-#     chromosome: Optional[str] = Query(None),
-#     start: int = Query(0, ge=0, description="Pagination start index"),
-#     size: int = Query(20, gt=0, description="Number of records to return"),
-#     client: AsyncIOMotorClient = Depends(get_mongo_client),
-# ):
-#     """
-#     Similar to /associations but uses a chunk-based approach to
-#     avoid unioning every collection up front.
-#     We iterate through each study_{study_id} collection in turn,
-#     skipping documents until we've satisfied 'start', then collecting
-#     up to 'size' documents in total across all collections.
-#     """
-#     filters = SearchFilters(
-#         gene_id=gene_id,
-#         rsid=rsid,
-#         variant=variant,
-#         molecular_trait_id=molecular_trait_id,
-#         chromosome=chromosome,
-#     )
-#     logging.info(
-#         f"""Filters: gene_id='{gene_id}' rsid='{rsid}' variant='{variant}'
-#         molecular_trait_id='{molecular_trait_id}'
-#         chromosome='{chromosome}'"""
-#     )
-#     return await search_chunked(client, filters, start, size)
+    results, next_cursor = await search_all_studies(
+        client, filters, start, size, cursor=cursor
+    )
+    return association_response(
+        results,
+        response,
+        headers={NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None,
+    )
+
+
+@router.get(
+    "/associations/count",
+    response_model=CountModel,
+    summary="Count associations across collections",
+    description=COUNT_DESCRIPTION,
+)
+async def count_all_studies_route(
+    gene_id: Optional[str] = Query(None),
+    rsid: Optional[str] = Query(None),
+    variant: Optional[str] = Query(None),
+    molecular_trait_id: Optional[str] = Query(None),
+    chromosome: Optional[str] = Query(None),
+    position_start: Optional[int] = Query(
+        None, ge=0, description=FILTER_POSITION_START
+    ),
+    position_end: Optional[int] = Query(
+        None, ge=0, description=FILTER_POSITION_END
+    ),
+    client: AsyncIOMotorClient = Depends(get_mongo_client),
+):
+    """
+    Count the associations across all studies matching the filters.
+    """
+    filters = SearchFilters(
+        gene_id=gene_id,
+        rsid=rsid,
+        variant=variant,
+        molecular_trait_id=molecular_trait_id,
+        chromosome=chromosome,
+        position_start=position_start,
+        position_end=position_end,
+    )
+    return await count_all_studies(client, filters)
+
+
+@router.get(
+    "/associations/export",
+    response_class=StreamingResponse,
+    summary="Export associations across collections",
+    description=EXPORT_DESCRIPTION,
+)
+async def export_all_studies_route(
+    gene_id: Optional[str] = Query(None),
+    rsid: Optional[str] = Query(None),
+    variant: Optional[str] = Query(None),
+    molecular_trait_id: Optional[str] = Query(None),
+    chromosome: Optional[str] = Query(None),
+    position_start: Optional[int] = Query(
+        None, ge=0, description=FILTER_POSITION_START
+    ),
+    position_end: Optional[int] = Query(
+        None, ge=0, description=FILTER_POSITION_END
+    ),
+    study_id: Optional[str] = Query(None),
+    dataset_id: Optional[str] = Query(None),
+    export_format: ExportFormat = Query(ExportFormat.ndjson, alias="format"),
+    client: AsyncIOMotorClient = Depends(get_mongo_client),
+):
+    """
+    Stream all associations matching the search filters
+    as newline-delimited JSON or TSV.
+    """
+    filters = SearchFilters(
+        gene_id=gene_id,
+        rsid=rsid,
+        variant=variant,
+        molecular_trait_id=molecular_trait_id,
+        chromosome=chromosome,
+        position_start=position_start,
+        position_end=position_end,
+        study_id=study_id,
+        dataset_id=dataset_id,
+    )
+    logging.info(f"Export {export_format.value}: {filters}")
+    rows = stream_all_studies(client, filters)
+    if export_format == ExportFormat.tsv:
+        body, media_type = _tsv_chunks(rows), "text/tab-separated-values"
+    else:
+        body, media_type = _ndjson_chunks(rows), "application/x-ndjson"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={
+            "Content-Disposition": (
+                f"attachment; filename=associations.{export_format.value}"
+            )
+        },
+    )
+
+
+async def _ndjson_chunks(
+    rows: AsyncIterator[Dict[str, Any]]
+) -> AsyncIterator[bytes]:
+    lines = []
+    async for row in rows:
+        lines.append(orjson.dumps(row))
+        if len(lines) >= EXPORT_CHUNK_ROWS:
+            yield b"\n".join(lines) + b"\n"
+            lines = []
+    if lines:
+        yield b"\n".join(lines) + b"\n"
+
+
+async def _tsv_chunks(
+    rows: AsyncIterator[Dict[str, Any]]
+) -> AsyncIterator[bytes]:
+    yield ("\t".join(ASSOCIATION_FIELDS) + "\n").encode()
+    lines = []
+    async for row in rows:
+        lines.append(
+            "\t".join(_tsv_field(row.get(f)) for f in ASSOCIATION_FIELDS)
+        )
+        if len(lines) >= EXPORT_CHUNK_ROWS:
+            yield ("\n".join(lines) + "\n").encode()
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode()
+
+
+def _tsv_field(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value.translate(TSV_ESCAPES)
+    return str(value)
@@ -0,0 +1,26 @@
+from typing import Any, Dict, List, Optional
+
+from fastapi import Response
+from fastapi.responses import ORJSONResponse
+
+from sumstats.api_v3.core.config import settings
+
+
+def association_response(
+    rows: List[Dict[str, Any]],
+    response: Response,
+    headers: Optional[Dict[str, str]] = None,
+):
+    """
+    Returns association rows from the search repositories.
+
+    With settings.fast_serialization the rows, already projected to the
+    AssociationModel fields, are encoded directly with orjson, skipping
+    pydantic. Otherwise they are returned for validation against the
+    route's response_model.
+    """
+    headers = headers or {}
+    if settings.fast_serialization:
+        return ORJSONResponse(rows, headers=headers)
+    response.headers.update(headers)
+    return rows
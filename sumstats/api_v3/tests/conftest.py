@@ -0,0 +1,98 @@
+import asyncio
+import os
+from typing import Any, Dict, List
+
+import mongomock.aggregate
+import mongomock.filtering
+import pytest
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+from sumstats.api_v3.core.config import settings
+from sumstats.api_v3.db.catalogue import catalogue
+from sumstats.api_v3.db.client import get_mongo_client
+
+
+def _union_with(collection, database, options):
+    return collection + list(
+        database[options["coll"]].aggregate(options.get("pipeline", []))
+    )
+
+
+def _bits_all_set(value, positions):
+    return isinstance(value, bytes) and all(
+        p >> 3 < len(value) and value[p >> 3] & (1 << (p & 7))
+        for p in positions
+    )
+
+
+def association(study_id: str, n: int, **fields) -> Dict[str, Any]:
+    doc = {
+        "molecular_trait_id": f"ENSG{n:011d}",
+        "chromosome": "1",
+        "position": 1000 + n,
+        "ref": "A",
+        "alt": "G",
+        "variant": f"chr1_{1000 + n}_A_G",
+        "pvalue": 0.5,
+        "beta": 0.1,
+        "se": 0.01,
+        "gene_id": "ENSG00000000001",
+        "rsid": f"rs{n}",
+        "study_id": study_id,
+        "dataset_id": f"{study_id}D1",
+    }
+    doc.update(fields)
+    return doc
+
+
+def seed(client, studies: Dict[str, List[Dict[str, Any]]]) -> None:
+    """
+    Writes each study's associations to 'study_{study_id}' and a
+    pipeline_status entry per dataset, then reloads the catalogue.
+    """
+
+    async def write():
+        db = client[settings.db_name]
+        for study_id, docs in studies.items():
+            await db[f"study_{study_id}"].insert_many(docs)
+            for dataset_id in sorted({d["dataset_id"] for d in docs}):
+                await db["pipeline_status"].insert_one(
+                    {
+                        "study_id": study_id,
+                        "dataset_id": dataset_id,
+                        "status": "done",
+                        "date": "2024-01-01",
+                    }
+                )
+
+    asyncio.run(write())
+    catalogue.invalidate()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # mongomock doesn't implement $unionWith, used by offset searches,
+    # nor $bitsAllSet, used by the routing bloom filters
+    monkeypatch.setitem(
+        mongomock.aggregate._PIPELINE_HANDLERS, "$unionWith", _union_with
+    )
+    monkeypatch.setitem(
+        mongomock.filtering._filterer_inst._operator_map,
+        "$bitsAllSet",
+        _bits_all_set,
+    )
+    catalogue.invalidate()
+    yield AsyncMongoMockClient()
+    catalogue.invalidate()
+
+
+@pytest.fixture
+def api(client):
+    # the app logs to logs/, as in the docker image
+    os.makedirs("logs", exist_ok=True)
+    from sumstats.main import app
+
+    app.dependency_overrides[get_mongo_client] = lambda: client
+    yield TestClient(app)
+    app.dependency_overrides.clear()
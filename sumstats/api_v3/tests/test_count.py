@@ -0,0 +1,93 @@
+import asyncio
+import time
+
+import pytest
+from mongomock_motor import AsyncMongoMockCollection
+from pymongo.errors import ExecutionTimeout, OperationFailure
+
+from sumstats.api_v3.core.config import settings
+from sumstats.api_v3.db.repositories.search import count_all_studies
+from sumstats.api_v3.models.schemas import CountModel, SearchFilters
+from sumstats.api_v3.tests.conftest import association, seed
+from sumstats.config import API_BASE
+
+BUDGET_MS = 300
+
+
+@pytest.fixture
+def studies(client):
+    seed(
+        client,
+        {
+            "QTS1": [
+                association("QTS1", n, gene_id=f"G{n % 2}") for n in range(40)
+            ],
+            "QTS2": [association("QTS2", n, gene_id="G0") for n in range(10)],
+        },
+    )
+    return client
+
+
+def count(client, **filters):
+    return asyncio.run(
+        count_all_studies(client, SearchFilters(**filters), BUDGET_MS)
+    )
+
+
+def fail_counts_with(monkeypatch, error):
+    async def count_documents(self, *args, **kwargs):
+        raise error
+
+    monkeypatch.setattr(
+        AsyncMongoMockCollection, "count_documents", count_documents
+    )
+
+
+def hang(monkeypatch, method):
+    async def wait_forever(self, *args, **kwargs):
+        await asyncio.sleep(60)
+
+    monkeypatch.setattr(AsyncMongoMockCollection, method, wait_forever)
+
+
+class TestCount(object):
+    def test_exact_count(self, studies):
+        assert count(studies, gene_id="G0") == CountModel(count=30)
+
+    @pytest.mark.parametrize(
+        "error", [ExecutionTimeout("timed out"), OperationFailure("failed")]
+    )
+    def test_estimates_counts_that_fail(self, studies, monkeypatch, error):
+        # the sample is the whole collection, so the estimate is exact
+        fail_counts_with(monkeypatch, error)
+        assert count(studies, gene_id="G0") == CountModel(
+            count=30, approximate=True
+        )
+
+    def test_count_is_null_when_the_sample_has_no_match(
+        self, studies, monkeypatch
+    ):
+        fail_counts_with(monkeypatch, ExecutionTimeout("timed out"))
+        monkeypatch.setattr(settings, "count_sample_size", 5)
+        assert count(studies, gene_id="G9") == CountModel(
+            count=None, approximate=True
+        )
+
+    def test_estimates_only_use_the_rest_of_the_budget(
+        self, studies, monkeypatch
+    ):
+        hang(monkeypatch, "count_documents")
+        hang(monkeypatch, "estimated_document_count")
+        started = time.monotonic()
+        result = count(studies, gene_id="G0")
+        elapsed_ms = (time.monotonic() - started) * 1000
+        assert result == CountModel(count=None, approximate=True)
+        assert BUDGET_MS <= elapsed_ms < 1.5 * BUDGET_MS
+
+    def test_route_returns_null_count(self, api, studies, monkeypatch):
+        fail_counts_with(monkeypatch, ExecutionTimeout("timed out"))
+        response = api.get(
+            f"{API_BASE}/v3/associations/count", params={"gene_id": "G9"}
+        )
+        assert response.status_code == 200
+        assert response.json() == {"count": None, "approximate": True}
@@ -0,0 +1,71 @@
+import asyncio
+
+import orjson
+import pytest
+
+from sumstats.api_v3.core.config import settings
+from sumstats.api_v3.db.catalogue import catalogue
+from sumstats.api_v3.db.repositories.search import ASSOCIATION_FIELDS
+from sumstats.api_v3.tests.conftest import association, seed
+from sumstats.config import API_BASE
+
+URL = f"{API_BASE}/v3/associations/export"
+
+
+@pytest.fixture
+def studies(client):
+    seed(client, {"QTS1": [association("QTS1", n) for n in range(3)]})
+    return client
+
+
+def add_study(client, study_id, docs):
+    """
+    Loads a study without refreshing the catalogue.
+    """
+
+    async def write():
+        db = client[settings.db_name]
+        await db[f"study_{study_id}"].insert_many(docs)
+        await db["pipeline_status"].insert_one(
+            {"study_id": study_id, "dataset_id": docs[0]["dataset_id"]}
+        )
+
+    asyncio.run(write())
+
+
+def tsv_rows(response):
+    lines = response.text.split("\n")
+    assert lines[-1] == ""
+    return [line.split("\t") for line in lines[:-1]]
+
+
+class TestExport(object):
+    def test_dataset_loaded_since_the_catalogue_refresh(self, api, studies):
+        asyncio.run(catalogue.studies(studies))
+        add_study(studies, "QTS2", [association("QTS2", n) for n in range(4)])
+        response = api.get(URL, params={"dataset_id": "QTS2D1"})
+        assert response.status_code == 200
+        rows = [orjson.loads(line) for line in response.iter_lines()]
+        assert [r["rsid"] for r in rows] == [f"rs{n}" for n in range(4)]
+
+    def test_unknown_dataset_is_empty(self, api, studies):
+        response = api.get(URL, params={"dataset_id": "QTS9D1"})
+        assert response.status_code == 200
+        assert response.text == ""
+
+    def test_tsv_fields_are_escaped(self, api, client):
+        seed(
+            client,
+            {
+                "QTS1": [
+                    association("QTS1", 0, rsid="rs0\tx\ny"),
+                    association("QTS1", 1, rsid="rs1\\n"),
+                ]
+            },
+        )
+        response = api.get(URL, params={"format": "tsv"})
+        header, *rows = tsv_rows(response)
+        assert header == ASSOCIATION_FIELDS
+        assert all(len(row) == len(header) for row in rows)
+        rsid = header.index("rsid")
+        assert [row[rsid] for row in rows] == ["rs0\\tx\\ny", "rs1\\\\n"]
@@ -0,0 +1,102 @@
+import argparse
+import asyncio
+
+import pytest
+
+from sumstats.api_v3.cli import main as cli
+from sumstats.api_v3.core.config import settings
+from sumstats.api_v3.db.routing import (
+    BloomFilter,
+    bloom_size,
+    build_study_routing,
+    list_routing,
+    route_studies,
+)
+from sumstats.api_v3.models.schemas import SearchFilters
+from sumstats.api_v3.tests.conftest import association, seed
+
+
+@pytest.fixture
+def routed(client, monkeypatch):
+    monkeypatch.setattr(settings, "routing_bloom_buckets", 16)
+    # each variant is repeated for 10 molecular traits
+    seed(
+        client,
+        {
+            study_id: [
+                association(study_id, n, molecular_trait_id=f"T{trait}")
+                for n in range(first, first + 50)
+                for trait in range(10)
+            ]
+            for study_id, first in (("QTS1", 0), ("QTS2", 40))
+        },
+    )
+
+    async def build():
+        for study_id in ("QTS1", "QTS2"):
+            await build_study_routing(client, study_id)
+
+    asyncio.run(build())
+    return client
+
+
+def route(client, **filters):
+    return asyncio.run(
+        route_studies(client, SearchFilters(**filters), ["QTS1", "QTS2"])
+    )
+
+
+class TestBloomFilter(object):
+    def test_no_false_negatives_and_bounded_false_positives(self):
+        items, buckets, fp_rate = 20_000, 64, 0.01
+        bloom = BloomFilter(buckets, *bloom_size(items, buckets, fp_rate))
+        added = [f"rs{n}" for n in range(items)]
+        for value in added:
+            bloom.add(value)
+        assert all(value in bloom for value in added)
+        others = [f"rs{n}" for n in range(items, items + 50_000)]
+        false_positives = sum(value in bloom for value in others)
+        assert false_positives / len(others) < 2 * fp_rate
+
+
+class TestStudyRouting(object):
+    def test_blooms_are_sized_from_distinct_values(self, routed):
+        doc = asyncio.run(
+            routed[settings.db_name]["study_routing"].find_one(
+                {"study_id": "QTS1"}
+            )
+        )
+        expected = bloom_size(50, 16, settings.routing_bloom_fp_rate)
+        for field in ("rsid", "variant"):
+            bloom = doc["blooms"][field]
+            assert (bloom["bits_per_bucket"], bloom["hashes"]) == expected
+
+    def test_routes_rsids_and_variants_to_the_studies_holding_them(
+        self, routed
+    ):
+        assert route(routed, rsid="rs0") == ["QTS1"]
+        assert route(routed, rsid="rs45") == ["QTS1", "QTS2"]
+        assert route(routed, rsid="rs89") == ["QTS2"]
+        assert route(routed, variant="chr1_1089_A_G") == ["QTS2"]
+
+    def test_never_drops_a_study_holding_the_rsid(self, routed):
+        for n in range(90):
+            expected = [
+                study_id
+                for study_id, first in (("QTS1", 0), ("QTS2", 40))
+                if first <= n < first + 50
+            ]
+            assert set(expected) <= set(route(routed, rsid=f"rs{n}"))
+
+
+class TestCli(object):
+    def test_builds_routing_with_the_configured_client(
+        self, client, monkeypatch
+    ):
+        seed(client, {"QTS1": [association("QTS1", n) for n in range(5)]})
+        monkeypatch.setattr(cli, "create_mongo_client", lambda: client)
+        args = argparse.Namespace(
+            command="routing", study_id=None, expected_items=None
+        )
+        asyncio.run(cli.run(args))
+        assert list(asyncio.run(list_routing(client))) == ["QTS1"]
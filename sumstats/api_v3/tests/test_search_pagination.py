@@ -0,0 +1,131 @@
+import asyncio
+
+import pytest
+
+from sumstats.api_v3.db.repositories.search import (
+    decode_cursor,
+    encode_cursor,
+    search_all_studies,
+)
+from sumstats.api_v3.models.schemas import SearchFilters
+from sumstats.api_v3.tests.conftest import association, seed
+from sumstats.config import API_BASE, NEXT_CURSOR_HEADER
+
+GENE = SearchFilters(gene_id="ENSG00000000001")
+REGION = SearchFilters(chromosome="1", position_start=1000, position_end=2000)
+
+
+@pytest.fixture
+def studies(client):
+    # positions descend within QTS1, so region pages (by position)
+    # and gene pages (by _id) are ordered differently
+    seed(
+        client,
+        {
+            "QTS1": [
+                association("QTS1", n, position=1100 - n) for n in range(5)
+            ],
+            "QTS2": [association("QTS2", n) for n in range(5, 8)],
+            "QTS3": [association("QTS3", n) for n in range(8, 12)],
+        },
+    )
+    return client
+
+
+def cursor_pages(client, filters, size):
+    pages, cursor = [], None
+    while True:
+        page, cursor = asyncio.run(
+            search_all_studies(client, filters, 0, size, cursor=cursor)
+        )
+        pages.append(page)
+        if cursor is None:
+            return pages
+
+
+def offset_page(client, filters, start, size):
+    page, cursor = asyncio.run(
+        search_all_studies(client, filters, start, size)
+    )
+    return page
+
+
+class TestCursorPagination(object):
+    def test_cursor_round_trip_across_study_boundaries(self, studies):
+        pages = cursor_pages(studies, GENE, size=3)
+        rows = [row for page in pages for row in page]
+        assert [r["rsid"] for r in rows] == [f"rs{n}" for n in range(12)]
+        # the first page ends inside QTS1, the second spans QTS1 and QTS2
+        assert {r["study_id"] for r in pages[1]} == {"QTS1", "QTS2"}
+        assert pages[-1] == []
+
+    @pytest.mark.parametrize("filters", [GENE, REGION])
+    @pytest.mark.parametrize("size", [1, 2, 3, 5])
+    def test_cursor_pages_match_offset_pages(self, studies, filters, size):
+        pages = cursor_pages(studies, filters, size=size)
+        for n, page in enumerate(pages):
+            assert page == offset_page(studies, filters, n * size, size)
+
+    def test_region_pages_are_ordered_by_position(self, studies):
+        rows = [
+            row for page in cursor_pages(studies, REGION, 2) for row in page
+        ]
+        positions = [r["position"] for r in rows if r["study_id"] == "QTS1"]
+        assert positions == sorted(positions)
+
+    def test_cursor_of_other_sort_keys_is_rejected(self, studies):
+        page, cursor = asyncio.run(search_all_studies(studies, GENE, 0, 2))
+        with pytest.raises(ValueError, match="Invalid pagination cursor"):
+            asyncio.run(
+                search_all_studies(studies, REGION, 0, 2, cursor=cursor)
+            )
+
+    def test_decode_cursor_checks_sort_keys(self):
+        cursor = encode_cursor("QTS1", {"position": 10, "_id": 1})
+        assert decode_cursor(cursor, ["position", "_id"]) == (
+            "QTS1",
+            {"position": 10, "_id": 1},
+        )
+        with pytest.raises(ValueError):
+            decode_cursor(cursor, ["_id"])
+
+
+class TestCursorPaginationRoute(object):
+    url = f"{API_BASE}/v3/associations"
+
+    def test_next_cursor_header_resumes_the_search(self, api, studies):
+        first = api.get(self.url, params={"gene_id": GENE.gene_id, "size": 4})
+        assert first.status_code == 200
+        second = api.get(
+            self.url,
+            params={
+                "gene_id": GENE.gene_id,
+                "size": 4,
+                "cursor": first.headers[NEXT_CURSOR_HEADER],
+            },
+        )
+        assert [r["rsid"] for r in first.json() + second.json()] == [
+            f"rs{n}" for n in range(8)
+        ]
+
+    @pytest.mark.parametrize("cursor", ["not-a-cursor", "e30=", "bnVsbA=="])
+    def test_malformed_cursor_returns_400(self, api, studies, cursor):
+        response = api.get(
+            self.url, params={"gene_id": GENE.gene_id, "cursor": cursor}
+        )
+        assert response.status_code == 400
+        assert response.json() == {"message": "Invalid pagination cursor."}
+
+    def test_gene_cursor_with_a_region_returns_400(self, api, studies):
+        first = api.get(self.url, params={"gene_id": GENE.gene_id, "size": 2})
+        response = api.get(
+            self.url,
+            params={
+                "gene_id": GENE.gene_id,
+                "chromosome": "1",
+                "position_start": 1000,
+                "position_end": 2000,
+                "cursor": first.headers[NEXT_CURSOR_HEADER],
+            },
+        )
+        assert response.status_code == 400
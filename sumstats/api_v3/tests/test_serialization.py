@@ -0,0 +1,47 @@
+import pytest
+
+from sumstats.api_v3.core.config import settings
+from sumstats.api_v3.tests.conftest import association, seed
+from sumstats.config import API_BASE
+
+URLS = [
+    f"{API_BASE}/v3/associations",
+    f"{API_BASE}/v3/studies/QTS1/associations",
+    f"{API_BASE}/v3/datasets/QTS1D1/associations",
+]
+
+
+@pytest.fixture
+def studies(client):
+    # values that JSON encoders are known to format differently
+    seed(
+        client,
+        {
+            "QTS1": [
+                association(
+                    "QTS1",
+                    n,
+                    pvalue=[1.2e-30, 0.05, 1.0, 3e-300][n % 4],
+                    beta=[-0.1234567890123, 0.0, 2.5, -1e-7][n % 4],
+                    se=0.1 * (n + 1),
+                )
+                for n in range(40)
+            ]
+        },
+    )
+    return client
+
+
+@pytest.mark.parametrize("url", URLS)
+def test_orjson_and_pydantic_bodies_are_identical(
+    api, studies, monkeypatch, url
+):
+    params = {"gene_id": "ENSG00000000001", "size": 40}
+    monkeypatch.setattr(settings, "fast_serialization", True)
+    fast = api.get(url, params=params)
+    monkeypatch.setattr(settings, "fast_serialization", False)
+    validated = api.get(url, params=params)
+    assert fast.status_code == validated.status_code == 200
+    assert len(fast.json()) == 40
+    assert fast.json() == validated.json()
+    assert fast.content == validated.content
@@ -26,9 +26,26 @@ The following search filters are available for v3 endpoints:
 - `variant`: Filter by variant in format chr_pos_ref_alt
 - `molecular_trait_id`: Filter by molecular trait identifier
 - `chromosome`: Filter by chromosome
+- `position_start`, `position_end`: Filter by a genomic region of up to
+1Mb on `chromosome`
 - `study_id`: Filter by study identifier
 - `dataset_id`: Filter by dataset identifier
 
+### Counting
+`/associations/count` returns the number of matching associations as
+`{"count": ..., "approximate": ...}`. The count is exact unless it
+could not be completed in time, in which case it is an estimate and
+`approximate` is `true`.
+
+### Bulk export
+`/associations/export` streams all matching associations as
+newline-delimited JSON (`format=ndjson`, default) or TSV (`format=tsv`).
+
+### Pagination
+`/associations` returns an `X-Next-Cursor` response header while there
+are more results. Pass its value back as `cursor` to fetch the next page;
+this is much faster than increasing `start` for deep pages.
+
 ## API v2
 
 Each study in the catalogue is split by QTL context and these splits are
@@ -72,7 +89,25 @@ or phenotypes within a single dataset"""
 SEARCH_DESCRIPTION = (
     "Search for eQTL associations across all studies in the database"
 )
-# SEARCH_CHUNKED_DESCRIPTION = "Retrieve large search results"
+EXPORT_DESCRIPTION = """Stream every association matching the filters
+across all studies as newline-delimited JSON (format=ndjson) or TSV
+(format=tsv). Use this instead of paging for gene or region sized
+result sets. Tabs, line breaks and backslashes in TSV fields are escaped as
+`\\t`, `\\n`, `\\r` and `\\\\`."""
+COUNT_DESCRIPTION = """Count the associations matching the filters across
+all studies. Counts that can't be completed within a time budget are
+estimated from a sample in the rest of the budget, in which case `approximate`
+is true. When no estimate is possible either, e.g. because the sample holds no
+match for a selective filter, `count` is null."""
+
+# API v3 keyset pagination
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+HAS_MORE_HEADER = "X-Has-More"
+DATASETS_SEARCHED_HEADER = "X-Datasets-Searched"
+CURSOR_DESCRIPTION = (
+    "Continuation token from the X-Next-Cursor header of the previous "
+    "page. Takes precedence over start."
+)
 
 # API v3 search filter descriptions
 FILTER_GENE_ID = "Ensembl gene identifier (e.g., ENSG00000139618)"
@@ -80,6 +115,13 @@ FILTER_RSID = "RS ID of the variant (e.g., rs1234567)"
 FILTER_VARIANT = "Variant in format chr_pos_ref_alt (e.g., 1_12345_A_G)"
 FILTER_MOLECULAR_TRAIT_ID = "Molecular trait identifier"
 FILTER_CHROMOSOME = "Chromosome (e.g., 1, 2, 3)"
+FILTER_POSITION_START = (
+    "Start of a genomic region on the given chromosome (e.g., 80000)"
+)
+FILTER_POSITION_END = (
+    "End of a genomic region on the given chromosome, "
+    "at most 1Mb from the start (e.g., 90000)"
+)
 FILTER_STUDY_ID = "Study identifier"
 FILTER_DATASET_ID = "Dataset identifier"
 
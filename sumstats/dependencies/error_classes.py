@@ -32,3 +32,35 @@ class RequestedNotFound(APIException):
 
     def to_dict(self):
         return {'message': "Not found. " + self.message, 'error': "Resource Not Found"}
+
+
+class ServiceBusy(APIException):
+    status_code = 503
+
+    def __init__(self, message=None, status_code=None):
+        super().__init__()
+        if message is None:
+            message = "The service is busy. Please retry later."
+        self.message = message
+        if status_code is not None:
+            self.status_code = status_code
+
+    def to_dict(self):
+        return {'message': "Service busy. " + self.message,
+                'error': "Service Unavailable"}
+
+
+class RequestTimedOut(APIException):
+    status_code = 504
+
+    def __init__(self, message=None, status_code=None):
+        super().__init__()
+        if message is None:
+            message = "The request took too long to process."
+        self.message = message
+        if status_code is not None:
+            self.status_code = status_code
+
+    def to_dict(self):
+        return {'message': "Timed out. " + self.message,
+                'error': "Request Timed Out"}
@@ -1,4 +1,6 @@
+import asyncio
 import logging
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
@@ -6,11 +8,22 @@ from fastapi.responses import JSONResponse, ORJSONResponse
 
 import sumstats.api_v1.routers.routes as routes_v1
 import sumstats.api_v2.routers.eqtl as routes_v2
-from sumstats.api_v3.routes import datasets, search, studies
+from sumstats.api_v2.config import HDF5_CROSS_DATASET_PREWARM
+from sumstats.api_v2.services.cross_dataset import cross_dataset_search
+from sumstats.api_v2.services.executor import hdf5_executor
+from sumstats.api_v2.services.handle_pool import handle_pool
+from sumstats.api_v3.core.config import settings
+from sumstats.api_v3.db import client as mongo
+from sumstats.api_v3.db.catalogue import catalogue
+from sumstats.api_v3.db.indexes import ensure_indexes
+from sumstats.api_v3.routes import datasets, metrics, search, studies
 from sumstats.config import (
     API_BASE,
     API_DESCRIPTION,
     APP_VERSION,
+    DATASETS_SEARCHED_HEADER,
+    HAS_MORE_HEADER,
+    NEXT_CURSOR_HEADER,
     TAGS_METADATA,
 )
 from sumstats.dependencies.error_classes import APIException
@@ -21,6 +34,24 @@ logging.config.fileConfig(
 logger = logging.getLogger(__name__)
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    client = mongo.connect()
+    if HDF5_CROSS_DATASET_PREWARM:
+        cross_dataset_search.start()
+    tasks = [asyncio.create_task(catalogue.run_refresher(client))]
+    if settings.ensure_indexes_on_startup:
+        tasks.append(asyncio.create_task(ensure_indexes(client)))
+    yield
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    mongo.close()
+    hdf5_executor.shutdown()
+    cross_dataset_search.shutdown()
+    handle_pool.close_all()
+
+
 app = FastAPI(
     title="eQTL Catalogue Summary Statistics API Documentation",
     openapi_tags=TAGS_METADATA,
@@ -29,6 +60,7 @@ app = FastAPI(
     redoc_url=None,
     openapi_url=f"{API_BASE}/openapi.json",
     version=APP_VERSION,
+    lifespan=lifespan,
 )
 
 
@@ -49,7 +81,15 @@ async def handle_custom_api_exception(request: Request, exc: APIException):
 
 
 # configure CORS
-app.add_middleware(CORSMiddleware, allow_origins=["*"])
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    expose_headers=[
+        NEXT_CURSOR_HEADER,
+        HAS_MORE_HEADER,
+        DATASETS_SEARCHED_HEADER,
+    ],
+)
 
 # v1 API (default)
 app.include_router(
@@ -78,3 +118,4 @@ app.include_router(
 app.include_router(studies.router)
 app.include_router(datasets.router)
 app.include_router(search.router)
+app.include_router(metrics.router)